@@ -1,22 +1,151 @@
 import os
+import re
+import json
+import time
 import uuid
+import itertools
 import logging
-from flask import Flask, request, jsonify, send_file, render_template
+import threading
+import multiprocessing
+from flask import Flask, Response, request, jsonify, send_file, render_template, session, stream_with_context, g
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from utils.pdf_merger import merge_pdfs, is_valid_pdf, PDFMergeError
-from utils.pdf_converter import PDFConverter
+from config import Config
+from utils.pdf_merger import merge_pipeline, merge_batch, parse_page_spec, PDFMergeError, MERGE_ENGINES
+from utils.storage import remove_uploads, StorageManager
+from utils.worker_pool import WorkerPool, PoolFullError, run_initializers
+from utils.zip_stream import stream_zip
+from utils.uploads import SpoolingRequest, UploadLimits
+from utils.result_cache import ResultCache
+from utils.thumbnails import Thumbnails
+from utils.downloads import send_download
+from utils.progress import ProgressBroker, PublishedProgress, attach_queue, set_sink, format_event
+from utils.metrics import MetricsRegistry, SIZE_BUCKETS, RATE_BUCKETS
+from tasks import celery, merge_job, merge_cache_meta, JOB_MARKER
+from utils.pdf_converter import PDFConverter, preload_backends, import_report
 
 # Configure logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=Config.LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+class UploadRequest(SpoolingRequest):
+    """Streams uploads into UPLOAD_FOLDER under the current tier's limits"""
+
+    @property
+    def spool_root(self):
+        return app.config['UPLOAD_FOLDER']
+
+    def upload_limits(self):
+        if self.endpoint == 'create_thumbnails':
+            limit = app.config['THUMBNAIL_MAX_UPLOAD_SIZE']
+            return UploadLimits(max_files=1, max_file_size=limit, max_total_size=limit)
+        tier = current_tier().upper()
+        # A batch uploads the inputs of many merges at once
+        max_files = f'{tier}_BATCH_MAX_FILES' if self.endpoint == 'batch_merge' else f'{tier}_MAX_FILES'
+        return UploadLimits(
+            max_files=app.config[max_files],
+            max_file_size=app.config[f'{tier}_MAX_FILE_SIZE'],
+            max_total_size=app.config[f'{tier}_TOTAL_SIZE_LIMIT']
+        )
+
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max upload
-app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
+app.config.from_object(Config)
+app.request_class = UploadRequest
+
+# Progress of merges and conversions for /progress event streams; pool workers report through
+# a queue, created with the other background services by start_services()
+progress_broker = ProgressBroker(app.config['PROGRESS_RETENTION'])
+progress_queue = None
+
+# Run by every pool worker as it starts; filled in by start_services() before the first job
+worker_initializers = []
+
+# Prometheus metrics of this process, served on /metrics
+metrics = MetricsRegistry()
+request_duration = metrics.histogram(
+    'pdftools_request_duration_seconds', 'Time from receiving a request to returning its response',
+    ['route', 'tier', 'status'])
+stage_duration = metrics.histogram(
+    'pdftools_stage_duration_seconds', 'Time spent in each stage of a merge or conversion',
+    ['route', 'tier', 'stage'])
+merge_page_rate = metrics.histogram(
+    'pdftools_merge_pages_per_second', 'Pages copied per second by the merge stage',
+    ['route', 'tier', 'engine'], buckets=RATE_BUCKETS)
+input_bytes = metrics.histogram(
+    'pdftools_input_bytes', 'Bytes uploaded per request', ['route', 'tier'], buckets=SIZE_BUCKETS)
+output_bytes = metrics.histogram(
+    'pdftools_output_bytes', 'Bytes of each merge or conversion result', ['route', 'tier'], buckets=SIZE_BUCKETS)
+queue_wait = metrics.histogram(
+    'pdftools_queue_wait_seconds', 'Time a job waited for a worker process', ['route', 'tier'])
+
+def metric_labels():
+    """Route and tier labels of the current request"""
+    return {'route': request.url_rule.rule if request.url_rule else 'unmatched', 'tier': current_tier()}
+
+def observe_stages(timings):
+    """Record stage timings in milliseconds, as reported by StageTimer.as_dict()"""
+    labels = metric_labels()
+    for stage, ms in timings.items():
+        stage_duration.observe(ms / 1000, stage=stage, **labels)
+
+# Shared pool for merges and conversions, sized from config
+worker_pool = WorkerPool(app.config['MAX_CONCURRENT_MERGES'], app.config['MAX_QUEUED_MERGES'],
+                         initializer=run_initializers, initargs=(worker_initializers,),
+                         on_wait=lambda seconds: queue_wait.observe(seconds, **metric_labels()))
+
+# Merge and conversion results, keyed by input content
+result_cache = ResultCache(app.config['RESULT_CACHE_FOLDER'], app.config['RESULT_CACHE_MAX_BYTES'])
+
+# Page previews render on their own pool, so they never hold up merges and conversions
+thumbnails = Thumbnails(
+    WorkerPool(app.config['THUMBNAIL_WORKERS'], app.config['THUMBNAIL_MAX_QUEUED']),
+    ResultCache(app.config['THUMBNAIL_CACHE_FOLDER'], app.config['THUMBNAIL_CACHE_MAX_BYTES']),
+    dpi=app.config['THUMBNAIL_DPI'],
+    max_pages=app.config['THUMBNAIL_PAGES'],
+    max_size=app.config['THUMBNAIL_MAX_SIZE']
+)
+
+def converted_folder(kind):
+    """Output folder of a conversion kind ('word', 'jpg', 'excel' or 'ppt')"""
+    return os.path.join(app.config['CONVERTED_FOLDER'], kind)
+
+# Uploads and converted files expire in the background; cached results are managed by the cache
+storage = StorageManager(
+    [app.config['UPLOAD_FOLDER']] + [converted_folder(kind) for kind in ('word', 'jpg', 'excel', 'ppt')],
+    ttl=app.config['STORAGE_TTL'],
+    max_bytes=app.config['STORAGE_MAX_BYTES'],
+    min_age=app.config['STORAGE_MIN_AGE']
+)
+
+_services_lock = threading.Lock()
+_services_started = False
+
+def start_services():
+    """
+    Start the background services of the web process, once
+
+    Spawned pool workers import this module again (as __mp_main__ under
+    `python app.py`), so importing it must not start threads, create queues
+    or import converter libraries; all of that happens here, on the first
+    request.
+    """
+    global progress_queue, _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        set_sink(progress_broker.publish)
+        progress_queue = multiprocessing.get_context('spawn').Queue(app.config['PROGRESS_QUEUE_SIZE'])
+        progress_broker.listen(progress_queue)
+        worker_initializers.append((attach_queue, (progress_queue,)))
+        # Converter libraries are imported on first use unless preloaded; JPG renders here, the rest in the pool
+        if app.config['CONVERTER_PRELOAD']:
+            preload_backends(app.config['CONVERTER_PRELOAD'])
+            worker_initializers.append((preload_backends, (app.config['CONVERTER_PRELOAD'],)))
+        storage.start(app.config['STORAGE_SWEEP_INTERVAL'])
+        _services_started = True
 
 # Ensure upload directory exists
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -26,6 +155,99 @@ def allowed_file(filename):
     """Check if the file has an allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def current_tier():
+    """Return the pricing tier of the current user: 'free' or 'premium'"""
+    return 'premium' if session.get('is_premium') else 'free'
+
+def merge_optimization(pdf_format, tier):
+    """Output optimization settings for a merge, or None to keep the merged PDF as written"""
+    if pdf_format == 'original':
+        return None
+    if pdf_format == 'compressed':
+        quality = app.config[f'{tier.upper()}_COMPRESSION_QUALITY']
+        images = app.config['COMPRESSION_IMAGE_TARGETS'].get(quality) or {}
+        return dict(save_options=app.config['PDF_COMPRESSED_OPTIONS'], **images)
+    return {'save_options': app.config['PDF_QUALITY_OPTIONS'][tier]}
+
+def collect(items, into):
+    """Yield items from an iterable while appending them to a list"""
+    for item in items:
+        into.append(item)
+        yield item
+
+def download_response(file_path, filename):
+    """Send a result file with Range, ETag and (if configured) front-end server offloading"""
+    return send_download(
+        file_path, filename,
+        offload=app.config['DOWNLOAD_OFFLOAD'],
+        accel_locations=app.config['DOWNLOAD_ACCEL_LOCATIONS'],
+        max_age=app.config['DOWNLOAD_MAX_AGE']
+    )
+
+UUID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+def progress_id():
+    """Id that progress of this request is published under: the client's 'progress_id' field or the upload id"""
+    client_id = request.form.get('progress_id', '')
+    return client_id if UUID_PATTERN.fullmatch(client_id) else request.upload_id
+
+def progress_reporter(operation_id):
+    """Throttled progress callback publishing under operation_id, for work run in the pool or here"""
+    return PublishedProgress(operation_id, app.config['PROGRESS_INTERVAL'])
+
+def end_progress(operation_id, error=None):
+    """Publish the final event of an operation, which closes its event streams"""
+    progress_broker.publish(operation_id, {'stage': 'failed', 'error': error} if error else {'stage': 'done'})
+
+def event_stream_response(events):
+    """Wrap encoded Server-Sent Events in a streamed response"""
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # nginx would otherwise buffer the stream and deliver events in bursts
+        'X-Accel-Buffering': 'no'
+    })
+
+def busy_response(error):
+    """Build the 503 response for a request turned away by the worker pool"""
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.before_request
+def start_request_timer():
+    """Note when the request started; registered first, so upload time is included"""
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def ensure_services():
+    """Start the background services before the first request is handled"""
+    if not _services_started:
+        start_services()
+
+@app.before_request
+def ingest_uploads():
+    """Stream multipart uploads to disk before the view runs, so limit errors become 413 responses"""
+    if request.mimetype == 'multipart/form-data':
+        request.files
+
+@app.after_request
+def record_request_metrics(response):
+    """Record request latency and, for uploads, upload time and size"""
+    started = g.get('request_started')
+    if started is not None:
+        labels = metric_labels()
+        request_duration.observe(time.perf_counter() - started, status=response.status_code, **labels)
+        if request.spools:
+            stage_duration.observe(request.upload_ms / 1000, stage='upload', **labels)
+            input_bytes.observe(request.uploaded_bytes, **labels)
+    return response
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(error):
+    """Report an upload rejected for its size or file count"""
+    return jsonify({'error': error.description}), 413
+
 @app.route('/')
 def index():
     """Render the main page."""
@@ -40,6 +262,7 @@ def merge():
         # Check if any files were uploaded
         if 'files[]' not in request.files:
             logger.warning("No files in request")
+            request.discard_uploads()
             return jsonify({'error': 'No files uploaded'}), 400
             
         files = request.files.getlist('files[]')
@@ -47,99 +270,513 @@ def merge():
         # Check if any valid files were provided
         if not files or len(files) == 0:
             logger.warning("Empty files list")
+            request.discard_uploads()
             return jsonify({'error': 'No files uploaded'}), 400
             
         # Validate file count
         if len(files) < 2:
             logger.warning("Only one file uploaded")
+            request.discard_uploads()
             return jsonify({'error': 'Please upload at least 2 PDF files to merge'}), 400
             
-        # Create a unique directory for this merge operation
-        merge_id = str(uuid.uuid4())
-        merge_dir = os.path.join(app.config['UPLOAD_FOLDER'], merge_id)
+        # Optional page selection, e.g. "1:1-3 2 3:10@90" (file numbers follow upload order)
+        page_spec = request.form.get('pages', '').strip()
+        try:
+            page_entries = parse_page_spec(page_spec) if page_spec else None
+        except PDFMergeError as e:
+            request.discard_uploads()
+            return jsonify({'error': str(e)}), 400
+            
+        # Uploads were streamed into this request's directory, which becomes the merge directory
+        merge_id = request.upload_id
+        operation_id = progress_id()
+        merge_dir = request.upload_dir
         os.makedirs(merge_dir, exist_ok=True)
         
-        # Check and save valid PDF files
+        # Keep uploads that look like PDFs; content is validated once, by the merge pipeline
         saved_files = []
+        input_hashes = []
+        original_names = {}
+        saved_indexes = {}  # Upload position -> position in saved_files
         invalid_files = []
         
-        for file in files:
-            if file and allowed_file(file.filename):
-                # Check if it's a valid PDF
-                if is_valid_pdf(file):
-                    # Save the file
-                    safe_filename = secure_filename(file.filename)
-                    file_path = os.path.join(merge_dir, safe_filename)
-                    file.save(file_path)
-                    saved_files.append(file_path)
-                    logger.debug(f"Saved valid PDF: {safe_filename}")
-                else:
-                    invalid_files.append(file.filename)
-                    logger.warning(f"Invalid PDF content: {file.filename}")
+        for upload_index, file in enumerate(files):
+            spool = file.stream
+            if file and allowed_file(file.filename) and spool.is_valid:
+                spool.close()
+                input_hashes.append(spool.sha256)
+                saved_indexes[upload_index] = len(saved_files)
+                saved_files.append(spool.path)
+                original_names[spool.path] = file.filename
+                logger.debug(f"Received upload: {os.path.basename(spool.path)} ({spool.size} bytes)")
             else:
                 # Not a PDF file
+                spool.discard()
                 if file and file.filename:
                     invalid_files.append(file.filename)
                     logger.warning(f"Invalid file type: {file.filename}")
         
-        # Check if we have valid PDFs to merge
-        if len(saved_files) < 2:
-            # Clean up saved files
-            for f in saved_files:
-                try:
-                    os.remove(f)
-                except Exception as e:
-                    logger.warning(f"Error removing file {f}: {str(e)}")
-                    
-            # Remove the merge directory if it's empty
-            try:
-                os.rmdir(merge_dir)
-            except Exception as e:
-                logger.warning(f"Error removing directory {merge_dir}: {str(e)}")
-                
-            return jsonify({
-                'error': 'Not enough valid PDF files to merge',
-                'invalid_files': invalid_files
-            }), 400
+        upload_ms = request.upload_ms
         
         # Merge the PDFs
         output_filename = "merged.pdf"
         output_path = os.path.join(merge_dir, output_filename)
+        pdf_format = request.form.get('pdf_format', 'standard')
+        engine = request.form.get('engine')
+        if not engine:
+            streaming_min = app.config['STREAMING_MERGE_MIN_BYTES']
+            # Huge merges are written as they are copied, so memory depends on the largest input only
+            engine = 'stream' if streaming_min and request.uploaded_bytes >= streaming_min else app.config['PDF_MERGE_ENGINE']
+        if engine not in MERGE_ENGINES:
+            remove_uploads(saved_files, merge_dir)
+            return jsonify({'error': f'Unknown merge engine: {engine}'}), 400
+        if pdf_format not in app.config['PDF_FORMATS']:
+            remove_uploads(saved_files, merge_dir)
+            return jsonify({'error': f'Unknown PDF format: {pdf_format}'}), 400
+        optimization = merge_optimization(pdf_format, current_tier())
+        pages = None
+        if page_entries is not None:
+            if any(entry[0] >= len(files) for entry in page_entries):
+                remove_uploads(saved_files, merge_dir)
+                return jsonify({'error': f'Page selection refers to a file beyond the {len(files)} uploaded'}), 400
+            # Selections of rejected (non-PDF) uploads are dropped, like the uploads themselves
+            pages = [(saved_indexes[file_index], ranges, rotation)
+                     for file_index, ranges, rotation in page_entries if file_index in saved_indexes]
         
-        try:
-            logger.debug(f"Merging {len(saved_files)} PDFs")
-            output_path, total_pages = merge_pdfs(saved_files, output_path)
-            
-            # Validate the merged file
-            with open(output_path, 'rb') as f:
-                if not is_valid_pdf(f):
-                    raise PDFMergeError("Generated PDF is invalid")
-            
-            # Return the result with download link
-            download_url = f"/download/{merge_id}/{output_filename}"
-            logger.info(f"Merge successful: {total_pages} pages, download URL: {download_url}")
+        # Identical inputs with identical options give an identical result
+        cache_key = ResultCache.make_key('merge', input_hashes, {
+            'engine': engine,
+            'optimization': optimization,
+            'pages': pages
+        })
+        cached = result_cache.get(cache_key)
+        if cached:
+            paths, meta = cached
+            invalid_files.extend(original_names[saved_files[i]] for i in meta['invalid_indexes'])
+            remove_uploads(saved_files, merge_dir)
+            end_progress(operation_id)
+            logger.info(f"Merge served from cache: {cache_key}")
             
             return jsonify({
                 'success': True,
-                'message': f'Successfully merged {len(saved_files)} PDFs into {total_pages} pages',
-                'download_url': download_url,
-                'merge_id': merge_id,
-                'total_pages': total_pages
+                'message': f"Successfully merged {meta['merged_files']} PDFs into {meta['total_pages']} pages",
+                'download_url': f"/download/cache/{cache_key}/{os.path.basename(paths[0])}",
+                'merge_id': cache_key,
+                'total_pages': meta['total_pages'],
+                'size_before': meta['size_before'],
+                'size_after': meta['size_after'],
+                'bytes_deduplicated': meta['bytes_deduplicated'],
+                'invalid_files': invalid_files,
+                'cached': True
             })
+        
+        if request.form.get('mode') == 'job' or app.config['MERGE_JOB_MODE']:
+            if len(saved_files) < 2:
+                remove_uploads(saved_files, merge_dir)
+                return jsonify({
+                    'error': 'Not enough valid PDF files to merge',
+                    'invalid_files': invalid_files
+                }), 400
             
+            # Queue the merge; the merge id doubles as the job id
+            open(os.path.join(merge_dir, JOB_MARKER), 'w').close()
+            merge_job.apply_async(
+                args=[merge_dir, saved_files, original_names, output_filename, pdf_format, cache_key, engine,
+                      optimization, pages],
+                task_id=merge_id
+            )
+            logger.info(f"Queued merge job {merge_id} for {len(saved_files)} PDFs")
+            
+            return jsonify({
+                'success': True,
+                'job_id': merge_id,
+                'status_url': f"/jobs/{merge_id}",
+                'invalid_files': invalid_files
+            }), 202
+        
+        try:
+            logger.debug(f"Merging {len(saved_files)} PDFs")
+            result = worker_pool.run(merge_pipeline, saved_files, output_path, pdf_format, engine=engine,
+                                     optimization=optimization, pages=pages,
+                                     progress_callback=progress_reporter(operation_id),
+                                     timeout=app.config['MERGE_OPERATION_TIMEOUT'])
+        except PoolFullError as e:
+            remove_uploads(saved_files, merge_dir)
+            end_progress(operation_id, str(e))
+            return busy_response(e)
         except PDFMergeError as e:
+            end_progress(operation_id, str(e))
+            invalid_files.extend(original_names[f] for f in e.invalid_files)
             logger.error(f"PDF merge error: {str(e)}")
+            
+            if len(saved_files) - len(e.invalid_files) < 2:
+                # Not enough valid PDFs: clean up saved files
+                remove_uploads(saved_files, merge_dir)
+                return jsonify({
+                    'error': 'Not enough valid PDF files to merge',
+                    'invalid_files': invalid_files
+                }), 400
+                
             return jsonify({
                 'error': f'Error merging PDFs: {str(e)}',
                 'invalid_files': invalid_files
             }), 400
         except Exception as e:
             logger.error(f"Unexpected error during merge: {str(e)}", exc_info=True)
+            end_progress(operation_id, str(e))
             return jsonify({'error': f'Server error: {str(e)}'}), 500
+        
+        invalid_files.extend(original_names[f] for f in result['invalid_files'])
+        remove_uploads(result['invalid_files'])
+        result_cache.put(cache_key, [output_path], merge_cache_meta(saved_files, result))
+        end_progress(operation_id)
+        timings = dict(upload=upload_ms, **result['timings'])
+        total_pages = result['total_pages']
+        observe_stages(result['timings'])
+        output_bytes.observe(result['size_after'], **metric_labels())
+        if result['timings'].get('merge'):
+            merge_page_rate.observe(total_pages / (result['timings']['merge'] / 1000), engine=result['engine'],
+                                    **metric_labels())
+        
+        # Return the result with download link
+        download_url = f"/download/{merge_id}/{output_filename}"
+        logger.info(f"Merge successful: {total_pages} pages, {result['bytes_deduplicated']} duplicate bytes, "
+                    f"{result['size_before']} -> {result['size_after']} bytes, download URL: {download_url}, timings (ms): {timings}")
+        
+        return jsonify({
+            'success': True,
+            'message': f"Successfully merged {result['merged_files']} PDFs into {total_pages} pages",
+            'download_url': download_url,
+            'merge_id': merge_id,
+            'total_pages': total_pages,
+            'size_before': result['size_before'],
+            'size_after': result['size_after'],
+            'bytes_deduplicated': result['bytes_deduplicated'],
+            'invalid_files': invalid_files,
+            'timings': timings
+        })
     except Exception as e:
         logger.error(f"Server error in merge route: {str(e)}", exc_info=True)
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+def batch_groups(manifest, uploads):
+    """
+    Resolve a /merge/batch manifest into merge_batch() groups
+
+    Args:
+        manifest (str): JSON such as {"groups": [{"name": "acme.pdf", "files": ["cover.pdf", 2],
+            "pages": "1 2:1-3"}]}; files are upload file names or 1-based upload positions,
+            pages an optional page selection whose file numbers refer to the group's files
+        uploads (list): (filename, path) of every upload in order; path is None for rejected uploads
+
+    Returns:
+        list: Groups with 'name', 'files' (paths, None for rejected uploads) and 'pages'
+
+    Raises:
+        ValueError: If the manifest is malformed or refers to files that were not uploaded
+    """
+    try:
+        groups = json.loads(manifest)['groups']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('The manifest must be JSON with a list of "groups"')
+    if not isinstance(groups, list) or not groups:
+        raise ValueError('The manifest has no groups')
+
+    by_name = {}
+    for filename, path in uploads:
+        # A name uploaded twice is ambiguous; such files must be referred to by position
+        by_name[filename] = path if filename not in by_name else ValueError(f"{filename} was uploaded more than once")
+
+    resolved = []
+    names = set()
+    for number, group in enumerate(groups, start=1):
+        if not isinstance(group, dict) or not isinstance(group.get('files'), list) or not group['files']:
+            raise ValueError(f'Group {number} needs a list of "files"')
+
+        name = secure_filename(str(group.get('name') or '')) or f"merged_{number}"
+        if not name.lower().endswith('.pdf'):
+            name += '.pdf'
+        if name in names:
+            raise ValueError(f"More than one group is named {name}")
+        names.add(name)
+
+        paths = []
+        for ref in group['files']:
+            if isinstance(ref, int) and not isinstance(ref, bool) and 1 <= ref <= len(uploads):
+                path = uploads[ref - 1][1]
+            elif isinstance(ref, str) and ref in by_name:
+                path = by_name[ref]
+                if isinstance(path, ValueError):
+                    raise path
+            else:
+                raise ValueError(f"Group {number} refers to {ref!r}, which was not uploaded")
+            paths.append(path)
+
+        pages = group.get('pages')
+        if pages:
+            try:
+                pages = parse_page_spec(str(pages))
+            except PDFMergeError as e:
+                raise ValueError(f"Group {number}: {str(e)}")
+        resolved.append({'name': name, 'files': paths, 'pages': pages or None})
+    return resolved
+
+@app.route('/merge/batch', methods=['POST'])
+def batch_merge():
+    """Run many independent merges in one request; files shared by several merges are uploaded and parsed once."""
+    try:
+        files = request.files.getlist('files[]')
+        if not files:
+            request.discard_uploads()
+            return jsonify({'error': 'No files uploaded'}), 400
+        
+        # Keep uploads that look like PDFs; rejected ones fail the groups that use them
+        uploads = []
+        invalid_files = []
+        for file in files:
+            spool = file.stream
+            if file and allowed_file(file.filename) and spool.is_valid:
+                spool.close()
+                uploads.append((file.filename, spool.path))
+            else:
+                spool.discard()
+                uploads.append((file.filename, None))
+                if file.filename:
+                    invalid_files.append(file.filename)
+                    logger.warning(f"Invalid file type: {file.filename}")
+        saved_files = [path for _, path in uploads if path is not None]
+        
+        pdf_format = request.form.get('pdf_format', 'standard')
+        engine = request.form.get('engine') or app.config['PDF_MERGE_ENGINE']
+        output = request.form.get('output', 'zip')
+        try:
+            groups = batch_groups(request.form.get('manifest', ''), uploads)
+            if len(groups) > app.config['MERGE_BATCH_MAX_GROUPS']:
+                raise ValueError(f"A batch can have at most {app.config['MERGE_BATCH_MAX_GROUPS']} groups")
+            if engine not in MERGE_ENGINES:
+                raise ValueError(f'Unknown merge engine: {engine}')
+            if pdf_format not in app.config['PDF_FORMATS']:
+                raise ValueError(f'Unknown PDF format: {pdf_format}')
+            if output not in ('zip', 'urls'):
+                raise ValueError(f'Unknown output: {output}')
+        except ValueError as e:
+            remove_uploads(saved_files, request.upload_dir)
+            return jsonify({'error': str(e), 'invalid_files': invalid_files}), 400
+        
+        # Outputs get a directory of their own, so group names cannot clash with upload names
+        batch_id = str(uuid.uuid4())
+        batch_dir = os.path.join(app.config['UPLOAD_FOLDER'], batch_id)
+        os.makedirs(batch_dir, exist_ok=True)
+        operation_id = progress_id()
+        runnable = [group for group in groups if None not in group['files']]
+        
+        try:
+            result = worker_pool.run(merge_batch, runnable, batch_dir, engine=engine,
+                                     optimization=merge_optimization(pdf_format, current_tier()),
+                                     threads=app.config['MERGE_BATCH_THREADS'],
+                                     progress_callback=progress_reporter(operation_id),
+                                     timeout=app.config['MERGE_OPERATION_TIMEOUT'])
+        except PoolFullError as e:
+            remove_uploads(saved_files, request.upload_dir)
+            remove_uploads([], batch_dir)
+            end_progress(operation_id, str(e))
+            return busy_response(e)
+        except Exception as e:
+            end_progress(operation_id, str(e))
+            raise
+        end_progress(operation_id)
+        remove_uploads(saved_files, request.upload_dir)
+        
+        names = {path: filename for filename, path in uploads if path is not None}
+        invalid_files.extend(names[path] for path in result['invalid_files'])
+        merged = {group['name']: group for group in result['groups']}
+        results = []
+        for group in groups:
+            outcome = merged.get(group['name'])
+            if outcome is None:
+                outcome = {'name': group['name'], 'output_path': None, 'total_pages': 0, 'size_before': 0,
+                           'size_after': 0, 'bytes_deduplicated': 0, 'error': 'Invalid file type'}
+            results.append(outcome)
+        
+        observe_stages(result['timings'])
+        for outcome in results:
+            if outcome['output_path']:
+                output_bytes.observe(outcome['size_after'], **metric_labels())
+        succeeded = [outcome for outcome in results if outcome['output_path']]
+        logger.info(f"Batch {batch_id}: {len(succeeded)} of {len(results)} merges succeeded, "
+                    f"{len(set(saved_files))} inputs, timings (ms): {result['timings']}")
+        
+        summary = [{
+            'name': outcome['name'],
+            'download_url': f"/download/{batch_id}/{outcome['name']}" if outcome['output_path'] else None,
+            'total_pages': outcome['total_pages'],
+            'size_before': outcome['size_before'],
+            'size_after': outcome['size_after'],
+            'bytes_deduplicated': outcome['bytes_deduplicated'],
+            'error': outcome['error']
+        } for outcome in results]
+        
+        if not succeeded:
+            remove_uploads([], batch_dir)
+            return jsonify({'error': 'No merge in the batch succeeded', 'groups': summary,
+                            'invalid_files': invalid_files}), 400
+        
+        if output == 'urls':
+            return jsonify({
+                'success': True,
+                'batch_id': batch_id,
+                'groups': summary,
+                'invalid_files': invalid_files,
+                'timings': result['timings']
+            })
+        
+        # One archive with every merged PDF, plus errors.json listing the groups that failed
+        entries = [(outcome['output_path'], outcome['name']) for outcome in succeeded]
+        failed = [group for group in summary if group['error']]
+        if failed:
+            errors_path = os.path.join(batch_dir, 'errors.json')
+            with open(errors_path, 'w', encoding='utf-8') as f:
+                json.dump({'groups': failed, 'invalid_files': invalid_files}, f, indent=2)
+            entries.append((errors_path, 'errors.json'))
+        return Response(stream_zip(entries), mimetype='application/zip', headers={
+            'Content-Disposition': 'attachment; filename=merged_batch.zip'
+        })
+    except Exception as e:
+        logger.error(f"Server error in batch merge route: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+def cache_job_result(cache):
+    """
+    Store the output of a finished merge job in the result cache, once
+
+    Workers leave caching to the app, so every entry is accounted for by
+    this process's ResultCache and its size limit holds. The output is
+    skipped if it is cached already or not on this machine.
+
+    Args:
+        cache (dict): 'key', 'path' and 'meta' reported by the job, or None
+    """
+    if not cache or os.path.isdir(result_cache.entry_path(cache['key'])):
+        return
+    try:
+        result_cache.put(cache['key'], [cache['path']], cache['meta'])
+    except OSError as e:
+        logger.warning(f"Could not cache merge job output {cache['path']}: {str(e)}")
+
+def job_snapshot(job_id):
+    """Status, progress and (once finished) result of a queued merge job, as reported by /jobs"""
+    job = celery.AsyncResult(job_id)
+    snapshot = {'job_id': job_id, 'status': 'queued', 'progress': None}
+    
+    if job.state in ('STARTED', 'PROGRESS'):
+        snapshot['status'] = 'running'
+        if isinstance(job.info, dict):
+            snapshot['progress'] = {
+                'pages_merged': job.info.get('pages_merged', 0),
+                'total_pages': job.info.get('total_pages', 0),
+                'stage': job.info.get('stage'),
+                'file': job.info.get('file'),
+                'files': job.info.get('files'),
+                'bytes_written': job.info.get('bytes_written')
+            }
+    elif job.state == 'SUCCESS':
+        result = dict(job.result)
+        cache_job_result(result.pop('cache', None))
+        snapshot.update(result)
+        snapshot['status'] = 'finished' if result.get('success') else 'failed'
+        if result.get('success'):
+            snapshot['progress'] = {
+                'pages_merged': result['total_pages'],
+                'total_pages': result['total_pages']
+            }
+    elif job.state == 'FAILURE':
+        logger.error(f"Merge job {job_id} failed: {job.result}")
+        snapshot.update({'status': 'failed', 'error': f'Server error: {job.result}'})
+        
+    return snapshot
+
+def find_job(job_id):
+    """Error response for a job id that is malformed or unknown, or None"""
+    # Validate job_id to prevent directory traversal
+    if '..' in job_id or '/' in job_id or '\\' in job_id:
+        return jsonify({'error': 'Invalid job ID'}), 400
+        
+    # Every job's merge directory is marked when it is queued, so unknown ids (including
+    # uploads of in-request merges and conversions) can be told apart from pending jobs
+    if not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], job_id, JOB_MARKER)):
+        return jsonify({'error': 'Job not found'}), 404
+    return None
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status and progress of a queued merge job."""
+    try:
+        error = find_job(job_id)
+        if error:
+            return error
+        return jsonify(job_snapshot(job_id))
+    except Exception as e:
+        logger.error(f"Error in job status route: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream the status of a queued merge job as Server-Sent Events until it ends."""
+    try:
+        error = find_job(job_id)
+        if error:
+            return error
+    except Exception as e:
+        logger.error(f"Error in job events route: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+        
+    interval = app.config['JOB_PROGRESS_INTERVAL']
+    keepalive = app.config['PROGRESS_KEEPALIVE']
+    started = time.monotonic()
+    deadline = started + app.config['MERGE_OPERATION_TIMEOUT']
+    queue_deadline = started + app.config['JOB_QUEUE_TIMEOUT']
+    
+    def generate():
+        # The worker may run on another host, so its progress is read back from the result backend
+        last_snapshot = None
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            snapshot = job_snapshot(job_id)
+            if snapshot != last_snapshot:
+                yield format_event(snapshot, 'status')
+                last_snapshot = snapshot
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= keepalive:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            if snapshot['status'] in ('finished', 'failed'):
+                return
+            if snapshot['status'] == 'queued' and time.monotonic() >= queue_deadline:
+                # No worker is consuming the queue; don't hold the connection for the whole operation timeout
+                logger.warning(f"Merge job {job_id} was not picked up within {app.config['JOB_QUEUE_TIMEOUT']}s")
+                yield format_event({'job_id': job_id, 'error': 'No merge worker has picked up the job yet'}, 'timeout')
+                return
+            time.sleep(interval)
+        yield format_event({'job_id': job_id, 'error': 'Timed out waiting for the job to finish'}, 'timeout')
+            
+    return event_stream_response(generate())
+
+@app.route('/progress/<operation_id>')
+def progress_events(operation_id):
+    """Stream progress of a merge or conversion as Server-Sent Events until it ends."""
+    # Operations are identified by the random progress_id (or upload id) of their request
+    if not UUID_PATTERN.fullmatch(operation_id):
+        return jsonify({'error': 'Invalid progress ID'}), 400
+        
+    return event_stream_response(progress_broker.stream(
+        operation_id, timeout=app.config['MERGE_OPERATION_TIMEOUT'], keepalive=app.config['PROGRESS_KEEPALIVE']
+    ))
+
+@app.route('/status/pool')
+def pool_status():
+    """Report worker pool queue depth and wait times."""
+    return jsonify(worker_pool.stats())
+
 @app.route('/download/<merge_id>/<filename>')
 def download(merge_id, filename):
     """Download a merged PDF file."""
@@ -161,30 +798,175 @@ def download(merge_id, filename):
             
         # Return the file
         logger.info(f"Serving download: {file_path}")
-        return send_file(file_path, as_attachment=True, download_name=filename)
+        return download_response(file_path, filename)
     except Exception as e:
         logger.error(f"Error in download route: {str(e)}", exc_info=True)
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@app.route('/download/cache/<key>/<filename>')
+def download_cached(key, filename):
+    """Download a result from the result cache."""
+    try:
+        # Cache keys are hex digests; anything else cannot be a cache entry
+        if not re.fullmatch(r'[0-9a-f]{64}', key):
+            return jsonify({'error': 'Invalid cache key'}), 400
+            
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': 'Invalid filename'}), 400
+            
+        file_path = os.path.join(result_cache.entry_path(key), filename)
+        if not os.path.exists(file_path):
+            logger.warning(f"Download requested for non-existent cached file: {file_path}")
+            return jsonify({'error': 'File not found'}), 404
+            
+        logger.info(f"Serving cached download: {file_path}")
+        return download_response(file_path, filename)
+    except Exception as e:
+        logger.error(f"Error in cached download route: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+def thumbnail_response(file_hash, status):
+    """JSON response for the status of a document's previews, see Thumbnails.status()"""
+    body = dict(status, hash=file_hash, status_url=f"/thumbnails/{file_hash}")
+    if 'files' in body:
+        body['thumbnails'] = [f"/thumbnails/{file_hash}/{name}" for name in body.pop('files')]
+    return jsonify(body), {'ready': 200, 'pending': 202, 'failed': 422, 'missing': 404}[status['status']]
+
+@app.route('/thumbnails', methods=['POST'])
+def create_thumbnails():
+    """Start rendering page previews of an uploaded PDF, or report the cached ones."""
+    try:
+        file = request.files.get('file')
+        if file is None or not allowed_file(file.filename) or not file.stream.is_valid:
+            request.discard_uploads()
+            return jsonify({'error': 'Please upload a PDF file'}), 400
+            
+        spool = file.stream
+        spool.close()
+        try:
+            # Rendering happens in the background; the upload is removed once it is done
+            status = thumbnails.submit(spool.sha256, spool.path, request.upload_dir)
+        except PoolFullError as e:
+            return busy_response(e)
+        return thumbnail_response(spool.sha256, status)
+    except Exception as e:
+        request.discard_uploads()
+        logger.error(f"Error in thumbnails route: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/thumbnails/<file_hash>')
+def thumbnail_status(file_hash):
+    """Report whether the previews of a document (by SHA-256) are ready, pending, failed or unknown."""
+    if not re.fullmatch(r'[0-9a-f]{64}', file_hash):
+        return jsonify({'error': 'Invalid file hash'}), 400
+    return thumbnail_response(file_hash, thumbnails.status(file_hash))
+
+@app.route('/thumbnails/<file_hash>/<filename>')
+def thumbnail_image(file_hash, filename):
+    """Serve a page preview."""
+    if not re.fullmatch(r'[0-9a-f]{64}', file_hash):
+        return jsonify({'error': 'Invalid file hash'}), 400
+    if not re.fullmatch(r'page-\d+\.png', filename):
+        return jsonify({'error': 'Invalid filename'}), 400
+        
+    file_path = thumbnails.path(file_hash, filename)
+    if not os.path.exists(file_path):
+        return jsonify({'error': 'File not found'}), 404
+        
+    response = send_file(file_path, mimetype='image/png', max_age=app.config['THUMBNAIL_MAX_AGE'])
+    # The URL names the document's content, so browsers can keep the preview for good
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/status/storage')
+def storage_status():
+    """Report bytes stored and what retention has expired or evicted."""
+    return jsonify(storage.stats())
+
+@app.route('/status/imports')
+def imports_status():
+    """Report which converter libraries this process has imported and how long each took."""
+    return jsonify({
+        'preload': app.config['CONVERTER_PRELOAD'],
+        'modules': import_report()
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose request, stage, throughput and queue metrics in the Prometheus text format"""
+    return Response(metrics.render(), content_type=MetricsRegistry.content_type)
+
+@app.route('/status/cache')
+def cache_status():
+    """Report result cache hits, misses and size."""
+    return jsonify(result_cache.stats())
+
+def run_cached_conversion(operation, converter, file_path, file_hash, max_processes=1, **options):
+    """
+    Run a single-output conversion in the worker pool, or reuse the cached
+    output of an identical earlier conversion; progress is published under
+    the request's progress id
+
+    Converters that can use several processes get ``max_processes`` > 1. The
+    processes beyond the first are taken from idle pool workers, so the total
+    stays within MAX_CONCURRENT_MERGES, and the converter is passed the count
+    it got as ``processes``.
+
+    Returns:
+        str: Path to the converted file
+    """
+    operation_id = progress_id()
+    cache_key = ResultCache.make_key(operation, [file_hash], options)
+    cached = result_cache.get(cache_key)
+    if cached:
+        logger.info(f"Conversion served from cache: {operation} {cache_key}")
+        end_progress(operation_id)
+        return cached[0][0]
+        
+    started = time.perf_counter()
+    helpers = worker_pool.reserve_idle(max_processes - 1)
+    run_options = dict(options, processes=len(helpers) + 1) if max_processes > 1 else options
+    try:
+        output_path = worker_pool.run(converter, file_path, converted_folder(operation.split(':')[1]),
+                                      progress_callback=progress_reporter(operation_id),
+                                      timeout=app.config['MERGE_OPERATION_TIMEOUT'], **run_options)
+    except Exception as e:
+        end_progress(operation_id, str(e))
+        raise
+    finally:
+        for helper in helpers:
+            helper.release()
+    end_progress(operation_id)
+    observe_stages({'convert': (time.perf_counter() - started) * 1000})
+    output_bytes.observe(os.path.getsize(output_path), **metric_labels())
+    return result_cache.put(cache_key, [output_path])[0]
+
 @app.route('/convert/word', methods=['POST'])
 def convert_to_word():
     """Convert PDF to Word document"""
     try:
         if 'file' not in request.files:
+            request.discard_uploads()
             return jsonify({'error': 'No file uploaded'}), 400
 
         file = request.files['file']
-        if file and allowed_file(file.filename):
-            # Save the file
-            safe_filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-            file.save(file_path)
+        if file and allowed_file(file.filename) and file.stream.is_valid:
+            # The upload was streamed to disk and hashed while the request was parsed
+            file.stream.close()
+            file_path = file.stream.path
+            file_hash = file.stream.sha256
 
             # Convert to Word
-            output_path = PDFConverter.pdf_to_word(file_path)
+            output_path = run_cached_conversion('convert:word', PDFConverter.pdf_to_word, file_path, file_hash,
+                                                max_processes=app.config['WORD_CONVERSION_PROCESSES'])
             return send_file(output_path, as_attachment=True)
         else:
+            request.discard_uploads()
             return jsonify({'error': 'Invalid file type'}), 400
+    except PoolFullError as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error converting to Word: {str(e)}", exc_info=True)
         return jsonify({'error': f'Conversion error: {str(e)}'}), 500
@@ -194,31 +976,76 @@ def convert_to_jpg():
     """Convert PDF to JPG images"""
     try:
         if 'file' not in request.files:
+            request.discard_uploads()
             return jsonify({'error': 'No file uploaded'}), 400
 
         file = request.files['file']
-        if file and allowed_file(file.filename):
-            # Save the file
-            safe_filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-            file.save(file_path)
-
-            # Convert to JPG
-            image_paths = PDFConverter.pdf_to_jpg(file_path)
-            if len(image_paths) == 1:
-                return send_file(image_paths[0], as_attachment=True)
-            else:
-                # Zip multiple images
-                import zipfile
-                from io import BytesIO
-                memory_file = BytesIO()
-                with zipfile.ZipFile(memory_file, 'w') as zf:
-                    for image_path in image_paths:
-                        zf.write(image_path, os.path.basename(image_path))
-                memory_file.seek(0)
-                return send_file(memory_file, as_attachment=True, download_name='converted_images.zip')
+        if file and allowed_file(file.filename) and file.stream.is_valid:
+            # The upload was streamed to disk and hashed while the request was parsed
+            file.stream.close()
+            file_path = file.stream.path
+            file_hash = file.stream.sha256
+
+            options = app.config['JPG_CONVERSION_OPTIONS'][current_tier()]
+            operation_id = progress_id()
+            cache_key = ResultCache.make_key('convert:jpg', [file_hash], options)
+            cached = result_cache.get(cache_key)
+            if cached:
+                logger.info(f"Conversion served from cache: convert:jpg {cache_key}")
+                end_progress(operation_id)
+                image_paths = cached[0]
+                if len(image_paths) == 1:
+                    return send_file(image_paths[0], as_attachment=True)
+                return Response(stream_zip(image_paths), mimetype='application/zip', headers={
+                    'Content-Disposition': 'attachment; filename=converted_images.zip'
+                })
+            
+            # Convert to JPG; rendering runs in this request so pages can be streamed as they are ready
+            slot = worker_pool.reserve()
+            try:
+                pages = PDFConverter.iter_pdf_to_jpg(file_path, converted_folder('jpg'),
+                                                     progress_callback=progress_reporter(operation_id), **options)
+                first_page = next(pages)
+                second_page = next(pages, None)
+            except Exception as e:
+                slot.release()
+                end_progress(operation_id, str(e))
+                raise
+                
+            if second_page is None:
+                slot.release()
+                result_cache.put(cache_key, [first_page])
+                end_progress(operation_id)
+                return send_file(first_page, as_attachment=True)
+                
+            def generate():
+                image_paths = [first_page, second_page]
+                try:
+                    yield from stream_zip(itertools.chain(image_paths[:], collect(pages, image_paths)))
+                except GeneratorExit:
+                    # The client disconnected; closing pages cancels the renders not started yet
+                    logger.info(f"JPG conversion {operation_id} abandoned after {len(image_paths)} pages")
+                    end_progress(operation_id, 'Download cancelled')
+                    raise
+                except Exception as e:
+                    end_progress(operation_id, str(e))
+                    raise
+                finally:
+                    pages.close()
+                    slot.release()
+                # Only reached when every page was rendered and sent
+                result_cache.put(cache_key, image_paths)
+                end_progress(operation_id)
+                    
+            # Zip multiple images as a chunked stream while the remaining pages render
+            return Response(stream_with_context(generate()), mimetype='application/zip', headers={
+                'Content-Disposition': 'attachment; filename=converted_images.zip'
+            })
         else:
+            request.discard_uploads()
             return jsonify({'error': 'Invalid file type'}), 400
+    except PoolFullError as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error converting to JPG: {str(e)}", exc_info=True)
         return jsonify({'error': f'Conversion error: {str(e)}'}), 500
@@ -228,20 +1055,29 @@ def convert_to_excel():
     """Convert PDF to Excel spreadsheet"""
     try:
         if 'file' not in request.files:
+            request.discard_uploads()
             return jsonify({'error': 'No file uploaded'}), 400
 
         file = request.files['file']
-        if file and allowed_file(file.filename):
-            # Save the file
-            safe_filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-            file.save(file_path)
-
-            # Convert to Excel
-            output_path = PDFConverter.pdf_to_excel(file_path)
+        if file and allowed_file(file.filename) and file.stream.is_valid:
+            # The upload was streamed to disk and hashed while the request was parsed
+            file.stream.close()
+            file_path = file.stream.path
+            file_hash = file.stream.sha256
+
+            # Convert to Excel, or to a ZIP of CSV files for very large results
+            output_format = request.form.get('format', 'xlsx')
+            if output_format not in app.config['TABLE_OUTPUT_FORMATS']:
+                request.discard_uploads()
+                return jsonify({'error': f'Unknown table format: {output_format}'}), 400
+            output_path = run_cached_conversion('convert:excel', PDFConverter.pdf_to_excel, file_path, file_hash,
+                                                output_format=output_format)
             return send_file(output_path, as_attachment=True)
         else:
+            request.discard_uploads()
             return jsonify({'error': 'Invalid file type'}), 400
+    except PoolFullError as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error converting to Excel: {str(e)}", exc_info=True)
         return jsonify({'error': f'Conversion error: {str(e)}'}), 500
@@ -251,20 +1087,29 @@ def convert_to_ppt():
     """Convert PDF to PowerPoint presentation"""
     try:
         if 'file' not in request.files:
+            request.discard_uploads()
             return jsonify({'error': 'No file uploaded'}), 400
 
         file = request.files['file']
-        if file and allowed_file(file.filename):
-            # Save the file
-            safe_filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-            file.save(file_path)
-
-            # Convert to PowerPoint
-            output_path = PDFConverter.pdf_to_ppt(file_path)
+        if file and allowed_file(file.filename) and file.stream.is_valid:
+            # The upload was streamed to disk and hashed while the request was parsed
+            file.stream.close()
+            file_path = file.stream.path
+            file_hash = file.stream.sha256
+
+            # Convert to PowerPoint; 'native' keeps each page at its own size for a smaller file
+            page_size = request.form.get('page_size', 'fit')
+            if page_size not in app.config['PPT_PAGE_SIZES']:
+                request.discard_uploads()
+                return jsonify({'error': f'Unknown page size: {page_size}'}), 400
+            output_path = run_cached_conversion('convert:ppt', PDFConverter.pdf_to_ppt, file_path, file_hash,
+                                                page_size=page_size)
             return send_file(output_path, as_attachment=True)
         else:
+            request.discard_uploads()
             return jsonify({'error': 'Invalid file type'}), 400
+    except PoolFullError as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error converting to PowerPoint: {str(e)}", exc_info=True)
         return jsonify({'error': f'Conversion error: {str(e)}'}), 500
@@ -0,0 +1,404 @@
+"""
+Merge and conversion benchmarks on synthetic documents
+
+    python benchmark.py                             # every case on generated corpora
+    python benchmark.py --scale 0.1 --repeat 1      # a quick run
+    python benchmark.py --cases 'merge:*' --output results.json
+    python benchmark.py --compare baseline.json     # exit with 1 on regressions
+    python benchmark.py file1.pdf file2.pdf ...     # merge your own files with each engine
+
+Each case runs in a fresh process, so its peak RSS is its own, and so is the
+peak RSS of the processes it starts (pdftoppm, the Java table extractor).
+"""
+import os
+import sys
+import json
+import time
+import random
+import fnmatch
+import platform
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+# Synthetic corpora: file count and pages per file at scale 1
+CORPORA = {
+    'small': {'kind': 'text', 'files': 100, 'pages': 2},    # many small files
+    'large': {'kind': 'text', 'files': 3, 'pages': 400},    # a few huge files
+    'images': {'kind': 'images', 'files': 5, 'pages': 8},   # two incompressible images per page
+    'fonts': {'kind': 'fonts', 'files': 10, 'pages': 10},   # embedded TrueType subsets and the base 14 fonts
+}
+
+# Conversions run on the first file of each corpus
+CONVERSIONS = ('word', 'jpg', 'excel', 'ppt')
+
+# Relative increase of a metric over the baseline that counts as a regression
+DEFAULT_THRESHOLD = 0.15
+
+# Metrics compared against a baseline; wall times this close are noise
+COMPARED_METRICS = ('seconds', 'peak_rss_mb', 'peak_children_rss_mb', 'output_bytes')
+MIN_SECONDS_DELTA = 0.01
+
+# Distributions whose versions are recorded with the results
+VERSIONED_PACKAGES = ('PyPDF2', 'PyMuPDF', 'pdf2docx', 'pdf2image', 'tabula-py', 'python-pptx', 'reportlab')
+
+
+def _draw_table(c, top, rows=6, cols=4):
+    """Draw a ruled table, so tabula finds something to extract"""
+    left, width, height = 72, 110, 18
+    for row in range(rows + 1):
+        c.line(left, top - row * height, left + cols * width, top - row * height)
+    for col in range(cols + 1):
+        c.line(left + col * width, top, left + col * width, top - rows * height)
+    for row in range(rows):
+        for col in range(cols):
+            text = f"Column {col + 1}" if row == 0 else f"R{row}C{col + 1}"
+            c.drawString(left + col * width + 4, top - (row + 1) * height + 5, text)
+
+
+def _register_fonts():
+    """Register reportlab's bundled Vera TrueType fonts, embedded as subsets when used"""
+    import reportlab
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    font_dir = os.path.join(os.path.dirname(reportlab.__file__), 'fonts')
+    names = []
+    for name in ('Vera', 'VeraBd', 'VeraIt', 'VeraBI'):
+        pdfmetrics.registerFont(TTFont(name, os.path.join(font_dir, f"{name}.ttf")))
+        names.append(name)
+    return names + ['Helvetica', 'Times-Roman', 'Courier', 'Helvetica-Bold', 'Times-Italic', 'Courier-Oblique']
+
+
+def generate_pdf(path, kind, pages, seed):
+    """
+    Write one synthetic PDF
+
+    Args:
+        path (str): Output path
+        kind (str): 'text' (text, graphics and a ruled table), 'images' or 'fonts'
+        pages (int): Page count
+        seed (int): Seed for generated content, so corpora are reproducible
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+
+    rng = random.Random(seed)
+    # Invariant mode fixes dates and document ids, so the same seed gives the same bytes
+    c = canvas.Canvas(path, pagesize=letter, invariant=1)
+    fonts = _register_fonts() if kind == 'fonts' else None
+
+    for page in range(pages):
+        c.setFont('Helvetica', 12)
+        c.drawString(72, 740, f"Benchmark document {seed}, page {page + 1} of {pages}")
+
+        if kind == 'text':
+            for line in range(12):
+                words = ' '.join(f"word{rng.randrange(1000)}" for _ in range(8))
+                c.drawString(72, 710 - line * 16, words)
+            c.rect(66, 500, 480, 230, stroke=1, fill=0)
+            _draw_table(c, 460)
+        elif kind == 'images':
+            from PIL import Image
+            from reportlab.lib.utils import ImageReader
+            for slot in range(2):
+                image = Image.frombytes('RGB', (300, 300), rng.randbytes(300 * 300 * 3))
+                c.drawImage(ImageReader(image), 72 + slot * 240, 380, width=220, height=220)
+        else:
+            for line in range(36):
+                c.setFont(fonts[line % len(fonts)], 8 + line % 9)
+                c.drawString(72, 710 - line * 18, ''.join(chr(rng.randrange(33, 127)) for _ in range(50)))
+
+        c.showPage()
+    c.save()
+
+
+def generate_corpora(root, scale=1.0, names=None):
+    """
+    Generate the synthetic corpora under root
+
+    Args:
+        root (str): Directory to write to
+        scale (float, optional): Multiplies file counts and page counts (at least 2 files of 1 page)
+        names (iterable, optional): Corpora to generate, all by default
+
+    Returns:
+        dict: Corpus name -> list of PDF paths
+    """
+    corpora = {}
+    for corpus_index, name in enumerate(names or CORPORA):
+        spec = CORPORA[name]
+        # Merges need two files
+        files = max(2, round(spec['files'] * scale))
+        pages = max(1, round(spec['pages'] * scale))
+        corpus_dir = os.path.join(root, name)
+        os.makedirs(corpus_dir, exist_ok=True)
+        paths = []
+        for i in range(files):
+            path = os.path.join(corpus_dir, f"{name}_{i + 1}.pdf")
+            generate_pdf(path, spec['kind'], pages, seed=corpus_index * 1000 + i)
+            paths.append(path)
+        corpora[name] = paths
+    return corpora
+
+
+def _peak_rss_mb(children=False):
+    """
+    Peak resident set size in MB, or None where it cannot be read
+
+    Args:
+        children (bool, optional): Report the largest peak of the finished child
+            processes of this process instead of its own; 0 if it started none
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _output_bytes(output):
+    paths = output if isinstance(output, list) else [output]
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def _run_operation(operation, engine, files, work_dir):
+    """Run one merge or conversion; returns the bytes it wrote"""
+    if operation == 'merge':
+        from utils.pdf_merger import merge_pdfs, get_engine
+        output_path = os.path.join(work_dir, 'merged.pdf')
+        merge_pdfs(files, output_path, engine=get_engine(engine))
+        return _output_bytes(output_path)
+
+    from utils.pdf_converter import PDFConverter
+    converter = {
+        'word': PDFConverter.pdf_to_word,
+        'jpg': PDFConverter.pdf_to_jpg,
+        'excel': PDFConverter.pdf_to_excel,
+        'ppt': PDFConverter.pdf_to_ppt
+    }[operation]
+    return _output_bytes(converter(files[0], work_dir))
+
+
+def run_case(case, repeat):
+    """
+    Run a case ``repeat`` times in this process; called in a fresh process per case
+
+    Returns:
+        dict: The case with its measurements added, see run_cases()
+    """
+    result = dict(case, status='ok', error=None, runs=repeat, seconds=None, mean_seconds=None,
+                  pages_per_sec=None, output_bytes=None, peak_rss_mb=None, peak_children_rss_mb=None)
+
+    if case['operation'] == 'merge':
+        from utils.pdf_merger import get_engine
+        if get_engine(case['engine']).name != case['engine']:
+            return dict(result, status='unavailable', error=f"{case['engine']} cannot be imported")
+
+    times = []
+    try:
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory(prefix='benchmark-') as work_dir:
+                started = time.perf_counter()
+                output_bytes = _run_operation(case['operation'], case['engine'], case['paths'], work_dir)
+                times.append(time.perf_counter() - started)
+    except Exception as e:
+        return dict(result, status='failed', error=str(e), peak_rss_mb=_peak_rss_mb(),
+                    peak_children_rss_mb=_peak_rss_mb(children=True))
+
+    best = min(times)
+    return dict(result, seconds=round(best, 4), mean_seconds=round(sum(times) / len(times), 4),
+                pages_per_sec=round(case['pages'] / best, 1) if best else None,
+                output_bytes=output_bytes, peak_rss_mb=_peak_rss_mb(),
+                peak_children_rss_mb=_peak_rss_mb(children=True))
+
+
+def _page_count(path):
+    from PyPDF2 import PdfReader
+    with open(path, 'rb') as f:
+        return len(PdfReader(f).pages)
+
+
+def build_cases(corpora, patterns=('*',)):
+    """
+    Cases for every corpus: a merge per engine and each conversion of its first file
+
+    Args:
+        corpora (dict): Corpus name -> list of PDF paths
+        patterns (iterable, optional): fnmatch patterns on case names such as
+            'merge:large:pymupdf' or 'convert:word:fonts'
+
+    Returns:
+        list: Case dicts (case, operation, corpus, engine, paths, files, pages, input_bytes)
+    """
+    from utils.pdf_merger import MERGE_ENGINES
+
+    cases = []
+    for corpus, paths in corpora.items():
+        page_counts = [_page_count(path) for path in paths]
+        merge = {'corpus': corpus, 'paths': paths, 'files': len(paths), 'pages': sum(page_counts),
+                 'input_bytes': sum(os.path.getsize(path) for path in paths)}
+        for engine in MERGE_ENGINES:
+            cases.append(dict(merge, case=f"merge:{corpus}:{engine}", operation='merge', engine=engine))
+        for operation in CONVERSIONS:
+            cases.append({'case': f"convert:{operation}:{corpus}", 'operation': operation, 'engine': None,
+                          'corpus': corpus, 'paths': paths[:1], 'files': 1, 'pages': page_counts[0],
+                          'input_bytes': os.path.getsize(paths[0])})
+    return [case for case in cases if any(fnmatch.fnmatch(case['case'], pattern) for pattern in patterns)]
+
+
+def run_cases(cases, repeat=3):
+    """
+    Run every case in a process of its own
+
+    Returns:
+        list: Result dicts, one per case, with status ('ok', 'failed' or
+        'unavailable'), best and mean wall time in seconds, pages/sec,
+        output bytes, and peak RSS in MB of the case's process and of the
+        largest process it started
+    """
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_case, case, repeat).result()
+        result.pop('paths')
+        print(_format_result(result), flush=True)
+        results.append(result)
+    return results
+
+
+def _versions():
+    from importlib import metadata
+    versions = {}
+    for package in VERSIONED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def environment(scale, repeat):
+    """Where and how results were measured, saved with them"""
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': scale,
+        'repeat': repeat,
+        'versions': _versions()
+    }
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Find cases that got worse than a baseline
+
+    A case regresses if it worked in the baseline and now does not, or if
+    its wall time, peak RSS (its own or its child processes') or output size
+    grew by more than ``threshold``
+    (wall time differences under MIN_SECONDS_DELTA are ignored as noise).
+
+    Args:
+        results (list): Result dicts of this run
+        baseline (list): Result dicts of the baseline run
+        threshold (float, optional): Allowed relative increase, e.g. 0.15 for 15%
+
+    Returns:
+        list: Regression dicts (case, metric, baseline, current, change)
+    """
+    previous = {result['case']: result for result in baseline if result['status'] == 'ok'}
+    regressions = []
+    for result in results:
+        before = previous.get(result['case'])
+        if before is None:
+            continue
+        if result['status'] != 'ok':
+            regressions.append({'case': result['case'], 'metric': 'status', 'baseline': 'ok',
+                                'current': result['status'], 'change': None})
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None or new <= old * (1 + threshold):
+                continue
+            if metric == 'seconds' and new - old < MIN_SECONDS_DELTA:
+                continue
+            regressions.append({'case': result['case'], 'metric': metric, 'baseline': old, 'current': new,
+                                'change': round(new / old - 1, 4)})
+    return regressions
+
+
+def _format_result(result):
+    if result['status'] != 'ok':
+        return f"{result['case']:<28} {result['status']}: {result['error']}"
+    rss, children_rss = (f"{result[metric]:.1f} MB" if result.get(metric) is not None else 'n/a'
+                         for metric in ('peak_rss_mb', 'peak_children_rss_mb'))
+    return (f"{result['case']:<28} {result['pages']:>6} pages {result['seconds']:>9.3f}s "
+            f"{result['pages_per_sec']:>10.1f} pages/sec  peak RSS {rss:>9} (children {children_rss:>9})  "
+            f"output {result['output_bytes']} bytes")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark merges and conversions")
+    parser.add_argument('files', nargs='*', help="PDFs to use instead of the synthetic corpora")
+    parser.add_argument('--cases', action='append',
+                        help="fnmatch pattern of cases to run, e.g. 'merge:*' (repeatable); "
+                             "all cases for synthetic corpora, merges for your own files")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply corpus file and page counts")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case; the best time is reported")
+    parser.add_argument('--corpus-dir', help="Keep the generated corpora here instead of a temporary directory")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--results', help="Compare results saved with --output instead of running")
+    parser.add_argument('--compare', help="Baseline results (JSON from --output) to check for regressions")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative increase that counts as a regression")
+    args = parser.parse_args(argv)
+
+    if args.files and len(args.files) < 2:
+        parser.error("give at least 2 PDFs to merge")
+
+    if args.results:
+        with open(args.results, encoding='utf-8') as f:
+            report = json.load(f)
+    else:
+        patterns = args.cases or (['merge:*'] if args.files else ['*'])
+        with tempfile.TemporaryDirectory(prefix='benchmark-corpora-') as temp_dir:
+            if args.files:
+                corpora = {'custom': args.files}
+            else:
+                corpus_dir = args.corpus_dir or temp_dir
+                print(f"Generating corpora at scale {args.scale} in {corpus_dir}", flush=True)
+                corpora = generate_corpora(corpus_dir, args.scale)
+            cases = build_cases(corpora, patterns)
+            print(f"Running {len(cases)} cases, best of {args.repeat} runs each", flush=True)
+            report = {'environment': environment(args.scale, args.repeat), 'results': run_cases(cases, args.repeat)}
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(report['results'], baseline['results'], args.threshold)
+        for regression in regressions:
+            if regression['metric'] == 'status':
+                print(f"REGRESSION {regression['case']}: {regression['current']} (was ok)")
+            else:
+                print(f"REGRESSION {regression['case']}: {regression['metric']} {regression['baseline']} -> "
+                      f"{regression['current']} (+{regression['change']:.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,7 +6,7 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     ALLOWED_EXTENSIONS = {'pdf'}
-    MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max
+    MAX_CONTENT_LENGTH = 510 * 1024 * 1024  # Hard cap per request; tier limits below are enforced while uploads stream
     PERMANENT_SESSION_LIFETIME = timedelta(days=1)
     
     # Free tier limits
@@ -36,12 +36,67 @@ class Config:
         }
     }
     
+    # Output formats accepted by /merge as pdf_format:
+    #   standard   - the tier's PDF_QUALITY_OPTIONS
+    #   compressed - full optimization plus image downsampling to the tier's compression quality
+    #   original   - the merged PDF as written, no optimization pass
+    PDF_FORMATS = {'standard', 'compressed', 'original'}
+
+    # Output formats accepted by /convert/excel as format: an xlsx workbook, or a ZIP of CSV files
+    TABLE_OUTPUT_FORMATS = {'xlsx', 'csv'}
+
+    # Slide layouts accepted by /convert/ppt as page_size: pages scaled onto 10x7.5in slides,
+    # or slides sized like the PDF's pages with pages rendered at screen resolution
+    PPT_PAGE_SIZES = {'fit', 'native'}
+    PDF_COMPRESSED_OPTIONS = {
+        'garbage': 4,  # Drop unused objects and merge duplicate objects and streams
+        'deflate': True,
+        'clean': True
+    }
+    
+    # Image downsampling for each compression quality (None keeps images untouched)
+    COMPRESSION_IMAGE_TARGETS = {
+        '/screen': {'image_dpi': 72, 'image_quality': 60},
+        '/ebook': {'image_dpi': 150, 'image_quality': 75},
+        '/printer': {'image_dpi': 300, 'image_quality': 85},
+        '/prepress': None
+    }
+    
+    # PDF to JPG rendering options
+    JPG_CONVERSION_OPTIONS = {
+        'free': {
+            'dpi': 150,
+            'quality': 75,
+            'thread_count': 2  # Pages rendered in parallel
+        },
+        'premium': {
+            'dpi': 300,
+            'quality': 90,
+            'thread_count': 4
+        }
+    }
+    
     # Enable CORS headers for AJAX requests
     CORS_HEADERS = 'Content-Type'
 
     # Celery Configuration
-    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
-    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+    # Use CELERY_BROKER_URL=filesystem:// (with CELERY_RESULT_BACKEND=file://...) to run
+    # jobs without Redis, or CELERY_TASK_ALWAYS_EAGER=1 to run them in-process
+    JOBS_FOLDER = os.environ.get('JOBS_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs'))
+    CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', '0') == '1'
+    # Eager jobs run in the app process, so by default they need no broker and keep results in memory
+    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL',
+                                       'memory://' if CELERY_TASK_ALWAYS_EAGER else 'redis://localhost:6379/0')
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND',
+                                           'cache+memory://' if CELERY_TASK_ALWAYS_EAGER else 'redis://localhost:6379/0')
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        'data_folder_in': os.path.join(JOBS_FOLDER, 'queue'),
+        'data_folder_out': os.path.join(JOBS_FOLDER, 'queue'),
+        'processed_folder': os.path.join(JOBS_FOLDER, 'processed'),
+        'control_folder': os.path.join(JOBS_FOLDER, 'control'),
+        'store_processed': False
+    } if CELERY_BROKER_URL.startswith('filesystem://') else {}
+    CELERY_TASK_STORE_EAGER_RESULT = True
     CELERY_TASK_TRACK_STARTED = True
     CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
     CELERY_ACCEPT_CONTENT = ['json']
@@ -51,16 +106,77 @@ class Config:
     # Connection and timeout settings
     REQUEST_TIMEOUT = 30  # 30 seconds
     MERGE_OPERATION_TIMEOUT = 300  # 5 minutes
+    MERGE_JOB_MODE = os.environ.get('MERGE_JOB_MODE', '0') == '1'  # Queue every merge as a job
+    JOB_PROGRESS_INTERVAL = 0.5  # Seconds between job progress updates
+    JOB_QUEUE_TIMEOUT = 60  # Seconds /jobs/<id>/events waits for a worker to pick up a queued job
+    PROGRESS_INTERVAL = 0.25  # Seconds between progress events of merges and conversions run here
+    PROGRESS_RETENTION = 5 * 60  # Seconds the last progress event of an operation is kept for late subscribers
+    PROGRESS_QUEUE_SIZE = 10000  # Events buffered between worker processes and the web process
+    PROGRESS_KEEPALIVE = 15  # Seconds between keepalive comments on idle event streams
+    PDF_MERGE_ENGINE = os.environ.get('PDF_MERGE_ENGINE', 'pypdf2')  # 'pypdf2', 'pymupdf' or 'stream'
+    # Merges uploading this much in total use the streaming engine unless they ask for one (0 disables)
+    STREAMING_MERGE_MIN_BYTES = int(os.environ.get('STREAMING_MERGE_MIN_BYTES', 256 * 1024 * 1024))
+    # Conversion kinds ('word', 'jpg', 'excel', 'ppt') whose libraries are imported at startup
+    # instead of on first use, e.g. CONVERTER_PRELOAD=word,excel on workers that mostly convert
+    CONVERTER_PRELOAD = [kind.strip() for kind in os.environ.get('CONVERTER_PRELOAD', '').split(',') if kind.strip()]
     MAX_RETRIES = 3
 
+    # Cache of merge and conversion results, keyed by input content
+    RESULT_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+    RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+
+    # Page previews for the upload list (/thumbnails), cached by content and rendered on their own pool
+    THUMBNAIL_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thumbnails')
+    THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256MB
+    THUMBNAIL_WORKERS = 2  # Processes rendering previews, apart from the merge and conversion pool
+    THUMBNAIL_MAX_QUEUED = 50
+    THUMBNAIL_DPI = 36
+    THUMBNAIL_MAX_SIZE = 400  # Longest side of a preview in pixels
+    THUMBNAIL_PAGES = 1  # Pages previewed per document, from the first
+    THUMBNAIL_MAX_AGE = 365 * 24 * 3600  # Previews are addressed by content, so they never change
+    THUMBNAIL_MAX_UPLOAD_SIZE = 20 * 1024 * 1024  # Larger files get no preview; the page neither hashes nor uploads them
+    
+    # Retention of upload directories and converted files; links expire with the session
+    CONVERTED_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'converted')
+    STORAGE_TTL = int(PERMANENT_SESSION_LIFETIME.total_seconds())
+    STORAGE_MAX_BYTES = 10 * 1024 * 1024 * 1024  # 10GB across uploads and converted files
+    STORAGE_MIN_AGE = 15 * 60  # Entries younger than this are never evicted for quota
+    STORAGE_SWEEP_INTERVAL = 5 * 60  # Seconds between background sweeps
+
+    # Downloads: set DOWNLOAD_OFFLOAD to 'x-accel' (nginx) or 'x-sendfile' (Apache, lighttpd)
+    # to let the front-end server send files; X-Accel-Redirect maps these folders to internal locations
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD') or None
+    DOWNLOAD_ACCEL_LOCATIONS = {
+        UPLOAD_FOLDER: '/internal/uploads/',
+        RESULT_CACHE_FOLDER: '/internal/cache/'
+    }
+    DOWNLOAD_MAX_AGE = 3600  # Seconds a browser may reuse a download before revalidating its ETag
+    
     # Server resource limits
-    MAX_CONCURRENT_MERGES = 10
+    MAX_CONCURRENT_MERGES = 10  # Worker processes for merges and conversions
+    MAX_QUEUED_MERGES = 20  # Jobs allowed to wait for a worker before new ones get a 503
+    # Most processes parsing the pages of one long document for /convert/word (1 converts serially);
+    # those beyond the first are taken from idle workers, so they count against MAX_CONCURRENT_MERGES
+    WORD_CONVERSION_PROCESSES = int(os.environ.get('WORD_CONVERSION_PROCESSES', min(4, os.cpu_count() or 1)))
+    
+    # Batch merges (/merge/batch): many merges over one upload, inputs shared between merges
+    FREE_BATCH_MAX_FILES = FREE_MAX_FILES
+    PREMIUM_BATCH_MAX_FILES = 500
+    MERGE_BATCH_MAX_GROUPS = 1000
+    MERGE_BATCH_THREADS = 4  # Merges of a batch run at once, sharing the parsed inputs
     RATE_LIMIT_PER_USER = '10 per minute'
     
     # Error handling settings
     RETRY_DELAYS = [1, 3, 5]  # Seconds between retries
     ERROR_LOG_MAX_SIZE = 10 * 1024 * 1024  # 10MB
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()  # DEBUG adds per-upload and per-selection logging
 
     # Create upload folder if it doesn't exist
     if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
\ No newline at end of file
+        os.makedirs(UPLOAD_FOLDER)
+
+    # Create filesystem broker folders if that broker is in use
+    if CELERY_BROKER_TRANSPORT_OPTIONS:
+        os.makedirs(CELERY_BROKER_TRANSPORT_OPTIONS['data_folder_in'], exist_ok=True)
+        os.makedirs(CELERY_BROKER_TRANSPORT_OPTIONS['processed_folder'], exist_ok=True)
+        os.makedirs(CELERY_BROKER_TRANSPORT_OPTIONS['control_folder'], exist_ok=True)
\ No newline at end of file
@@ -168,6 +168,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const resultMessage = document.getElementById('resultMessage');
     
     let files = []; // Array to hold file objects
+    const thumbnailUrls = new WeakMap(); // File -> promise of its first-page preview URL
     
     // Premium toggle functionality 
     const premiumToggleButtons = document.querySelectorAll('.premium-toggle');
@@ -259,6 +260,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 formData.append('pdf_format', pdfFormat.value);
             }
             
+            // Merges run in the request; a server with MERGE_JOB_MODE set answers 202 with a job to follow
             // Add progress tracking
             const xhr = new XMLHttpRequest();
             xhr.open('POST', uploadForm.action);
@@ -284,30 +286,14 @@ document.addEventListener('DOMContentLoaded', () => {
                         return;
                     }
                     
-                    // Show 100% progress
-                    updateProgress(100);
+                    if (xhr.status === 202 && response.job_id) {
+                        // Upload finished; follow the merge job on the server
+                        updateProgress(0);
+                        followJob(response.status_url);
+                        return;
+                    }
                     
-                    // Success animation
-                    setTimeout(() => {
-                        if (response.success) {
-                            showSuccessWithDownload(response);
-                            
-                            // Automatically start download if URL is provided
-                            if (response.download_url) {
-                                const downloadLink = document.createElement('a');
-                                downloadLink.href = response.download_url;
-                                downloadLink.style.display = 'none';
-                                document.body.appendChild(downloadLink);
-                                downloadLink.click();
-                                setTimeout(() => {
-                                    document.body.removeChild(downloadLink);
-                                }, 1000);
-                            }
-                        } else {
-                            showMessage(response.error || 'An error occurred', 'error');
-                        }
-                        resetForm();
-                    }, 500); // Delay for progress animation to complete
+                    finishMerge(response);
                     
                 } else {
                     let errorMessage = 'Server error occurred';
@@ -344,6 +330,114 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
     
+    function finishMerge(response) {
+        // Show 100% progress
+        updateProgress(100);
+        
+        // Success animation
+        setTimeout(() => {
+            if (response.success) {
+                showSuccessWithDownload(response);
+                
+                // Automatically start download if URL is provided
+                if (response.download_url) {
+                    const downloadLink = document.createElement('a');
+                    downloadLink.href = response.download_url;
+                    downloadLink.style.display = 'none';
+                    document.body.appendChild(downloadLink);
+                    downloadLink.click();
+                    setTimeout(() => {
+                        document.body.removeChild(downloadLink);
+                    }, 1000);
+                }
+            } else {
+                showMessage(response.error || 'An error occurred', 'error');
+            }
+            resetForm();
+        }, 500); // Delay for progress animation to complete
+    }
+    
+    // Follow a merge job through its event stream, falling back to polling
+    function followJob(statusUrl) {
+        if (!window.EventSource) {
+            pollJob(statusUrl);
+            return;
+        }
+        
+        const events = new EventSource(statusUrl + '/events');
+        events.addEventListener('status', (e) => {
+            if (showJobStatus(JSON.parse(e.data))) {
+                events.close();
+            }
+        });
+        events.addEventListener('timeout', (e) => {
+            // No worker took the job in time; it stays queued on the server
+            events.close();
+            showMessage(JSON.parse(e.data).error || 'The merge is still waiting for a worker', 'error');
+            resetForm();
+        });
+        events.addEventListener('error', () => {
+            // The stream broke or was refused; polling picks up where it left off
+            events.close();
+            pollJob(statusUrl);
+        });
+    }
+    
+    // Show a job status; returns true once the job has ended
+    function showJobStatus(job) {
+        if (job.status === 'failed') {
+            showMessage(job.error || 'Error merging PDFs', 'error');
+            resetForm();
+            return true;
+        }
+        
+        // Progress is reported as pages merged so far
+        if (job.progress && job.progress.total_pages) {
+            updateProgress(Math.round((job.progress.pages_merged / job.progress.total_pages) * 100));
+        }
+        
+        if (job.status === 'finished') {
+            finishMerge(job);
+            return true;
+        }
+        return false;
+    }
+    
+    function pollJob(statusUrl) {
+        const xhr = new XMLHttpRequest();
+        xhr.open('GET', statusUrl);
+        xhr.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
+        
+        xhr.onload = function() {
+            let job;
+            try {
+                job = JSON.parse(xhr.responseText);
+            } catch (e) {
+                console.error('Error parsing job status:', e);
+                showMessage('Error processing server response', 'error');
+                resetForm();
+                return;
+            }
+            
+            if (xhr.status !== 200) {
+                showMessage(job.error || 'Error merging PDFs', 'error');
+                resetForm();
+                return;
+            }
+            
+            if (!showJobStatus(job)) {
+                setTimeout(() => pollJob(statusUrl), 1000);
+            }
+        };
+        
+        xhr.onerror = function() {
+            showMessage('Connection error. Please try again.', 'error');
+            resetForm();
+        };
+        
+        xhr.send();
+    }
+    
     function updateProgress(percent) {
         // Smooth progress animation
         progressBar.style.transition = 'width 0.3s ease-in-out';
@@ -517,12 +611,24 @@ document.addEventListener('DOMContentLoaded', () => {
                 <span>${file.name}</span> <span class="file-size">(${formatFileSize(file.size)})</span>
             `;
             
+            const thumbnail = document.createElement('img');
+            thumbnail.className = 'file-thumbnail';
+            thumbnail.alt = '';
+            thumbnail.hidden = true;
+            thumbnailUrl(file).then(url => {
+                if (url) {
+                    thumbnail.src = url;
+                    thumbnail.hidden = false;
+                }
+            });
+            
             const removeButton = document.createElement('button');
             removeButton.className = 'remove-file';
             removeButton.innerHTML = '&times;';
             removeButton.setAttribute('aria-label', 'Remove file');
             removeButton.addEventListener('click', () => removeFile(index));
             
+            fileItem.appendChild(thumbnail);
             fileItem.appendChild(fileName);
             fileItem.appendChild(removeButton);
             fileList.appendChild(fileItem);
@@ -539,6 +645,41 @@ document.addEventListener('DOMContentLoaded', () => {
         mergeButton.disabled = files.length < 1;
     }
     
+    // Larger files get no preview: hashing reads the whole file into memory, and a miss uploads it again
+    const thumbnailMaxBytes = Number(document.body.dataset.thumbnailMaxBytes) || 20 * 1024 * 1024;
+    
+    // Preview URL of a file's first page, or null; each file is looked up once
+    function thumbnailUrl(file) {
+        if (!thumbnailUrls.has(file)) {
+            thumbnailUrls.set(file, fetchThumbnail(file).catch(() => null));
+        }
+        return thumbnailUrls.get(file);
+    }
+    
+    async function fetchThumbnail(file) {
+        if (file.size > thumbnailMaxBytes) {
+            return null;
+        }
+        let status = null;
+        // Previews are cached by content hash, so a file the server has seen is not uploaded again
+        if (window.crypto && crypto.subtle) {
+            const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+            const hash = Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+            status = await (await fetch(`/thumbnails/${hash}`)).json();
+        }
+        if (!status || status.status === 'missing') {
+            const formData = new FormData();
+            formData.append('file', file);
+            status = await (await fetch('/thumbnails', { method: 'POST', body: formData })).json();
+        }
+        // The server renders in the background; merging never waits for previews
+        for (let delay = 250; status.status === 'pending' && delay <= 8000; delay *= 2) {
+            await new Promise(resolve => setTimeout(resolve, delay));
+            status = await (await fetch(status.status_url)).json();
+        }
+        return status.thumbnails && status.thumbnails.length ? status.thumbnails[0] : null;
+    }
+    
     function formatFileSize(bytes) {
         if (bytes < 1024) return bytes + ' B';
         else if (bytes < 1048576) return (bytes / 1024).toFixed(1) + ' KB';
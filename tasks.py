@@ -0,0 +1,113 @@
+import os
+import logging
+from celery import Celery
+from celery.exceptions import SoftTimeLimitExceeded
+from config import Config
+from utils.pdf_merger import merge_pipeline, PDFMergeError
+from utils.storage import remove_uploads
+from utils.progress import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+# Run a worker with: celery -A tasks worker
+celery = Celery(__name__)
+celery.config_from_object(Config, namespace='CELERY')
+
+# Written into a merge directory when its merge is queued, so /jobs can tell jobs from other uploads
+JOB_MARKER = '.job'
+
+def merge_cache_meta(file_paths, result):
+    """Metadata stored with a cached merge, enough to rebuild the /merge response"""
+    return {
+        'total_pages': result['total_pages'],
+        'merged_files': result['merged_files'],
+        'size_before': result['size_before'],
+        'size_after': result['size_after'],
+        'bytes_deduplicated': result['bytes_deduplicated'],
+        'invalid_indexes': [file_paths.index(f) for f in result['invalid_files']]
+    }
+
+class ProgressThrottle(ProgressReporter):
+    """
+    Progress callback that forwards at most one update per interval to a task,
+    so the merge page loop is not slowed down by result backend writes
+    """
+
+    def __init__(self, task, interval):
+        super().__init__(interval)
+        self.task = task
+
+    def emit(self, event):
+        self.task.update_state(state='PROGRESS', meta={
+            'pages_merged': event['page'],
+            'total_pages': event['pages'],
+            'stage': event['stage'],
+            'file': event['file'],
+            'files': event['files'],
+            'bytes_written': event['bytes_written']
+        })
+
+@celery.task(bind=True, soft_time_limit=Config.MERGE_OPERATION_TIMEOUT)
+def merge_job(self, merge_dir, file_paths, original_names, output_filename, pdf_format='standard', cache_key=None, engine=None,
+              optimization=None, pages=None):
+    """
+    Merge saved uploads in the background
+
+    Args:
+        merge_dir (str): Directory holding the uploads; its name is the merge id and job id
+        file_paths (list): Paths of the saved uploads, in merge order
+        original_names (dict): Original upload filename for each saved path
+        output_filename (str): Name of the merged file inside the merge directory
+        pdf_format (str): Format to use for the merged PDF
+        cache_key (str, optional): Result cache key the app stores the merged PDF under, see app.job_snapshot()
+        engine (str, optional): Merge engine name, see utils.pdf_merger.get_engine()
+        optimization (dict, optional): Output optimization settings, see utils.pdf_optimizer.optimize_pdf()
+        pages (list, optional): Page selection entries indexed by file_paths, see utils.pdf_merger.parse_page_spec()
+
+    Returns:
+        dict: Job result reported by the /jobs endpoint
+    """
+    merge_id = os.path.basename(merge_dir)
+    output_path = os.path.join(merge_dir, output_filename)
+    progress = ProgressThrottle(self, Config.JOB_PROGRESS_INTERVAL)
+
+    try:
+        result = merge_pipeline(file_paths, output_path, pdf_format, progress_callback=progress,
+                                engine=engine, optimization=optimization, pages=pages)
+    except PDFMergeError as e:
+        logger.error(f"Merge job {merge_id} failed: {str(e)}")
+        if len(file_paths) - len(e.invalid_files) < 2:
+            # The directory keeps the job marker, so /jobs reports the failure until storage expires it
+            remove_uploads(file_paths)
+        return {
+            'success': False,
+            'error': f'Error merging PDFs: {str(e)}',
+            'invalid_files': [original_names[f] for f in e.invalid_files]
+        }
+    except SoftTimeLimitExceeded:
+        logger.error(f"Merge job {merge_id} timed out")
+        return {'success': False, 'error': 'Merge took too long and was cancelled', 'invalid_files': []}
+
+    remove_uploads(result['invalid_files'])
+
+    total_pages = result['total_pages']
+    logger.info(f"Merge job {merge_id} finished: {total_pages} pages, timings (ms): {result['timings']}")
+    job_result = {
+        'success': True,
+        'message': f"Successfully merged {result['merged_files']} PDFs into {total_pages} pages",
+        'download_url': f"/download/{merge_id}/{output_filename}",
+        'total_pages': total_pages,
+        'size_before': result['size_before'],
+        'size_after': result['size_after'],
+        'bytes_deduplicated': result['bytes_deduplicated'],
+        'invalid_files': [original_names[f] for f in result['invalid_files']],
+        'timings': result['timings']
+    }
+    if cache_key:
+        # Cached by the app, which owns the result cache and its size limit, not by the worker
+        job_result['cache'] = {
+            'key': cache_key,
+            'path': output_path,
+            'meta': merge_cache_meta(file_paths, result)
+        }
+    return job_result
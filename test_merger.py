@@ -1,7 +1,19 @@
+import io
 import os
 import sys
+import time
+import pytest
+
+# Merge jobs use Celery's in-memory broker and result backend, so the tests need no Redis
+os.environ.setdefault('CELERY_BROKER_URL', 'memory://')
+os.environ.setdefault('CELERY_RESULT_BACKEND', 'cache+memory://')
+
 from PyPDF2 import PdfReader, PdfWriter
-from utils.pdf_merger import merge_pdfs
+from utils.pdf_merger import merge_pdfs, merge_pipeline, merge_batch, has_pdf_structure, parse_page_spec, PDFMergeError
+from utils.pdf_optimizer import optimize_pdf
+from utils.progress import ProgressBroker, PublishedProgress, set_sink
+from utils.table_writer import write_xlsx, write_csv_zip
+from utils.metrics import MetricsRegistry
 
 def create_simple_pdf(output_path, num_pages=1):
     """Create a simple valid PDF file with the specified number of pages."""
@@ -28,6 +40,28 @@ def create_simple_pdf(output_path, num_pages=1):
     
     c.save()
     return output_path
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client of the app, keeping uploads, cached results and previews under tmp_path"""
+    import app as app_module
+    from utils.result_cache import ResultCache
+    from utils.thumbnails import Thumbnails
+    from utils.worker_pool import WorkerPool
+
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(app_module, 'result_cache', ResultCache(str(tmp_path / 'cache'), 64 * 1024 * 1024))
+    thumbnail_pool = WorkerPool(1, 4)
+    monkeypatch.setattr(app_module, 'thumbnails', Thumbnails(
+        thumbnail_pool, ResultCache(str(tmp_path / 'thumbnails'), 1024 * 1024), **app_module.thumbnails.options))
+    # The storage sweeper watches the real upload folders; tests must not expire them
+    monkeypatch.setattr(app_module.storage, 'start', lambda interval: None)
+    yield app_module.app.test_client()
+    thumbnail_pool.shutdown()
+
+def upload(path, name=None):
+    """Form value uploading a file with the test client"""
+    with open(path, 'rb') as f:
+        return (io.BytesIO(f.read()), name or os.path.basename(path))
 
 def test_pdf_merger():
     """Test the PDF merger functionality."""
@@ -81,6 +115,972 @@ def test_pdf_merger():
         print(f"Error during test: {str(e)}")
         return False
 
+@pytest.mark.parametrize('engine', ['pypdf2', 'pymupdf', 'stream'])
+def test_merge_pipeline(tmp_path, engine):
+    """Test that the merge pipeline skips invalid inputs and checks its output."""
+    pdf1 = create_simple_pdf(str(tmp_path / 'one.pdf'), 1)
+    pdf2 = create_simple_pdf(str(tmp_path / 'two.pdf'), 2)
+    broken = tmp_path / 'broken.pdf'
+    broken.write_bytes(b'%PDF-1.4 not really a pdf')
+
+    result = merge_pipeline([pdf1, str(broken), pdf2], str(tmp_path / 'merged.pdf'), engine=engine)
+
+    assert result['engine'] == engine
+    assert result['total_pages'] == 3
+    assert len(PdfReader(result['output_path']).pages) == 3
+    assert result['invalid_files'] == [str(broken)]
+    assert {'validate', 'merge', 'write', 'verify'} <= set(result['timings'])
+    assert has_pdf_structure(result['output_path'])
+    assert not has_pdf_structure(str(broken))
+
+@pytest.mark.parametrize('engine', ['pypdf2', 'pymupdf', 'stream'])
+def test_merge_deduplicates_shared_streams(tmp_path, engine):
+    """Test that an image embedded in every input is written to the merged PDF once."""
+    from PIL import Image
+    from reportlab.pdfgen import canvas
+
+    image_path = str(tmp_path / 'logo.png')
+    Image.effect_noise((300, 300), 64).convert('RGB').save(image_path)
+    inputs = []
+    for name in ('jan', 'feb', 'mar'):
+        path = str(tmp_path / f'{name}.pdf')
+        c = canvas.Canvas(path)
+        c.drawImage(image_path, 100, 100, width=144, height=144)
+        c.drawString(100, 700, f"Statement for {name}")
+        c.save()
+        inputs.append(path)
+
+    stats = {}
+    output_path, total_pages = merge_pdfs(inputs, str(tmp_path / 'merged.pdf'), engine=engine, stats=stats)
+
+    assert total_pages == 3
+    assert stats['duplicate_streams'] >= 2
+    assert stats['bytes_saved'] > 0
+    assert os.path.getsize(output_path) < 2 * os.path.getsize(inputs[0])
+    reader = PdfReader(output_path)
+    images = {page['/Resources']['/XObject'].raw_get(name).idnum
+              for page in reader.pages for name in page['/Resources']['/XObject']}
+    assert len(images) == 1
+
+def test_merge_keeps_annotations_quietly(tmp_path, caplog):
+    """Test that links on merged pages are kept, with no per-page warnings."""
+    from reportlab.pdfgen import canvas
+
+    linked = str(tmp_path / 'linked.pdf')
+    c = canvas.Canvas(linked)
+    for page in range(3):
+        c.drawString(100, 700, f"Page {page + 1}")
+        c.linkURL('https://example.com', (100, 690, 300, 720))
+        c.showPage()
+    c.save()
+    plain = create_simple_pdf(str(tmp_path / 'plain.pdf'))
+
+    with caplog.at_level('WARNING', logger='utils.pdf_merger'):
+        merge_pdfs([linked, plain], str(tmp_path / 'merged.pdf'))
+    assert not caplog.records
+    reader = PdfReader(str(tmp_path / 'merged.pdf'))
+    assert [len(page.get('/Annots', [])) for page in reader.pages] == [1, 1, 1, 0]
+
+@pytest.mark.parametrize('engine', ['pypdf2', 'pymupdf', 'stream'])
+def test_merge_page_selection(tmp_path, engine):
+    """Test that a page selection picks, reorders and rotates pages."""
+    pdf1 = create_simple_pdf(str(tmp_path / 'one.pdf'), 3)
+    pdf2 = create_simple_pdf(str(tmp_path / 'two.pdf'), 2)
+
+    output_path, total_pages = merge_pdfs([pdf1, pdf2], str(tmp_path / 'merged.pdf'),
+                                          engine=engine, pages="2 1:3-2@90")
+
+    assert total_pages == 4
+    reader = PdfReader(output_path)
+    assert [page.extract_text().split('\n')[0] for page in reader.pages] == [
+        'This is page 1 of test PDF', 'This is page 2 of test PDF',
+        'This is page 3 of test PDF', 'This is page 2 of test PDF'
+    ]
+    assert [page.get('/Rotate', 0) for page in reader.pages] == [0, 0, 90, 90]
+
+    with pytest.raises(PDFMergeError):
+        merge_pdfs([pdf1, pdf2], str(tmp_path / 'out_of_range.pdf'), engine=engine, pages="2:3")
+
+@pytest.mark.parametrize('engine', ['pypdf2', 'pymupdf', 'stream'])
+def test_merge_progress_events(tmp_path, engine):
+    """Test that merge progress reports files, pages and bytes written through the broker."""
+    pdf1 = create_simple_pdf(str(tmp_path / 'one.pdf'), 2)
+    pdf2 = create_simple_pdf(str(tmp_path / 'two.pdf'), 3)
+    broker = ProgressBroker()
+    set_sink(broker.publish)
+    subscriber = broker.subscribe('merge')
+    try:
+        merge_pdfs([pdf1, pdf2], str(tmp_path / 'merged.pdf'), engine=engine,
+                   progress_callback=PublishedProgress('merge', interval=60))
+    finally:
+        set_sink(None)
+
+    events = [subscriber.get_nowait() for _ in range(subscriber.qsize())]
+    # The interval throttles events to the first and last call of each stage
+    assert [event['stage'] for event in events] == ['merge', 'merge', 'write']
+    assert (events[1]['page'], events[1]['pages']) == (5, 5)
+    assert (events[1]['file'], events[1]['files']) == (2, 2)
+    assert events[-1]['bytes_written'] == os.path.getsize(str(tmp_path / 'merged.pdf'))
+
+@pytest.mark.parametrize('engine', ['pypdf2', 'pymupdf', 'stream'])
+def test_merge_batch_shares_inputs(tmp_path, engine):
+    """Test that a batch merges every group from inputs parsed once, and reports failed groups."""
+    cover = create_simple_pdf(str(tmp_path / 'cover.pdf'), num_pages=1)
+    invoices = [create_simple_pdf(str(tmp_path / f'invoice_{i}.pdf'), num_pages=i + 1) for i in range(12)]
+    broken = str(tmp_path / 'broken.pdf')
+    with open(broken, 'wb') as f:
+        f.write(b'%PDF-1.4 not really')
+
+    groups = [{'name': f'customer_{i}.pdf', 'files': [cover, invoice]} for i, invoice in enumerate(invoices)]
+    groups.append({'name': 'reordered.pdf', 'files': [cover, invoices[2]], 'pages': parse_page_spec('2:3 1')})
+    groups.append({'name': 'broken.pdf', 'files': [cover, broken]})
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+
+    result = merge_batch(groups, str(output_dir), engine=engine, threads=4)
+
+    assert result['invalid_files'] == [broken]
+    outcomes = result['groups']
+    assert [outcome['name'] for outcome in outcomes] == [group['name'] for group in groups]
+    for i, outcome in enumerate(outcomes[:12]):
+        assert outcome['error'] is None
+        reader = PdfReader(outcome['output_path'])
+        assert len(reader.pages) == outcome['total_pages'] == i + 2
+        assert "page 1 of test PDF" in reader.pages[0].extract_text()
+        assert f"Page {i + 1} of {i + 1}" in reader.pages[-1].extract_text()
+    assert "Page 3 of 3" in PdfReader(outcomes[12]['output_path']).pages[0].extract_text()
+    assert outcomes[13]['output_path'] is None and 'broken.pdf' in outcomes[13]['error']
+
+def test_merge_mapped_inputs(tmp_path, monkeypatch):
+    """Test that memory-mapped inputs merge to the same bytes as buffered ones."""
+    from utils import pdf_merger
+    from utils.mapped_file import MappedFile
+
+    pdf1 = create_simple_pdf(str(tmp_path / 'one.pdf'), num_pages=3)
+    pdf2 = create_simple_pdf(str(tmp_path / 'two.pdf'), num_pages=2)
+    merge_pdfs([pdf1, pdf2], str(tmp_path / 'buffered.pdf'))
+    monkeypatch.setattr(pdf_merger, 'MMAP_MIN_SIZE', 0)
+    with pdf_merger.open_pdf(pdf1) as opened:
+        assert isinstance(opened._handle, MappedFile)
+    merge_pdfs([pdf1, pdf2], str(tmp_path / 'mapped.pdf'))
+    assert (tmp_path / 'mapped.pdf').read_bytes() == (tmp_path / 'buffered.pdf').read_bytes()
+
+    with MappedFile(pdf1, zero_copy_min=16) as mapped:
+        assert mapped.read(5) == b'%PDF-'
+        view = mapped.read(16)
+        assert isinstance(view, memoryview) and mapped.tell() == 21
+        assert mapped.seek(-6, os.SEEK_END) == mapped.size - 6
+        assert mapped.read() == b'%%EOF\n'
+    # A view still in use keeps the mapping alive after close()
+    assert bytes(view) == (tmp_path / 'one.pdf').read_bytes()[5:21]
+
+@pytest.mark.parametrize('engine', ['pypdf2', 'stream'])
+def test_merge_mapped_inputs_zero_copy(tmp_path, monkeypatch, engine):
+    """Test that streams passed on as memoryviews merge and deduplicate like buffered ones."""
+    from PIL import Image
+    from reportlab.pdfgen import canvas
+    from utils import pdf_merger
+    from utils.mapped_file import MappedFile, ZERO_COPY_MIN
+
+    inputs = []
+    for name, seeds in (('jan', ['shared', 'jan']), ('feb', ['shared', 'feb'])):
+        path = str(tmp_path / f'{name}.pdf')
+        c = canvas.Canvas(path)
+        for i, seed in enumerate(seeds):
+            # Noise does not compress, so each image stream is well over ZERO_COPY_MIN
+            image_path = str(tmp_path / f'{seed}.png')
+            if not os.path.exists(image_path):
+                Image.effect_noise((220 + i * 10, 220), 64 + len(seed)).convert('RGB').save(image_path)
+            c.drawImage(image_path, 100, 100 + i * 300, width=144, height=144)
+        c.save()
+        inputs.append(path)
+
+    buffered_stats = {}
+    merge_pdfs(inputs, str(tmp_path / 'buffered.pdf'), engine=pdf_merger.get_engine(engine), stats=buffered_stats)
+
+    views = []
+    read = MappedFile.read
+
+    def spy(self, size=-1):
+        data = read(self, size)
+        if isinstance(data, memoryview):
+            views.append(len(data))
+        return data
+
+    monkeypatch.setattr(MappedFile, 'read', spy)
+    monkeypatch.setattr(pdf_merger, 'MMAP_MIN_SIZE', 0)
+    mapped_stats = {}
+    merge_pdfs(inputs, str(tmp_path / 'mapped.pdf'), engine=pdf_merger.get_engine(engine), stats=mapped_stats)
+
+    assert len(views) >= 3 and min(views) >= ZERO_COPY_MIN
+    assert (tmp_path / 'mapped.pdf').read_bytes() == (tmp_path / 'buffered.pdf').read_bytes()
+    assert mapped_stats == buffered_stats and mapped_stats['duplicate_streams'] >= 1
+
+def test_thumbnails_render_in_background_and_cache(tmp_path):
+    """Test that previews render on their own pool once per document and are served from the cache."""
+    import time
+    from PIL import Image
+    from utils.hashing import hash_file
+    from utils.result_cache import ResultCache
+    from utils.thumbnails import Thumbnails
+    from utils.worker_pool import WorkerPool
+
+    pool = WorkerPool(1, 4)
+    thumbnails = Thumbnails(pool, ResultCache(str(tmp_path / 'cache'), 1024 * 1024), dpi=36, max_pages=2)
+
+    def upload(name, writer):
+        upload_dir = tmp_path / name
+        upload_dir.mkdir()
+        path = str(upload_dir / 'upload.pdf')
+        writer(path)
+        return hash_file(path), path, str(upload_dir)
+
+    def settle(file_hash):
+        deadline = time.time() + 60
+        while thumbnails.status(file_hash)['status'] == 'pending' and time.time() < deadline:
+            time.sleep(0.05)
+        return thumbnails.status(file_hash)
+
+    try:
+        file_hash, path, upload_dir = upload('first', lambda path: create_simple_pdf(path, num_pages=3))
+        assert thumbnails.status(file_hash) == {'status': 'missing'}
+        assert thumbnails.submit(file_hash, path, upload_dir) == {'status': 'pending'}
+        status = settle(file_hash)
+        assert status == {'status': 'ready', 'pages': 3, 'files': ['page-1.png', 'page-2.png']}
+        assert not os.path.exists(upload_dir)
+        with Image.open(thumbnails.path(file_hash, 'page-1.png')) as image:
+            assert image.size == (306, 396)  # Letter at 36 dpi
+
+        # The same content again is answered from the cache, and its upload dropped
+        _, path, upload_dir = upload('again', lambda path: create_simple_pdf(path, num_pages=3))
+        assert thumbnails.submit(file_hash, path, upload_dir) == status
+        assert not os.path.exists(upload_dir)
+        assert pool.stats()['completed'] == 1
+
+        broken_hash, path, upload_dir = upload('broken', lambda path: open(path, 'wb').write(b'%PDF-1.4 broken'))
+        thumbnails.submit(broken_hash, path, upload_dir)
+        assert settle(broken_hash)['status'] == 'failed'
+        assert not os.path.exists(upload_dir)
+    finally:
+        pool.shutdown()
+
+def test_thumbnail_routes(client, tmp_path, monkeypatch):
+    """Test that /thumbnails renders previews in the background and serves them by content hash."""
+    import hashlib
+    import app as app_module
+
+    pdf = create_simple_pdf(str(tmp_path / 'doc.pdf'), 2)
+    with open(pdf, 'rb') as f:
+        file_hash = hashlib.sha256(f.read()).hexdigest()
+    assert client.get(f'/thumbnails/{file_hash}').status_code == 404  # Never uploaded
+    assert client.get('/thumbnails/not-a-hash').status_code == 400
+
+    response = client.post('/thumbnails', data={'file': upload(pdf)})
+    assert response.status_code == 202
+    assert response.json['status'] == 'pending' and response.json['hash'] == file_hash
+    deadline = time.time() + 60
+    while response.status_code == 202 and time.time() < deadline:
+        time.sleep(0.05)
+        response = client.get(response.json['status_url'])
+    assert response.status_code == 200
+    assert response.json['pages'] == 2 and response.json['thumbnails'] == [f'/thumbnails/{file_hash}/page-1.png']
+    assert os.listdir(tmp_path / 'uploads') == []
+
+    image = client.get(response.json['thumbnails'][0])
+    assert image.status_code == 200 and image.mimetype == 'image/png'
+    assert image.data.startswith(b'\x89PNG')
+    assert image.cache_control.immutable and image.cache_control.private
+    assert image.cache_control.max_age == app_module.app.config['THUMBNAIL_MAX_AGE']
+    assert client.get(f'/thumbnails/{file_hash}/page-2.png').status_code == 404
+
+    # The same content again is answered from the cache
+    assert client.post('/thumbnails', data={'file': upload(pdf, 'copy.pdf')}).status_code == 200
+
+    response = client.post('/thumbnails', data={'file': (io.BytesIO(b'not a pdf' * 200), 'notes.pdf')})
+    assert response.status_code == 400
+    monkeypatch.setitem(app_module.app.config, 'THUMBNAIL_MAX_UPLOAD_SIZE', 1024)
+    big = b'%PDF-1.4\n' + b'0' * 2048
+    assert client.post('/thumbnails', data={'file': (io.BytesIO(big), 'big.pdf')}).status_code == 413
+    assert os.listdir(tmp_path / 'uploads') == []
+
+def test_batch_merge_route(client, tmp_path, monkeypatch):
+    """Test /merge/batch manifests, per-group errors and its zip and urls outputs."""
+    import json
+    import zipfile
+    import app as app_module
+    from utils.worker_pool import WorkerPool
+
+    pool = WorkerPool(1, 4)
+    monkeypatch.setattr(app_module, 'worker_pool', pool)
+    monkeypatch.setitem(app_module.app.config, 'FREE_BATCH_MAX_FILES', 10)
+    cover = create_simple_pdf(str(tmp_path / 'cover.pdf'), 1)
+    first = create_simple_pdf(str(tmp_path / 'a.pdf'), 2)
+    second = create_simple_pdf(str(tmp_path / 'b.pdf'), 3)
+
+    def batch(files, groups, **form):
+        files = [upload(path) if isinstance(path, str) else (io.BytesIO(path[0]), path[1]) for path in files]
+        return client.post('/merge/batch', data=dict(form, manifest=json.dumps({'groups': groups}), **{'files[]': files}))
+
+    files = [cover, first, second, (b'not a pdf' * 200, 'notes.pdf')]
+    groups = [{'name': 'acme', 'files': ['cover.pdf', 'a.pdf']},
+              {'name': 'globex.pdf', 'files': ['cover.pdf', 3], 'pages': '2 1:1'},
+              {'name': 'broken', 'files': ['a.pdf', 'notes.pdf']}]
+    try:
+        response = batch(files, groups)
+        assert response.status_code == 200 and response.mimetype == 'application/zip'
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            assert archive.namelist() == ['acme.pdf', 'globex.pdf', 'errors.json']
+            assert len(PdfReader(io.BytesIO(archive.read('acme.pdf'))).pages) == 3
+            assert len(PdfReader(io.BytesIO(archive.read('globex.pdf'))).pages) == 4
+            errors = json.loads(archive.read('errors.json'))
+        assert [(group['name'], group['error']) for group in errors['groups']] == [('broken.pdf', 'Invalid file type')]
+        assert errors['invalid_files'] == ['notes.pdf']
+
+        response = batch(files, groups, output='urls')
+        assert response.status_code == 200
+        summary = {group['name']: group for group in response.json['groups']}
+        assert list(summary) == ['acme.pdf', 'globex.pdf', 'broken.pdf']
+        assert summary['broken.pdf']['download_url'] is None and summary['globex.pdf']['total_pages'] == 4
+        download = client.get(summary['acme.pdf']['download_url'])
+        assert download.status_code == 200 and len(PdfReader(io.BytesIO(download.data)).pages) == 3
+
+        # A name uploaded twice can only be referred to by position
+        twice = [first, first, cover]
+        response = batch(twice, [{'name': 'x', 'files': ['a.pdf', 'cover.pdf']}])
+        assert response.status_code == 400 and response.json['error'] == 'a.pdf was uploaded more than once'
+        response = batch(twice, [{'name': 'x', 'files': [2, 'cover.pdf']}], output='urls')
+        assert response.status_code == 200 and response.json['groups'][0]['total_pages'] == 3
+
+        response = batch([cover, first], [{'name': 'x', 'files': [1]}, {'name': 'x.pdf', 'files': [2]}])
+        assert response.status_code == 400 and response.json['error'] == 'More than one group is named x.pdf'
+        response = batch([cover], [{'name': 'x', 'files': ['missing.pdf']}])
+        assert response.status_code == 400 and 'was not uploaded' in response.json['error']
+
+        response = batch(files, [{'name': 'broken', 'files': ['notes.pdf']}])
+        assert response.status_code == 400
+        assert response.json['error'] == 'No merge in the batch succeeded'
+        assert response.json['groups'][0]['error'] == 'Invalid file type'
+    finally:
+        pool.shutdown()
+
+def test_merge_job_runs_without_redis(client, tmp_path, monkeypatch):
+    """Test that job-mode merges run eagerly on the in-memory transports and report through /jobs."""
+    from tasks import celery
+
+    monkeypatch.setattr(celery.conf, 'CELERY_TASK_ALWAYS_EAGER', True)
+    pdf1 = create_simple_pdf(str(tmp_path / 'one.pdf'), num_pages=3)
+    pdf2 = create_simple_pdf(str(tmp_path / 'two.pdf'), num_pages=2)
+
+    response = client.post('/merge', data={'mode': 'job', 'files[]': [upload(pdf1), upload(pdf2)]})
+    assert response.status_code == 202
+    status_url = response.json['status_url']
+    job = client.get(status_url).json
+    assert job['status'] == 'finished' and job['total_pages'] == 5
+    assert job['progress'] == {'pages_merged': 5, 'total_pages': 5}
+
+    events = client.get(status_url + '/events').get_data(as_text=True)
+    assert events.count('event: status') == 1 and '"status": "finished"' in events
+
+    download = client.get(job['download_url'])
+    assert download.status_code == 200
+    assert len(PdfReader(io.BytesIO(download.data)).pages) == 5
+    assert client.get('/jobs/00000000-0000-0000-0000-000000000000').status_code == 404
+
+    # A merge done in the request leaves a merge directory too, but it is not a job
+    merged = client.post('/merge', data={'files[]': [upload(pdf2), upload(pdf1)]}).json
+    assert os.path.isdir(os.path.join(client.application.config['UPLOAD_FOLDER'], merged['merge_id']))
+    assert client.get(f"/jobs/{merged['merge_id']}").status_code == 404
+    assert client.get(f"/jobs/{merged['merge_id']}/events").status_code == 404
+
+    # The app cached the job's output when it reported it, so the same merge is answered from the cache
+    assert 'cache' not in job
+    cached = client.post('/merge', data={'files[]': [upload(pdf1), upload(pdf2)]}).json
+    assert cached['download_url'].startswith('/download/cache/') and cached['total_pages'] == 5
+
+def test_job_events_time_out_without_worker(client, tmp_path, monkeypatch):
+    """Test that a job no worker picks up ends its event stream instead of holding it open."""
+    import time
+    from app import app
+    from tasks import celery
+
+    monkeypatch.setattr(celery.conf, 'CELERY_TASK_ALWAYS_EAGER', False)
+    monkeypatch.setitem(app.config, 'JOB_QUEUE_TIMEOUT', 0.2)
+    monkeypatch.setitem(app.config, 'JOB_PROGRESS_INTERVAL', 0.05)
+    pdf1 = create_simple_pdf(str(tmp_path / 'one.pdf'))
+    pdf2 = create_simple_pdf(str(tmp_path / 'two.pdf'))
+
+    response = client.post('/merge', data={'mode': 'job', 'files[]': [upload(pdf1), upload(pdf2)]})
+    assert response.status_code == 202
+    status_url = response.json['status_url']
+    assert client.get(status_url).json['status'] == 'queued'
+
+    started = time.monotonic()
+    events = client.get(status_url + '/events').get_data(as_text=True)
+    assert time.monotonic() - started < 5
+    assert events.startswith('event: status') and '"status": "queued"' in events
+    assert 'event: timeout' in events and 'No merge worker' in events
+
+def test_app_import_starts_no_services():
+    """Test that importing the app, as spawned pool workers do, starts nothing until the first request."""
+    import subprocess
+
+    # The storage sweeper is left out, as it would sweep the real upload folders
+    code = ("import threading, app; print(threading.active_count(), app.progress_queue is None); "
+            "app.storage.start = lambda interval: None; "
+            "app.app.test_client().get('/status/pool'); print(sorted(t.name for t in threading.enumerate()))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.splitlines()
+    assert output[0] == '1 True'
+    assert output[1] == "['MainThread', 'progress-listener']"
+
+def test_worker_pool_admission(client, tmp_path, monkeypatch):
+    """Test that a saturated pool turns work away, and /merge answers 503 with Retry-After."""
+    import app as app_module
+    from utils.worker_pool import WorkerPool, PoolFullError
+
+    pool = WorkerPool(1, 1)
+    slots = [pool.reserve(), pool.reserve()]  # One running, one queued
+    with pytest.raises(PoolFullError) as error:
+        pool.submit(sorted, [2, 1])
+    assert error.value.retry_after >= 1
+    assert pool.stats()['running'] == 1 and pool.stats()['queued'] == 1 and pool.stats()['rejected'] == 1
+
+    monkeypatch.setattr(app_module, 'worker_pool', pool)
+    pdf1 = create_simple_pdf(str(tmp_path / 'one.pdf'))
+    pdf2 = create_simple_pdf(str(tmp_path / 'two.pdf'))
+    response = client.post('/merge', data={'files[]': [upload(pdf1), upload(pdf2)]})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(response.json['retry_after'])
+    assert int(response.headers['Retry-After']) >= 1
+
+    for slot in slots:
+        slot.release()
+    slots[0].release()  # Releasing twice frees nothing more
+    try:
+        assert pool.stats()['running'] == 0 and pool.stats()['completed'] == 2
+        assert pool.run(sorted, [3, 1, 2]) == [1, 2, 3]
+        assert pool.stats()['rejected'] == 2
+    finally:
+        pool.shutdown()
+
+def test_word_conversion_processes_come_from_idle_workers(client, tmp_path, monkeypatch):
+    """Test that /convert/word only parses on extra processes while pool workers are idle."""
+    import app as app_module
+    from utils.worker_pool import WorkerPool
+
+    pool = WorkerPool(3, 1)
+    seen = []
+
+    def run(fn, file_path, output_dir, processes, **kwargs):
+        seen.append((processes, pool.stats()['running']))
+        output_path = tmp_path / f'{len(seen)}.docx'
+        output_path.write_bytes(b'docx')
+        return str(output_path)
+
+    monkeypatch.setattr(pool, 'run', run)
+    monkeypatch.setattr(app_module, 'worker_pool', pool)
+    monkeypatch.setitem(app_module.app.config, 'WORD_CONVERSION_PROCESSES', 4)
+    pdf = create_simple_pdf(str(tmp_path / 'doc.pdf'))
+
+    assert client.post('/convert/word', data={'file': upload(pdf)}).status_code == 200
+    with pool.reserve():  # Another job keeps a worker busy
+        pdf = create_simple_pdf(str(tmp_path / 'other.pdf'), 2)
+        assert client.post('/convert/word', data={'file': upload(pdf)}).status_code == 200
+    # One worker is always left for the conversion itself
+    assert seen == [(3, 2), (2, 2)]
+    assert pool.stats()['running'] == 0 and pool.stats()['completed'] == 1
+    assert pool.reserve_idle(0) == []
+
+def test_upload_limits_reject_with_413(client, tmp_path):
+    """Test that free tier uploads over the per-file size or file count limits get a 413."""
+    import app as app_module
+
+    config = app_module.app.config
+    pdf = create_simple_pdf(str(tmp_path / 'small.pdf'))
+    big = b'%PDF-1.4\n' + b'0' * (config['FREE_MAX_FILE_SIZE'] + 1024 * 1024)  # 6MB
+
+    response = client.post('/merge', data={'files[]': [upload(pdf), (io.BytesIO(big), 'big.pdf')]})
+    assert response.status_code == 413
+    assert response.json['error'] == 'File too large: at most 5MB per file'
+
+    files = [upload(pdf, f'{i}.pdf') for i in range(config['FREE_MAX_FILES'] + 1)]
+    response = client.post('/merge', data={'files[]': files})
+    assert response.status_code == 413
+    assert response.json['error'] == 'Too many files: at most 3 per upload'
+
+    # Nothing spooled by the rejected requests is left behind
+    assert os.listdir(config['UPLOAD_FOLDER']) == []
+
+def test_uploads_spool_to_disk(client, tmp_path):
+    """Test that uploaded parts are written to the request's upload directory and hashed as they arrive."""
+    import hashlib
+    import app as app_module
+    from flask import request
+    from utils.uploads import UploadSpool
+
+    pdf = create_simple_pdf(str(tmp_path / 'doc.pdf'))
+    with open(pdf, 'rb') as f:
+        data = f.read()
+    with app_module.app.test_request_context('/merge', method='POST', data={
+        'files[]': [upload(pdf), upload(pdf), (io.BytesIO(b'not a pdf' * 200), 'notes.pdf')]
+    }):
+        files = request.files.getlist('files[]')
+        assert all(isinstance(file.stream, UploadSpool) for file in files)
+        assert [os.path.basename(file.stream.path) for file in files] == ['doc.pdf', 'doc_2.pdf', 'notes.pdf']
+        for file in files[:2]:
+            assert os.path.dirname(file.stream.path) == request.upload_dir
+            assert file.stream.is_valid and file.stream.sha256 == hashlib.sha256(data).hexdigest()
+            with open(file.stream.path, 'rb') as f:
+                assert f.read() == data
+        # A part without the PDF header is discarded as soon as that is known
+        assert not files[2].stream.is_valid and not os.path.exists(files[2].stream.path)
+        assert request.uploaded_bytes == 2 * len(data) + 1800
+
+        request.discard_uploads()
+        assert not os.path.exists(request.upload_dir)
+
+def test_upload_rejected_by_content_length(client):
+    """Test that a body announcing more than the tier's total limit is refused before it is read."""
+    import app as app_module
+
+    class Body(io.BytesIO):
+        consumed = 0
+
+        def read(self, *args):
+            data = super().read(*args)
+            Body.consumed += len(data)
+            return data
+
+    length = app_module.app.config['FREE_TOTAL_SIZE_LIMIT'] + 2 * 1024 * 1024
+    response = client.post('/merge', input_stream=Body(b'-' * 1024), content_type='multipart/form-data; boundary=x',
+                           environ_overrides={'CONTENT_LENGTH': str(length)})
+    assert response.status_code == 413
+    assert Body.consumed == 0
+    assert not os.path.exists(app_module.app.config['UPLOAD_FOLDER'])
+
+def test_send_download_conditional_and_ranges(tmp_path):
+    """Test ETag revalidation, byte ranges and X-Accel-Redirect offloading of downloads."""
+    import hashlib
+    from flask import Flask
+    from utils.downloads import send_download
+
+    data = bytes(range(256)) * 40
+    path = tmp_path / 'outputs' / 'merged.pdf'
+    path.parent.mkdir()
+    path.write_bytes(data)
+    etag = hashlib.sha256(data).hexdigest()
+
+    downloads = Flask(__name__)
+
+    @downloads.route('/direct')
+    def direct():
+        return send_download(str(path), 'merged.pdf', max_age=60)
+
+    @downloads.route('/accel')
+    def accel():
+        return send_download(str(path), 'merged.pdf', offload='x-accel',
+                             accel_locations={str(tmp_path / 'outputs'): '/internal/outputs/'})
+
+    client = downloads.test_client()
+    response = client.get('/direct')
+    assert response.status_code == 200 and response.data == data
+    assert response.headers['ETag'] == f'"{etag}"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Cache-Control'] == 'private, max-age=60'
+    assert 'filename=merged.pdf' in response.headers['Content-Disposition']
+
+    response = client.get('/direct', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304 and response.data == b''
+
+    response = client.get('/direct', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(data)}'
+    assert response.data == data[100:200]
+
+    response = client.get('/direct', headers={'Range': f'bytes={len(data)}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(data)}'
+
+    response = client.get('/accel')
+    assert response.status_code == 200 and response.data == b''
+    assert response.headers['X-Accel-Redirect'] == '/internal/outputs/merged.pdf'
+    assert response.headers['ETag'] == f'"{etag}"'
+    assert response.headers['Content-Type'] == 'application/pdf'
+    response = client.get('/accel', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+
+def test_storage_sweep_expires_and_evicts(tmp_path):
+    """Test that sweeps remove expired and over-quota entries by mtime and keep live ones."""
+    import uuid
+    from utils.storage import StorageManager
+
+    uploads, outputs = tmp_path / 'uploads', tmp_path / 'word'
+    uploads.mkdir()
+    outputs.mkdir()
+    now = time.time()
+
+    def entry(folder, age, size=100, suffix=''):
+        path = folder / f'{uuid.uuid4()}{suffix}'
+        if suffix:
+            path.write_bytes(b'x' * size)
+        else:
+            path.mkdir()
+            (path / 'upload.pdf').write_bytes(b'x' * size)
+            os.utime(path / 'upload.pdf', (now - age, now - age))
+        os.utime(path, (now - age, now - age))
+        return path
+
+    expired = [entry(uploads, 7200), entry(outputs, 7200, suffix='.docx')]
+    old, recent, fresh = entry(uploads, 1800), entry(outputs, 600, suffix='.docx'), entry(uploads, 5)
+    # Only names the app generates are swept, however old
+    (uploads / 'test').mkdir()
+    os.utime(uploads / 'test', (now - 7200, now - 7200))
+
+    storage = StorageManager([str(uploads), str(outputs), str(tmp_path / 'missing')], ttl=3600, max_bytes=250,
+                             min_age=60)
+    stats = storage.sweep()
+    assert not any(path.exists() for path in expired)
+    # Over the quota the oldest live entry goes first
+    assert not old.exists() and recent.exists() and fresh.exists() and (uploads / 'test').exists()
+    assert stats['files_expired'] == 2 and stats['files_evicted'] == 1
+    assert stats['bytes_reclaimed'] == 300 and stats['bytes_stored'] == 200 and stats['entries'] == 2
+
+    # Entries younger than min_age are never evicted, even over the quota
+    storage.max_bytes = 0
+    stats = storage.sweep()
+    assert not recent.exists() and fresh.exists()
+    assert stats['files_evicted'] == 2 and stats['bytes_stored'] == 100 and stats['sweeps'] == 2
+
+def test_result_cache_keys_hits_and_eviction(tmp_path):
+    """Test result cache keys, lookups and least recently used eviction past the byte limit."""
+    from utils.result_cache import ResultCache
+
+    key = ResultCache.make_key('merge', ['a', 'b'], {'engine': 'pypdf2', 'pages': None})
+    assert key == ResultCache.make_key('merge', ('a', 'b'), {'pages': None, 'engine': 'pypdf2'})
+    assert len({key, ResultCache.make_key('merge', ['b', 'a'], {'engine': 'pypdf2', 'pages': None}),
+                ResultCache.make_key('merge', ['a', 'b'], {'engine': 'pikepdf', 'pages': None}),
+                ResultCache.make_key('convert:word', ['a', 'b']), ResultCache.make_key('convert:word', ['a', 'b'], {})}) == 4
+
+    cache = ResultCache(str(tmp_path / 'cache'), 2500)
+    outputs = []
+    for i in range(3):
+        outputs.append(tmp_path / f'output-{i}.pdf')
+        outputs[i].write_bytes(bytes([i]) * 1000)
+
+    assert cache.get('first') is None
+    paths = cache.put('first', [str(outputs[0])], {'total_pages': 3})
+    assert paths == [str(tmp_path / 'cache' / 'first' / 'output-0.pdf')]
+    assert cache.get('first') == (paths, {'total_pages': 3})
+    # Storing a key again keeps the entry already there
+    assert cache.put('first', [str(outputs[1])]) == paths
+
+    cache.put('second', [str(outputs[1])])
+    now = time.time()
+    os.utime(cache.entry_path('second'), (now - 60, now - 60))
+    os.utime(cache.entry_path('first'), (now - 30, now - 30))
+    assert cache.get('first') is not None  # Used last, so it outlives 'second'
+    cache.put('third', [str(outputs[2])])
+    assert cache.get('second') is None
+    assert cache.get('first') is not None and cache.get('third')[0][0].endswith('output-2.pdf')
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['bytes'] <= 2500
+    assert stats['hits'] == 4 and stats['misses'] == 2 and stats['hit_ratio'] == 0.667
+
+def test_stream_zip_matches_inputs_in_bounded_chunks(tmp_path, monkeypatch):
+    """Test that streamed archives open with zipfile, hold the inputs and arrive in bounded chunks."""
+    import zipfile
+    from utils import zip_stream
+
+    monkeypatch.setattr(zip_stream, 'ZIP_CHUNK_SIZE', 4096)
+    contents = {'big.pdf': os.urandom(50000), 'small.jpg': b'jpeg' * 10, 'empty.txt': b''}
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+
+    def produced():
+        # Members may come from a generator still producing them
+        yield str(tmp_path / 'big.pdf')
+        yield str(tmp_path / 'small.jpg'), 'images/page-1.jpg'
+        yield str(tmp_path / 'empty.txt')
+
+    for compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        chunks = list(zip_stream.stream_zip(produced(), compression=compression))
+        # The 50000 byte member is sent as it is read, never whole; zlib holds back up to 16KB of output
+        assert max(len(chunk) for chunk in chunks) < (4096 if compression == zipfile.ZIP_STORED else 16384) + 1024
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            assert archive.testzip() is None
+            assert archive.namelist() == ['big.pdf', 'images/page-1.jpg', 'empty.txt']
+            assert archive.read('big.pdf') == contents['big.pdf']
+            assert archive.read('images/page-1.jpg') == contents['small.jpg']
+            assert archive.read('empty.txt') == b''
+            assert {info.compress_type for info in archive.infolist()} == {compression}
+
+def test_parse_page_spec():
+    """Test the page selection grammar."""
+    assert parse_page_spec("1:1-3 2 3:10@90; 1:5-,3-1@-90") == [
+        (0, [(1, 3)], 0), (1, None, 0), (2, [(10, 10)], 90), (0, [(5, None), (3, 1)], 270)
+    ]
+    for spec in ('', 'x', '0', '1:0', '1@45'):
+        with pytest.raises(PDFMergeError):
+            parse_page_spec(spec)
+
+def test_optimize_pdf(tmp_path):
+    """Test that optimization downsamples oversized images and shrinks the file."""
+    from PIL import Image
+    from reportlab.pdfgen import canvas
+
+    image_path = str(tmp_path / 'photo.png')
+    Image.effect_noise((1200, 1200), 64).convert('RGB').save(image_path)
+    pdf_path = str(tmp_path / 'photo.pdf')
+    c = canvas.Canvas(pdf_path)
+    c.drawImage(image_path, 100, 100, width=144, height=144)  # 2 inches, so ~600 dpi
+    c.save()
+
+    result = optimize_pdf(pdf_path, {'garbage': 4, 'deflate': True, 'clean': True}, image_dpi=72)
+
+    assert result['images_downsampled'] == 1
+    assert result['size_after'] < result['size_before']
+    assert len(PdfReader(pdf_path).pages) == 1
+    assert has_pdf_structure(pdf_path)
+
+def test_optimize_pdf_never_grows_output(tmp_path):
+    """Test that premium standard merges are not rewritten, and rewrites that grow a file are dropped."""
+    import shutil
+    from config import Config
+
+    pdf1 = create_simple_pdf(str(tmp_path / 'one.pdf'), 45)
+    pdf2 = create_simple_pdf(str(tmp_path / 'two.pdf'), 45)
+    plain = merge_pipeline([pdf1, pdf2], str(tmp_path / 'plain.pdf'))
+    premium = merge_pipeline([pdf1, pdf2], str(tmp_path / 'premium.pdf'),
+                             optimization={'save_options': Config.PDF_QUALITY_OPTIONS['premium']})
+    assert premium['size_after'] == premium['size_before'] == plain['size_after']
+    with open(plain['output_path'], 'rb') as a, open(premium['output_path'], 'rb') as b:
+        assert a.read() == b.read()
+
+    # Cleaning and pretty-printing content streams makes this file larger, so it is kept
+    shutil.copy(pdf1, tmp_path / 'kept.pdf')
+    result = optimize_pdf(str(tmp_path / 'kept.pdf'), {'clean': True, 'pretty': True})
+    assert result['size_after'] == result['size_before'] == os.path.getsize(pdf1)
+    assert set(os.listdir(tmp_path)) == {'one.pdf', 'two.pdf', 'plain.pdf', 'premium.pdf', 'kept.pdf'}
+
+    free = optimize_pdf(str(tmp_path / 'kept.pdf'), Config.PDF_QUALITY_OPTIONS['free'])
+    assert free['size_after'] < free['size_before']
+
+def test_write_tables(tmp_path):
+    """Test that extracted tables stream into a workbook, overflowing past the sheet limit, or a CSV zip."""
+    import zipfile
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    def tables():
+        for i in range(5):
+            yield pd.DataFrame({'row': [1, 2], 'value': [f'table {i}', float('nan')]})
+
+    assert write_xlsx(tables(), str(tmp_path / 'tables.xlsx'), max_sheets=3) == 5
+    workbook = load_workbook(str(tmp_path / 'tables.xlsx'))
+    assert workbook.sheetnames == ['Table 1', 'Table 2', 'Table 3', 'Tables 4-']
+    assert [list(row) for row in workbook['Table 1'].values] == [['row', 'value'], [1, 'table 0'], [2, None]]
+    assert workbook['Tables 4-']['A1'].value == 'Table 4'
+    assert workbook['Tables 4-']['A6'].value == 'Table 5'
+
+    assert write_csv_zip(tables(), str(tmp_path / 'tables.zip')) == 5
+    with zipfile.ZipFile(str(tmp_path / 'tables.zip')) as archive:
+        assert len(archive.namelist()) == 5
+        assert archive.read('table_5.csv').decode('utf-8').splitlines() == ['row,value', '1,table 4', '2,']
+
+def test_table_extraction_chunks_only_in_process(tmp_path, monkeypatch):
+    """Test chunk planning, and that documents are chunked only with an in-process JVM."""
+    from utils.table_extractor import TableExtractor, page_chunks
+
+    assert page_chunks(25) == ['all']
+    assert page_chunks(50) == ['1-25', '26-50']
+    assert page_chunks(60) == ['1-25', '26-50', '51-60']
+    assert page_chunks(7, pages_per_chunk=3) == ['1-3', '4-6', '7-7']
+    pdf = create_simple_pdf(str(tmp_path / 'long.pdf'), num_pages=60)
+
+    def extractor(start_jvm):
+        extractor = TableExtractor(threads=2)
+        monkeypatch.setattr(extractor, '_start_jvm', start_jvm)
+        calls = []
+        # Each "table" is the page spec it was extracted with
+        monkeypatch.setattr(extractor, '_extract', lambda path, pages, options: calls.append(pages) or [pages])
+        return extractor, calls
+
+    def no_jvm():
+        raise ImportError("No module named 'jpype'")
+
+    # Each chunk would launch its own JVM, so subprocesses extract the whole document at once
+    subprocess_extractor, calls = extractor(no_jvm)
+    assert subprocess_extractor.extract(pdf) == ['all'] and calls == ['all']
+    assert subprocess_extractor.stats()['backend'] == 'subprocess'
+    assert subprocess_extractor.stats()['jvm_startup_ms'] is None
+
+    jpype_extractor, calls = extractor(lambda: {})
+    assert jpype_extractor.extract(pdf) == ['1-25', '26-50', '51-60']
+    assert sorted(calls) == ['1-25', '26-50', '51-60']
+    assert jpype_extractor.stats()['backend'] == 'jpype'
+
+def test_pdf_to_ppt_matches_pages_to_slides(tmp_path, monkeypatch):
+    """Test that each slide gets its own page's JPEG, and a page pdftoppm cannot render fails the conversion."""
+    import subprocess
+    import fitz
+    from pptx import Presentation
+    from utils import pdf_converter
+    from utils.pdf_converter import PDFConverter, render_jpeg_page
+
+    pdf = create_simple_pdf(str(tmp_path / 'slides.pdf'), num_pages=5)
+    rendered = {}
+    broken_pages = set()
+
+    def pdftoppm(args, **kwargs):
+        # Stands in for pdftoppm, which writes the JPEG of the requested page to stdout
+        page_number = int(args[args.index('-f') + 1])
+        assert args[args.index('-l') + 1] == str(page_number)
+        data = b''
+        if page_number not in broken_pages:
+            with fitz.open(args[-1]) as document:
+                data = document[page_number - 1].get_pixmap(dpi=int(args[args.index('-r') + 1])).pil_tobytes(
+                    format='JPEG', quality=10)
+        rendered[page_number] = data
+        return subprocess.CompletedProcess(args, 0, stdout=data, stderr=b'')
+
+    monkeypatch.setattr(pdf_converter.subprocess, 'run', pdftoppm)
+    output = PDFConverter.pdf_to_ppt(pdf, str(tmp_path), dpi=20, thread_count=2)
+    slides = Presentation(output).slides
+    assert len(slides) == 5
+    assert [slide.shapes[0].image.blob for slide in slides] == [rendered[page] for page in range(1, 6)]
+
+    # End-of-image bytes inside the data are left alone; only a complete image is accepted
+    monkeypatch.setattr(pdf_converter.subprocess, 'run', lambda args, **kwargs: subprocess.CompletedProcess(
+        args, 0, stdout=b'\xff\xd8\x00\xff\xd9\x01\xff\xd9', stderr=b''))
+    assert render_jpeg_page(pdf, 1, 20, 85) == b'\xff\xd8\x00\xff\xd9\x01\xff\xd9'
+
+    monkeypatch.setattr(pdf_converter.subprocess, 'run', pdftoppm)
+    broken_pages.add(3)
+    with pytest.raises(Exception, match='page 3'):
+        PDFConverter.pdf_to_ppt(pdf, str(tmp_path), dpi=20, thread_count=2)
+
+def test_metrics_histogram():
+    """Test that histograms count observations into cumulative buckets per label set."""
+    registry = MetricsRegistry()
+    latency = registry.histogram('request_seconds', 'Request latency', ['route', 'tier'], buckets=(0.1, 1))
+    latency.observe(0.05, route='/merge', tier='free')
+    latency.observe(0.5, route='/merge', tier='free')
+    latency.observe(5, route='/merge', tier='free')
+    latency.observe(0.5, route='/convert/"word"', tier='premium')
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP request_seconds Request latency', '# TYPE request_seconds histogram']
+    assert 'request_seconds_bucket{route="/merge",tier="free",le="0.1"} 1' in lines
+    assert 'request_seconds_bucket{route="/merge",tier="free",le="1"} 2' in lines
+    assert 'request_seconds_bucket{route="/merge",tier="free",le="+Inf"} 3' in lines
+    assert 'request_seconds_sum{route="/merge",tier="free"} 5.55' in lines
+    assert 'request_seconds_count{route="/merge",tier="free"} 3' in lines
+    assert 'request_seconds_count{route="/convert/\\"word\\"",tier="premium"} 1' in lines
+
+def test_benchmark_corpora_and_compare(tmp_path):
+    """Test that benchmark corpora are reproducible and regressions against a baseline are flagged."""
+    from benchmark import generate_corpora, compare_results
+
+    first = generate_corpora(str(tmp_path / 'a'), scale=0.1, names=['small', 'fonts'])
+    second = generate_corpora(str(tmp_path / 'b'), scale=0.1, names=['small', 'fonts'])
+    assert [len(paths) for paths in first.values()] == [10, 2]
+    for path_a, path_b in zip(first['fonts'], second['fonts']):
+        with open(path_a, 'rb') as a, open(path_b, 'rb') as b:
+            assert a.read() == b.read()
+    _, total_pages = merge_pdfs(first['fonts'], str(tmp_path / 'merged.pdf'))
+    assert total_pages == 2
+
+    baseline = [{'case': 'merge:small:pypdf2', 'status': 'ok', 'seconds': 1.0, 'peak_rss_mb': 50.0, 'output_bytes': 1000},
+                {'case': 'convert:word:small', 'status': 'ok', 'seconds': 2.0, 'peak_rss_mb': 90.0, 'output_bytes': 500}]
+    results = [{'case': 'merge:small:pypdf2', 'status': 'ok', 'seconds': 1.1, 'peak_rss_mb': 80.0, 'output_bytes': 1000},
+               {'case': 'convert:word:small', 'status': 'failed', 'seconds': None, 'peak_rss_mb': 90.0,
+                'output_bytes': None}]
+    regressions = compare_results(results, baseline, threshold=0.15)
+    assert [(r['case'], r['metric']) for r in regressions] == [('merge:small:pypdf2', 'peak_rss_mb'),
+                                                               ('convert:word:small', 'status')]
+
+def test_benchmark_reports_child_process_rss(tmp_path, monkeypatch):
+    """Test that cases report the peak RSS of the processes they start, and its regressions."""
+    import subprocess
+    import benchmark
+
+    def run_operation(operation, engine, files, work_dir):
+        # Stands in for pdftoppm or the Java table extractor
+        subprocess.run([sys.executable, '-c', 'data = bytearray(96 * 1024 * 1024); data[::4096] = b"x" * len(data[::4096])'],
+                       check=True)
+        return 100
+
+    monkeypatch.setattr(benchmark, '_run_operation', run_operation)
+    result = benchmark.run_case({'case': 'convert:jpg:small', 'operation': 'jpg', 'engine': None, 'paths': [],
+                                 'pages': 2}, repeat=1)
+    assert result['status'] == 'ok' and result['peak_children_rss_mb'] >= 96
+    assert 'children' in benchmark._format_result(result)
+
+    baseline = [{'case': 'convert:jpg:small', 'status': 'ok', 'peak_children_rss_mb': 40.0},
+                {'case': 'convert:ppt:small', 'status': 'ok'}]  # Recorded before child RSS was reported
+    results = [dict(result, peak_rss_mb=None, seconds=None, output_bytes=None),
+               {'case': 'convert:ppt:small', 'status': 'ok', 'peak_children_rss_mb': 150.0}]
+    assert [(r['case'], r['metric']) for r in benchmark.compare_results(results, baseline)] == [
+        ('convert:jpg:small', 'peak_children_rss_mb')]
+
+def test_jpg_rendering_stops_when_consumer_does(tmp_path, monkeypatch):
+    """Test that closing the page iterator early cancels page ranges not yet rendered, without waiting."""
+    import types
+    import threading
+    from utils import pdf_converter
+
+    calls = []
+    rendering, unblock = threading.Event(), threading.Event()
+
+    def convert_from_path(pdf_path, output_folder, first_page, last_page, output_file, **kwargs):
+        calls.append((first_page, last_page))
+        if first_page > 1:
+            rendering.set()
+            unblock.wait(10)
+        paths = []
+        for page_number in range(first_page, last_page + 1):
+            paths.append(os.path.join(output_folder, f'{output_file}-{page_number:02d}.jpg'))
+            with open(paths[-1], 'wb') as f:
+                f.write(b'jpeg')
+        return paths
+
+    pdf2image = types.SimpleNamespace(pdfinfo_from_path=lambda path: {'Pages': 20},
+                                      convert_from_path=convert_from_path)
+    monkeypatch.setitem(sys.modules, 'pdf2image', pdf2image)
+    monkeypatch.setitem(pdf_converter._import_ms, 'pdf2image', 0.0)
+
+    pages = pdf_converter.PDFConverter.iter_pdf_to_jpg('doc.pdf', str(tmp_path), thread_count=1)
+    try:
+        assert os.path.basename(next(pages)) == 'page_1.jpg'
+        assert rendering.wait(5)
+        started = time.monotonic()
+        pages.close()  # Returns while the second range is still rendering
+        assert time.monotonic() - started < 5
+        assert calls == [(1, 1), (2, 5)]
+    finally:
+        unblock.set()
+    time.sleep(0.2)
+    assert calls == [(1, 1), (2, 5)]
+
+def test_pdf_to_word_parallel_matches_serial(tmp_path, monkeypatch):
+    """Test that converting page chunks with pdf2docx multi-processing gives the serial result."""
+    import zipfile
+    from utils import pdf_converter
+
+    pdf_path = create_simple_pdf(str(tmp_path / 'long.pdf'), 4)
+    monkeypatch.setattr(pdf_converter, 'WORD_PARALLEL_MIN_PAGES', 2)
+
+    serial = pdf_converter.PDFConverter.pdf_to_word(pdf_path, str(tmp_path / 'serial'))
+    parallel = pdf_converter.PDFConverter.pdf_to_word(pdf_path, str(tmp_path / 'parallel'), processes=2)
+
+    # pdf2docx's page files stay out of the working directory
+    assert not [name for name in os.listdir() if name.startswith('pages-')]
+    with zipfile.ZipFile(serial) as serial_docx, zipfile.ZipFile(parallel) as parallel_docx:
+        assert serial_docx.namelist() == parallel_docx.namelist()
+        for name in serial_docx.namelist():
+            assert serial_docx.read(name) == parallel_docx.read(name), name
+
 def merge_from_command_line():
     """Merge PDFs from command line arguments."""
     if len(sys.argv) < 3:
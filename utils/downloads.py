@@ -0,0 +1,108 @@
+import os
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from flask import Response, request, send_file
+from utils.hashing import hash_file
+
+logger = logging.getLogger(__name__)
+
+# How many file hashes are remembered for ETags
+ETAG_MEMO_SIZE = 1024
+
+_etag_memo = OrderedDict()
+_etag_lock = threading.Lock()
+
+
+def file_etag(path):
+    """
+    Strong ETag for a file: the SHA-256 of its contents
+
+    Hashes are remembered by path, size and modification time, so a file
+    is read once no matter how often it is downloaded or resumed.
+    """
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _etag_lock:
+        if memo_key in _etag_memo:
+            _etag_memo.move_to_end(memo_key)
+            return _etag_memo[memo_key]
+
+    etag = hash_file(path)
+    with _etag_lock:
+        _etag_memo[memo_key] = etag
+        while len(_etag_memo) > ETAG_MEMO_SIZE:
+            _etag_memo.popitem(last=False)
+    return etag
+
+
+def offload_path(path, locations):
+    """
+    Internal URI the front-end server serves a file from, for X-Accel-Redirect
+
+    Args:
+        path (str): File to serve
+        locations (dict): Directory -> internal location prefix
+
+    Returns:
+        str: The internal URI, or None if the file is not under any location
+    """
+    path = os.path.realpath(path)
+    for root, prefix in locations.items():
+        root = os.path.realpath(root)
+        if os.path.commonpath([path, root]) == root:
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            return prefix.rstrip('/') + '/' + relative
+    return None
+
+
+def send_download(path, download_name, offload=None, accel_locations=None, max_age=0):
+    """
+    Send a file as an attachment with a content-hash ETag and caching headers
+
+    Without offloading, the file is streamed by the app, which answers
+    If-None-Match with 304 and Range requests with 206. With ``offload``
+    set to 'x-accel' (nginx) or 'x-sendfile' (Apache, lighttpd), only the
+    headers come from the app and the front-end server sends the file and
+    handles ranges, so no worker is tied up for the transfer.
+
+    Args:
+        path (str): File to send
+        download_name (str): Filename offered to the browser
+        offload (str, optional): None, 'x-accel' or 'x-sendfile'
+        accel_locations (dict, optional): Directory -> internal location, see offload_path()
+        max_age (int, optional): Seconds browsers may reuse the download without revalidating
+
+    Returns:
+        Response: 200, 206 or 304 response
+    """
+    etag = file_etag(path)
+
+    internal = None
+    if offload == 'x-accel':
+        internal = offload_path(path, accel_locations or {})
+        if internal is None:
+            logger.warning(f"No X-Accel-Redirect location for {path}, sending it directly")
+    elif offload == 'x-sendfile':
+        internal = os.path.realpath(path)
+
+    if internal is None:
+        response = send_file(path, as_attachment=True, download_name=download_name, etag=etag, conditional=True)
+    else:
+        response = Response(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        response.headers['X-Accel-Redirect' if offload == 'x-accel' else 'X-Sendfile'] = internal
+        response.set_etag(etag)
+        response.last_modified = os.path.getmtime(path)
+        # Only If-None-Match / If-Modified-Since are answered here; ranges are left to the server
+        response.make_conditional(request)
+
+    response.headers['Accept-Ranges'] = 'bytes'
+
+    # Download links are unguessable but personal, so shared caches must not keep them
+    response.cache_control.public = False
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
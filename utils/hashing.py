@@ -0,0 +1,35 @@
+import hashlib
+
+# Read size used when hashing or copying uploads
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_and_hash(file, path):
+    """
+    Save an uploaded file and hash it in the same pass over its data
+
+    Args:
+        file: FileStorage (or any binary file-like object) to save
+        path (str): Destination path
+
+    Returns:
+        str: SHA-256 hex digest of the saved contents
+    """
+    stream = getattr(file, 'stream', file)
+    if hasattr(stream, 'seek'):
+        stream.seek(0)
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
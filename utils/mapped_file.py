@@ -0,0 +1,73 @@
+import os
+import mmap
+
+# Reads at least this large return a view into the mapping instead of a copy
+ZERO_COPY_MIN = 64 * 1024
+
+
+class MappedFile:
+    """
+    Read-only binary file object over a memory-mapped file
+
+    Parsers see an ordinary seekable file, but reads cost no system calls:
+    objects are read straight from the page cache as the parser seeks to
+    them, so only the parts of the file it resolves are ever touched. Reads
+    of ``zero_copy_min`` bytes or more (stream data such as images and fonts)
+    return memoryviews into the mapping instead of copies, so a PDF's
+    streams can be passed on to the output without being held in memory twice.
+
+    The mapping stays valid while views into it exist; close() releases it
+    as soon as the last one is gone.
+    """
+
+    def __init__(self, path, zero_copy_min=ZERO_COPY_MIN):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self.name = os.fspath(path)
+        self.size = len(self._map)
+        self.zero_copy_min = zero_copy_min
+        # Parsers call these for every token; the mapping's own methods avoid a Python call each
+        self.tell = self._map.tell
+        self.readline = self._map.readline
+
+    def read(self, size=-1):
+        if size is None or size < self.zero_copy_min:
+            return self._map.read(size)
+        start = self._map.tell()
+        end = min(self.size, start + size)
+        self._map.seek(end)
+        return self._view[start:end]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # mmap.seek() does not return the new position before Python 3.13
+        self._map.seek(offset, whence)
+        return self._map.tell()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    @property
+    def closed(self):
+        return self._map.closed
+
+    def close(self):
+        """Unmap the file, or leave that to the last view into it once it is released"""
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            # Views handed out by read() are still in use; they keep the mapping alive
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,14 +1,141 @@
+import io
 import os
+import sys
+import time
 import uuid
+import logging
+import importlib
+import tempfile
+import threading
+import subprocess
 from pathlib import Path
-from pdf2docx import Converter as DocxConverter
-from pdf2image import convert_from_path
-import tabula
-import pandas as pd
-from PyPDF2 import PdfReader
-from pptx import Presentation
-from pptx.util import Inches
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from utils.table_extractor import get_table_extractor
+from utils.table_writer import write_xlsx, write_csv_zip
+
+logger = logging.getLogger(__name__)
+
+# Pages rendered per pdftoppm call; small ranges keep the first images coming quickly
+JPG_PAGES_PER_RANGE = 4
+
+# Slide pages rendered ahead of the one being added, per render thread; their JPEGs are held in memory
+PPT_PAGES_AHEAD = 2
+
+# Documents shorter than this are converted to Word in one process, see pdf_to_word()
+WORD_PARALLEL_MIN_PAGES = 20
+
+# Resolution of 'native' slides: PowerPoint shows slides at 96 pixels per inch at 100% zoom
+NATIVE_DPI = 96
+
+# Third-party modules behind each conversion. They are slow to import (pdf2docx
+# and tabula take the better part of a second), so they are imported on first
+# use instead of when the app starts; see load_backend() and preload_backends().
+CONVERTER_BACKENDS = {
+    'word': ['pdf2docx'],
+    'jpg': ['pdf2image'],
+    'excel': ['tabula', 'pandas', 'openpyxl'],
+    'ppt': ['fitz', 'pptx', 'pptx.util']
+}
+
+_import_ms = {}  # Module name -> milliseconds its import took in this process
+_import_lock = threading.Lock()
+
+
+def load_backend(module_name):
+    """
+    Import a converter backend module, timing the import the first time
+
+    Args:
+        module_name (str): Dotted module name, e.g. 'pdf2docx'
+
+    Returns:
+        module: The imported module
+    """
+    if module_name in _import_ms:
+        return sys.modules[module_name]
+
+    with _import_lock:
+        if module_name not in _import_ms:
+            started = time.perf_counter()
+            importlib.import_module(module_name)
+            _import_ms[module_name] = round((time.perf_counter() - started) * 1000, 2)
+            logger.debug(f"Imported converter backend {module_name} in {_import_ms[module_name]} ms")
+    return sys.modules[module_name]
+
+
+def preload_backends(kinds=None):
+    """
+    Import the backends of some conversions ahead of their first request, e.g.
+    on workers dedicated to conversions; also usable as a pool initializer.
+    Preloading 'excel' also starts the table extraction JVM.
+
+    Args:
+        kinds (list, optional): Conversion kinds from CONVERTER_BACKENDS; all by default
+
+    Returns:
+        dict: Milliseconds each module took to import
+    """
+    for kind in kinds or CONVERTER_BACKENDS:
+        for module_name in CONVERTER_BACKENDS.get(kind, []):
+            try:
+                load_backend(module_name)
+            except Exception as e:
+                logger.warning(f"Could not preload converter backend {module_name}: {str(e)}")
+    if 'excel' in (kinds or CONVERTER_BACKENDS):
+        get_table_extractor().start()
+    logger.info(f"Preloaded converter backends (ms): {_import_ms}")
+    return dict(_import_ms)
+
+
+def import_report():
+    """
+    Which converter backends this process has imported and what each cost
+
+    Returns:
+        dict: Per module, whether it is loaded and its import time in milliseconds
+        (None if it was loaded before the registry saw it, e.g. by another module)
+    """
+    modules = sorted({module_name for names in CONVERTER_BACKENDS.values() for module_name in names})
+    return {
+        module_name: {
+            'loaded': module_name in sys.modules,
+            'import_ms': _import_ms.get(module_name)
+        }
+        for module_name in modules
+    }
+
+
+def render_jpeg_page(pdf_path, page_number, dpi, quality):
+    """
+    Render one page to JPEG in memory with pdftoppm
+
+    Without an output file pdftoppm writes the image to stdout. Rendering a
+    single page per call keeps every image tied to its page: several images
+    back to back could only be told apart by parsing the JPEG segments.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        page_number (int): Page to render, starting at 1
+        dpi (int): Render resolution
+        quality (int): JPEG quality (1-100)
+
+    Returns:
+        bytes: JPEG data of the page
+
+    Raises:
+        RuntimeError: If pdftoppm fails or does not produce a complete JPEG image
+    """
+    result = subprocess.run(
+        ['pdftoppm', '-jpeg', '-jpegopt', f'quality={quality},optimize=y', '-r', str(dpi),
+         '-f', str(page_number), '-l', str(page_number), pdf_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"pdftoppm failed on page {page_number}: {result.stderr.decode('utf-8', 'replace').strip()}")
+    # A complete JPEG runs from the start-of-image to the end-of-image marker
+    if not (result.stdout.startswith(b'\xff\xd8') and result.stdout.endswith(b'\xff\xd9')):
+        raise RuntimeError(f"pdftoppm did not render page {page_number}")
+    return result.stdout
 
 
 class PDFConverter:
@@ -17,13 +144,22 @@ class PDFConverter:
     """
     
     @staticmethod
-    def pdf_to_word(pdf_path, output_dir=None):
+    def pdf_to_word(pdf_path, output_dir=None, processes=1, progress_callback=None):
         """
         Convert PDF to Word document
         
+        Documents of WORD_PARALLEL_MIN_PAGES pages or more can be parsed by
+        several processes with pdf2docx's multi_processing mode, each taking a
+        contiguous chunk of pages. The parsed pages are then laid out into a
+        single document in page order, exactly as a serial conversion does, so
+        the output is the same. The working directory of this process is
+        changed while they run, so call it from a worker process.
+        
         Args:
             pdf_path (str): Path to the PDF file
             output_dir (str, optional): Directory to save the converted file
+            processes (int, optional): Processes parsing pages in parallel; 1 converts in this process
+            progress_callback (callable, optional): Progress callback, see utils.progress.ProgressReporter
             
         Returns:
             str: Path to the converted Word document
@@ -39,15 +175,35 @@ class PDFConverter:
         
         # Convert PDF to Word
         try:
-            cv = DocxConverter(pdf_path)
-            cv.convert(output_path)
-            cv.close()
+            cv = load_backend('pdf2docx').Converter(os.path.abspath(pdf_path))
+            try:
+                page_count = cv.fitz_doc.page_count
+                if progress_callback is not None:
+                    progress_callback(0, page_count, stage='convert')
+                processes = min(processes or 1, page_count)
+                if processes > 1 and page_count >= WORD_PARALLEL_MIN_PAGES:
+                    # pdf2docx hands parsed pages between its processes as pages-<n>.json files
+                    # in the working directory, so each conversion runs from a directory of its own
+                    output_path = os.path.abspath(output_path)
+                    previous_dir = os.getcwd()
+                    with tempfile.TemporaryDirectory(prefix='docx-pages-') as parts_dir:
+                        os.chdir(parts_dir)
+                        try:
+                            cv.convert(output_path, multi_processing=True, cpu_count=processes)
+                        finally:
+                            os.chdir(previous_dir)
+                else:
+                    cv.convert(output_path)
+            finally:
+                cv.close()
+            if progress_callback is not None:
+                progress_callback(page_count, page_count, stage='write', bytes_written=os.path.getsize(output_path))
             return output_path
         except Exception as e:
             raise Exception(f"Error converting PDF to Word: {str(e)}")
     
     @staticmethod
-    def pdf_to_jpg(pdf_path, output_dir=None, dpi=300):
+    def pdf_to_jpg(pdf_path, output_dir=None, dpi=300, quality=90, thread_count=None, progress_callback=None):
         """
         Convert PDF to JPG images
         
@@ -55,10 +211,36 @@ class PDFConverter:
             pdf_path (str): Path to the PDF file
             output_dir (str, optional): Directory to save the converted files
             dpi (int, optional): DPI for the output images
+            quality (int, optional): JPEG quality (1-100)
+            thread_count (int, optional): Pages rendered in parallel, defaults to the CPU count
+            progress_callback (callable, optional): Progress callback, see iter_pdf_to_jpg()
             
         Returns:
             list: List of paths to the converted JPG images
         """
+        return list(PDFConverter.iter_pdf_to_jpg(pdf_path, output_dir, dpi, quality, thread_count, progress_callback))
+    
+    @staticmethod
+    def iter_pdf_to_jpg(pdf_path, output_dir=None, dpi=300, quality=90, thread_count=None, progress_callback=None):
+        """
+        Convert PDF to JPG images, yielding each image path in page order as soon as it is written
+        
+        Page ranges are rendered in parallel by separate pdftoppm processes which
+        encode and write every page as they go, so no decoded page images are
+        held in memory here and memory use does not grow with the page count.
+        
+        Args:
+            pdf_path (str): Path to the PDF file
+            output_dir (str, optional): Directory to save the converted files
+            dpi (int, optional): DPI for the output images
+            quality (int, optional): JPEG quality (1-100)
+            thread_count (int, optional): Pages rendered in parallel, defaults to the CPU count
+            progress_callback (callable, optional): Called with stage 'render' as each
+                page is yielded, see utils.progress.ProgressReporter
+            
+        Yields:
+            str: Path to the next converted JPG image
+        """
         if output_dir is None:
             output_dir = os.path.join(os.getcwd(), 'converted', 'jpg')
             
@@ -71,65 +253,137 @@ class PDFConverter:
         
         # Convert PDF to images
         try:
-            images = convert_from_path(pdf_path, dpi=dpi)
-            image_paths = []
+            pdf2image = load_backend('pdf2image')
+            page_count = pdf2image.pdfinfo_from_path(pdf_path)['Pages']
+            thread_count = max(1, min(thread_count or os.cpu_count() or 1, page_count))
+            
+            def render_range(first_page, last_page):
+                # pdftoppm writes each page to disk as soon as it is rendered
+                paths = pdf2image.convert_from_path(
+                    pdf_path, dpi=dpi, output_folder=output_folder,
+                    first_page=first_page, last_page=last_page,
+                    fmt='jpeg', jpegopt={'quality': quality, 'optimize': True},
+                    output_file=f"range_{first_page}", paths_only=True
+                )
+                image_paths = []
+                for page_number, path in zip(range(first_page, last_page + 1), sorted(paths)):
+                    image_path = os.path.join(output_folder, f"page_{page_number}.jpg")
+                    os.replace(path, image_path)
+                    image_paths.append(image_path)
+                return image_paths
             
-            for i, image in enumerate(images):
-                image_path = os.path.join(output_folder, f"page_{i+1}.jpg")
-                image.save(image_path, "JPEG")
-                image_paths.append(image_path)
-                
-            return image_paths
+            # The first page gets a range of its own so it is ready as early as possible
+            ranges = [(1, 1)] + [
+                (first, min(first + JPG_PAGES_PER_RANGE - 1, page_count))
+                for first in range(2, page_count + 1, JPG_PAGES_PER_RANGE)
+            ]
+            
+            executor = ThreadPoolExecutor(max_workers=thread_count)
+            futures = []
+            try:
+                futures = [executor.submit(render_range, first, last) for first, last in ranges]
+                pages_rendered = 0
+                bytes_written = 0
+                for future in futures:
+                    for image_path in future.result():
+                        if progress_callback is not None:
+                            pages_rendered += 1
+                            bytes_written += os.path.getsize(image_path)
+                            progress_callback(pages_rendered, page_count, stage='render', bytes_written=bytes_written)
+                        yield image_path
+            finally:
+                # When the consumer stops early (the client disconnected) or a range failed,
+                # ranges not started yet are dropped instead of rendered for nobody
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False, cancel_futures=True)
         except Exception as e:
             raise Exception(f"Error converting PDF to JPG: {str(e)}")
     
     @staticmethod
-    def pdf_to_excel(pdf_path, output_dir=None):
+    def pdf_to_excel(pdf_path, output_dir=None, output_format='xlsx', progress_callback=None):
         """
         Convert PDF to Excel spreadsheet
         
+        Tables are written as they are extracted, so memory stays bounded
+        however many tables the document has.
+        
         Args:
             pdf_path (str): Path to the PDF file
             output_dir (str, optional): Directory to save the converted file
+            output_format (str, optional): 'xlsx' for a workbook with a sheet per table,
+                or 'csv' for a ZIP archive with a CSV file per table
+            progress_callback (callable, optional): Progress callback, see utils.progress.ProgressReporter
             
         Returns:
-            str: Path to the converted Excel file
+            str: Path to the converted Excel file (or ZIP archive)
         """
+        if output_format not in ('xlsx', 'csv'):
+            raise ValueError(f"Unknown table output format: {output_format}")
+            
         if output_dir is None:
             output_dir = os.path.join(os.getcwd(), 'converted', 'excel')
             
         os.makedirs(output_dir, exist_ok=True)
         
         # Generate a unique filename
-        output_filename = f"{uuid.uuid4()}.xlsx"
+        output_filename = f"{uuid.uuid4()}.{'zip' if output_format == 'csv' else 'xlsx'}"
         output_path = os.path.join(output_dir, output_filename)
         
         # Convert PDF to Excel
         try:
-            # Read tables from PDF
-            tables = tabula.read_pdf(pdf_path, pages='all', multiple_tables=True)
+            load_backend('tabula')
             
-            # Create Excel writer
-            with pd.ExcelWriter(output_path) as writer:
-                for i, table in enumerate(tables):
-                    table.to_excel(writer, sheet_name=f'Sheet{i+1}', index=False)
+            # Read tables from PDF with the worker's long-lived tabula-java, writing each as it arrives
+            extractor = get_table_extractor()
+            extractor.start()
+            started = time.perf_counter()
+            tables = extractor.iter_tables(pdf_path)
+            if output_format == 'csv':
+                table_count = write_csv_zip(tables, output_path, progress_callback)
+            else:
+                table_count = write_xlsx(tables, output_path, progress_callback)
+            convert_ms = round((time.perf_counter() - started) * 1000, 2)
+            stats = extractor.stats()
+            startup = f", JVM startup {stats['jvm_startup_ms']} ms" if stats['jvm_startup_ms'] is not None else ''
+            logger.info(f"Wrote {table_count} tables from {os.path.basename(pdf_path)} in {convert_ms} ms "
+                        f"({stats['backend']}{startup})")
                     
+            if progress_callback is not None:
+                progress_callback(table_count, table_count, stage='write', bytes_written=os.path.getsize(output_path))
             return output_path
         except Exception as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
             raise Exception(f"Error converting PDF to Excel: {str(e)}")
     
     @staticmethod
-    def pdf_to_ppt(pdf_path, output_dir=None):
+    def pdf_to_ppt(pdf_path, output_dir=None, page_size='fit', dpi=None, quality=85, thread_count=None,
+                   progress_callback=None):
         """
         Convert PDF to PowerPoint presentation
         
+        Pages are rendered to JPEG in memory by parallel pdftoppm processes and
+        handed straight to python-pptx, so no image files are written. Slide
+        geometry comes from the PDF's page sizes.
+        
         Args:
             pdf_path (str): Path to the PDF file
             output_dir (str, optional): Directory to save the converted file
+            page_size (str, optional): 'fit' scales each page to fill a standard 10x7.5in
+                slide; 'native' sizes slides like the first page and places every page
+                at its own size, rendered at screen resolution for a smaller file
+            dpi (int, optional): Render resolution; 200 for 'fit' and NATIVE_DPI for 'native' by default
+            quality (int, optional): JPEG quality (1-100)
+            thread_count (int, optional): Pages rendered in parallel, defaults to the CPU count
+            progress_callback (callable, optional): Progress callback, see utils.progress.ProgressReporter
             
         Returns:
             str: Path to the converted PowerPoint file
         """
+        if page_size not in ('fit', 'native'):
+            raise ValueError(f"Unknown slide page size: {page_size}")
+            
         if output_dir is None:
             output_dir = os.path.join(os.getcwd(), 'converted', 'ppt')
             
@@ -141,39 +395,66 @@ class PDFConverter:
         
         # Convert PDF to PowerPoint
         try:
-            # First convert PDF pages to images
-            image_paths = PDFConverter.pdf_to_jpg(pdf_path, dpi=200)
+            fitz = load_backend('fitz')
+            Presentation = load_backend('pptx').Presentation
+            Pt = load_backend('pptx.util').Pt
+            
+            # Page sizes in points, as displayed (rotation applied)
+            with fitz.open(pdf_path) as document:
+                page_sizes = [(page.rect.width, page.rect.height) for page in document]
+            if not page_sizes:
+                raise ValueError("PDF has no pages")
+            page_count = len(page_sizes)
+            dpi = dpi or (NATIVE_DPI if page_size == 'native' else 200)
+            thread_count = max(1, min(thread_count or os.cpu_count() or 1, page_count))
             
             # Create a PowerPoint presentation
             prs = Presentation()
+            if page_size == 'native':
+                prs.slide_width = Pt(page_sizes[0][0])
+                prs.slide_height = Pt(page_sizes[0][1])
             
-            # Add each image as a slide
-            for image_path in image_paths:
-                slide = prs.slides.add_slide(prs.slide_layouts[6])  # Blank layout
-                
-                # Add the image to the slide
-                img = Image.open(image_path)
-                width, height = img.size
-                
-                # Calculate aspect ratio
-                aspect_ratio = width / height
-                
-                # Set slide dimensions (adjust as needed)
-                if aspect_ratio > 1:  # Landscape
-                    slide_width = Inches(10)
-                    slide_height = slide_width / aspect_ratio
-                else:  # Portrait
-                    slide_height = Inches(7.5)
-                    slide_width = slide_height * aspect_ratio
-                
-                # Add picture to slide
-                slide.shapes.add_picture(image_path, Inches(0), Inches(0), width=slide_width, height=slide_height)
+            # Pages render in parallel, a few ahead of the slide being added
+            ahead = thread_count * PPT_PAGES_AHEAD
+            with ThreadPoolExecutor(max_workers=thread_count) as executor:
+                futures = {page_number: executor.submit(render_jpeg_page, pdf_path, page_number, dpi, quality)
+                           for page_number in range(1, min(ahead, page_count) + 1)}
+                try:
+                    for slide_number in range(1, page_count + 1):
+                        image_data = futures.pop(slide_number).result()
+                        if slide_number + ahead <= page_count:
+                            futures[slide_number + ahead] = executor.submit(
+                                render_jpeg_page, pdf_path, slide_number + ahead, dpi, quality)
+                        width_pt, height_pt = page_sizes[slide_number - 1]
+                        
+                        # Fit the page into the slide, at most at its own size in native mode
+                        scale = min(prs.slide_width / Pt(width_pt), prs.slide_height / Pt(height_pt))
+                        if page_size == 'native':
+                            scale = min(scale, 1.0)
+                        width = int(Pt(width_pt) * scale)
+                        height = int(Pt(height_pt) * scale)
+                        
+                        # Add the page image centred on a blank slide
+                        slide = prs.slides.add_slide(prs.slide_layouts[6])
+                        slide.shapes.add_picture(io.BytesIO(image_data), (prs.slide_width - width) // 2,
+                                                 (prs.slide_height - height) // 2, width=width, height=height)
+                        if progress_callback is not None:
+                            progress_callback(slide_number, page_count, stage='render')
+                except BaseException:
+                    # Don't render the rest of a conversion that failed
+                    for future in futures.values():
+                        future.cancel()
+                    raise
             
             # Save the presentation
             prs.save(output_path)
+            if progress_callback is not None:
+                progress_callback(slide_number, page_count, stage='write', bytes_written=os.path.getsize(output_path))
             
             return output_path
         except Exception as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
             raise Exception(f"Error converting PDF to PowerPoint: {str(e)}")
 
     @staticmethod
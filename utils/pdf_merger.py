@@ -1,134 +1,859 @@
+import io
 import os
+import re
+import hashlib
 import tempfile
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple
 from werkzeug.datastructures import FileStorage
-from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2 import PdfReader, PdfWriter, PasswordType
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, StreamObject
+
+from utils.timing import StageTimer
+from utils.mapped_file import MappedFile
+from utils.pdf_optimizer import optimize_pdf
 
 logger = logging.getLogger(__name__)
 
+# How far from either end of the file the structural check looks for markers
+STRUCTURE_CHECK_WINDOW = 2048
+
+# Object references in PyMuPDF object source, skipping over literal and hex strings
+REFERENCE_PATTERN = re.compile(r'\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>|(\d+) 0 R\b')
+
+# One entry of a page selection: FILE[:PAGES][@ROTATION]
+PAGE_SPEC_ENTRY = re.compile(r'(\d+)(?::(\d+(?:-\d*)?(?:,\d+(?:-\d*)?)*))?(?:@(-?\d+))?')
+
+# Inputs at least this large are memory-mapped by the PyPDF2 engine, see MappedFile. Their stream
+# data is then shared with the page cache instead of copied; smaller files parse faster buffered
+MMAP_MIN_SIZE = 8 * 1024 * 1024
+
+# Deduplication stops after this many passes; each pass can expose objects that
+# only differed in references to streams merged by the previous pass
+MAX_DEDUPLICATION_PASSES = 3
+
 class PDFMergeError(Exception):
-    pass
+    def __init__(self, message, invalid_files=None):
+        super().__init__(message)
+        self.invalid_files = invalid_files or []
 
-def merge_pdfs(files, output_path, pdf_format='standard'):
+    def __reduce__(self):
+        # Keep invalid_files when the error crosses a process boundary
+        return self.__class__, (str(self), self.invalid_files)
+
+class OpenedPDF:
     """
-    Merge PDF files into a single PDF document
-    Returns: (output_path, total_pages)
-    
+    A PDF that has been opened and parsed once.
+
+    The document (a PyPDF2 reader or a PyMuPDF document, depending on the
+    engine that opened it) is kept open so validation and merging share a
+    single parse of the xref table and trailer. Engines hold ``lock`` while
+    copying pages out of it, so merges on several threads can share it.
+    """
+
+    def __init__(self, document, filename, page_count, is_encrypted, path=None, handle=None, engine='pypdf2'):
+        self.document = document
+        self.filename = filename
+        self.page_count = page_count
+        self.is_encrypted = is_encrypted
+        self.path = path
+        self.engine = engine
+        self.lock = threading.Lock()
+        self._handle = handle
+
+    def close(self):
+        """Close the underlying file or document if it was opened by a merge engine"""
+        if self._handle is not None:
+            try:
+                self._handle.close()
+            except Exception as e:
+                logger.warning(f"Failed to close {self.filename}: {str(e)}")
+            self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _resolve_source(source, filename):
+    """Return (path, filename) for a path source, or (None, filename) for a file-like one"""
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        if not os.path.exists(path):
+            raise PDFMergeError(f"File not found: {path}")
+        return path, filename or os.path.basename(path)
+    return None, filename or getattr(source, 'filename', None) or 'unknown'
+
+class PageSelection:
+    """Pages of one opened input to copy into the merged document, in order"""
+
+    def __init__(self, document, pages, rotation=0):
+        self.document = document
+        self.pages = pages  # 0-based page numbers
+        self.rotation = rotation  # Clockwise degrees added to each page's rotation
+
+    def runs(self):
+        """Split the pages into (first, last) runs of consecutive pages, either ascending or descending"""
+        runs = []
+        for page in self.pages:
+            if runs:
+                first, last = runs[-1]
+                step = last - first
+                if page - last in (1, -1) and (step == 0 or (page - last) * step > 0):
+                    runs[-1] = (first, page)
+                    continue
+            runs.append((page, page))
+        return runs
+
+def parse_page_spec(spec):
+    """
+    Parse a page selection such as "1:1-3 2 3:10@90"
+
+    Entries are separated by spaces or semicolons and copied in the order
+    given, so files and pages can be reordered or repeated. Each entry is
+    FILE[:PAGES][@ROTATION]: FILE is the 1-based position of the input,
+    PAGES a comma separated list of N, N-M (M-N for reverse order) and N-
+    (to the last page), all pages if omitted, and ROTATION a clockwise
+    multiple of 90 degrees.
+
+    Returns:
+        list: (file_index, ranges, rotation) entries with a 0-based file index;
+        ranges is a list of 1-based (first, last) pairs, last None meaning the
+        last page, or None for every page
+
+    Raises:
+        PDFMergeError: If the selection is malformed
+    """
+    entries = []
+    for token in re.split(r'[;\s]+', spec.strip()):
+        if not token:
+            continue
+        match = PAGE_SPEC_ENTRY.fullmatch(token)
+        if not match:
+            raise PDFMergeError(f"Invalid page selection '{token}'")
+
+        file_number, pages, rotation = match.groups()
+        rotation = int(rotation or 0)
+        if int(file_number) < 1:
+            raise PDFMergeError(f"Invalid file number in page selection '{token}'")
+        if rotation % 90:
+            raise PDFMergeError(f"Rotation must be a multiple of 90 degrees in '{token}'")
+
+        ranges = None
+        if pages:
+            ranges = []
+            for part in pages.split(','):
+                first, dash, last = part.partition('-')
+                first = int(first)
+                last = (int(last) if last else None) if dash else first
+                if first < 1 or last == 0:
+                    raise PDFMergeError(f"Page numbers start at 1 in '{token}'")
+                ranges.append((first, last))
+
+        entries.append((int(file_number) - 1, ranges, rotation % 360))
+
+    if not entries:
+        raise PDFMergeError("Page selection is empty")
+    return entries
+
+def resolve_page_selection(entries, documents):
+    """
+    Turn parse_page_spec() entries into PageSelections of opened documents
+
+    Only page numbers are computed here; page objects are loaded when merged.
+
     Args:
-        files: List of file paths or FileStorage objects
-        output_path: Path to save the merged PDF
-        pdf_format: Format to use for the merged PDF (not used - kept for compatibility)
+        entries: (file_index, ranges, rotation) entries, or None for every page
+            of every document in order
+        documents: OpenedPDF handles indexed by file index
+
+    Raises:
+        PDFMergeError: If an entry refers to a missing file or page
     """
-    file_objects = []
-    opened_files = []  # Keep track of files we opened ourselves
-    temp_path = None
-    
-    try:
-        logger.debug(f"Starting PDF merge: {len(files)} files")
-        
-        # Validate and prepare files
-        if isinstance(files[0], str):
-            # Process file paths
-            logger.debug(f"Processing file paths: {files}")
-            
-            # Open each file for processing
-            for f in files:
-                if not os.path.exists(f):
-                    raise PDFMergeError(f"File not found: {f}")
-                    
-                try:
-                    file_obj = open(f, 'rb')
-                    file_objects.append(file_obj)
-                    opened_files.append(file_obj)
-                except Exception as e:
-                    raise PDFMergeError(f"Cannot open file {f}: {str(e)}")
+    if entries is None:
+        return [PageSelection(pdf, range(pdf.page_count)) for pdf in documents]
+
+    selections = []
+    for file_index, ranges, rotation in entries:
+        if file_index >= len(documents):
+            raise PDFMergeError(f"Page selection refers to file {file_index + 1}, but only {len(documents)} files were given")
+        pdf = documents[file_index]
+
+        pages = []
+        for first, last in ranges or [(1, None)]:
+            last = pdf.page_count if last is None else last
+            if max(first, last) > pdf.page_count:
+                raise PDFMergeError(f"Page {max(first, last)} is out of range for {pdf.filename} ({pdf.page_count} pages)")
+            step = 1 if last >= first else -1
+            pages.extend(range(first - 1, last - 1 + step, step))
+        selections.append(PageSelection(pdf, pages, rotation))
+
+    return selections
+
+class MergeEngine:
+    """
+    Interface of a PDF merge backend.
+
+    An engine opens inputs into OpenedPDF handles, appends their pages into
+    a merged document and writes that document out.
+    """
+
+    name = None
+
+    # Whether merges may run on several threads at once, sharing opened inputs
+    thread_safe = False
+
+    # Whether the engine writes while it merges, see StreamingEngine.merge_to_file()
+    streaming = False
+
+    def open(self, source, filename=None):
+        """Open and parse a PDF once; raises PDFMergeError if it is unusable"""
+        raise NotImplementedError
+
+    def merge(self, selections, progress_callback=None):
+        """Append the pages of a list of PageSelections, returning the merged document"""
+        raise NotImplementedError
+
+    def deduplicate(self, merged):
+        """
+        Store identical streams (fonts, images, ...) of a merged document only once
+
+        Returns:
+            dict: duplicate_streams removed and bytes_saved
+        """
+        raise NotImplementedError
+
+    def write(self, merged, path):
+        """Write a merged document to path"""
+        raise NotImplementedError
+
+class PyPDF2Engine(MergeEngine):
+    """Pure Python engine built on PyPDF2's PdfWriter.add_page()"""
+
+    name = 'pypdf2'
+    thread_safe = True
+
+    def open(self, source, filename=None):
+        path, filename = _resolve_source(source, filename)
+        handle = None
+        if path is not None:
+            try:
+                handle = MappedFile(path) if os.path.getsize(path) >= MMAP_MIN_SIZE else open(path, 'rb')
+            except Exception as e:
+                raise PDFMergeError(f"Cannot open file {path}: {str(e)}")
+            stream = handle
         else:
-            # Process FileStorage objects
-            logger.debug("Processing FileStorage objects")
-            file_objects = files
-        
-        # Create output directory if it doesn't exist
-        output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir, exist_ok=True)
-        
-        # Create a temporary file for the output to prevent partial writes
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', dir=output_dir) as temp_file:
-            temp_path = temp_file.name
-        
-        # Initialize PDF writer
+            stream = source
+            if hasattr(stream, 'seek'):
+                stream.seek(0)
+
+        try:
+            reader = PdfReader(stream)
+            is_encrypted = reader.is_encrypted
+            if is_encrypted and isinstance(handle, MappedFile):
+                # Decrypted data replaces the mapped stream data anyway; parse from an ordinary file
+                handle.close()
+                handle = stream = open(path, 'rb')
+                reader = PdfReader(stream)
+            if is_encrypted and reader.decrypt('') == PasswordType.NOT_DECRYPTED:
+                raise PDFMergeError(f"PDF is password protected: {filename}")
+            page_count = len(reader.pages)
+            if page_count == 0:
+                raise PDFMergeError(f"PDF has no pages: {filename}")
+        except PDFMergeError:
+            if handle is not None:
+                handle.close()
+            raise
+        except Exception as e:
+            if handle is not None:
+                handle.close()
+            raise PDFMergeError(f"Error processing PDF {filename}: {str(e)}")
+
+        return OpenedPDF(reader, filename, page_count, is_encrypted, path=path, handle=handle, engine=self.name)
+
+    def merge(self, selections, progress_callback=None):
         merger = PdfWriter()
         total_pages = 0
-        
-        # Process each input PDF
-        for i, file in enumerate(file_objects):
+        expected_pages = sum(len(selection.pages) for selection in selections)
+        # Checked once, so the loop does not format messages that would be dropped
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        for i, selection in enumerate(selections):
+            pdf = selection.document
+            filename = pdf.filename
+            if debug:
+                logger.debug(f"Processing selection {i+1}/{len(selections)}: {filename}, {len(selection.pages)} pages")
+
             try:
-                # Get file name for better error messages
-                filename = getattr(file, 'filename', f"file_{i+1}")
-                logger.debug(f"Processing PDF {i+1}/{len(file_objects)}: {filename}")
-                
-                # Ensure file pointer is at the beginning
-                if hasattr(file, 'seek'):
-                    file.seek(0)
-                
-                # Load the PDF and validate it
-                try:
-                    pdf = PdfReader(file)
-                    
-                    # Check for empty PDF
-                    if len(pdf.pages) == 0:
-                        raise PDFMergeError(f"PDF has no pages: {filename}")
-                        
-                    # Add each page from this PDF
-                    logger.debug(f"Adding {len(pdf.pages)} pages from {filename}")
-                    for page_num in range(len(pdf.pages)):
+                # Add the selected pages from this PDF; other pages are never loaded. Pages are
+                # cloned into the writer, so the reader is not used again once they are added
+                with pdf.lock:
+                    for count, page_num in enumerate(selection.pages, start=1):
                         try:
-                            # Add the page with all content
-                            page = pdf.pages[page_num]
-                            merger.add_page(page)
-                            
-                            # Try to preserve annotations if they exist
-                            if '/Annots' in page:
-                                try:
-                                    merger.add_annotation(page['/Annots'])
-                                except Exception as e:
-                                    logger.warning(f"Could not preserve annotations on page {page_num}: {str(e)}")
+                            # Add the page with all content; its /Annots are copied along with it
+                            page = pdf.document.pages[page_num]
+                            added = merger.add_page(page)
+                            if selection.rotation:
+                                added.rotate(selection.rotation)
+
+                            if progress_callback is not None:
+                                progress_callback(total_pages + count, expected_pages, file=i + 1, files=len(selections))
                         except Exception as page_error:
                             logger.error(f"Error adding page {page_num} from {filename}: {str(page_error)}")
                             raise PDFMergeError(f"Error adding page {page_num} from {filename}: {str(page_error)}")
-                    
-                    # Update total page count
-                    total_pages += len(pdf.pages)
-                    
-                except Exception as e:
-                    raise PDFMergeError(f"Error processing PDF {filename}: {str(e)}")
-                
+
+                # Update total page count
+                total_pages += len(selection.pages)
+
             except PDFMergeError:
                 raise
             except Exception as e:
                 logger.error(f"Error processing PDF {filename}: {str(e)}", exc_info=True)
                 raise PDFMergeError(f"Error processing PDF {filename}: {str(e)}")
-        
+
+        return merger
+
+    def deduplicate(self, merged):
+        duplicate_streams = 0
+        bytes_saved = 0
+
+        for _ in range(MAX_DEDUPLICATION_PASSES):
+            canonical = {}
+            duplicates = {}
+            for idnum, obj in enumerate(merged._objects, start=1):
+                if not isinstance(obj, StreamObject):
+                    continue
+                digest = self._stream_digest(obj)
+                if digest in canonical:
+                    duplicates[idnum] = canonical[digest]
+                    bytes_saved += len(obj._data)
+                else:
+                    canonical[digest] = idnum
+
+            if not duplicates:
+                break
+
+            for obj in merged._objects:
+                self._remap_references(merged, obj, duplicates)
+            for idnum in duplicates:
+                # Keep the slot so object numbers do not shift; null objects cost a few bytes
+                merged._objects[idnum - 1] = NullObject()
+            duplicate_streams += len(duplicates)
+
+        return {'duplicate_streams': duplicate_streams, 'bytes_saved': bytes_saved}
+
+    @staticmethod
+    def _stream_digest(obj):
+        header = io.BytesIO()
+        DictionaryObject(obj).write_to_stream(header, None)
+        # Hashed in parts, so stream data (possibly a view of a mapped input) is not copied
+        digest = hashlib.sha256(header.getvalue())
+        digest.update(b'\0')
+        digest.update(obj._data)
+        return digest.digest()
+
+    @staticmethod
+    def _remap_references(writer, root, duplicates):
+        """Point references to duplicate objects at the kept copy, without following references"""
+        stack = [root]
+        while stack:
+            container = stack.pop()
+            if isinstance(container, DictionaryObject):
+                items = list(container.items())
+            elif isinstance(container, ArrayObject):
+                items = list(enumerate(container))
+            else:
+                continue
+            for key, value in items:
+                if isinstance(value, IndirectObject):
+                    if value.pdf is writer and value.idnum in duplicates:
+                        container[key] = IndirectObject(duplicates[value.idnum], 0, writer)
+                elif isinstance(value, (DictionaryObject, ArrayObject)):
+                    stack.append(value)
+
+    def write(self, merged, path):
+        with open(path, 'wb') as output_file:
+            merged.write(output_file)
+
+class PyMuPDFEngine(MergeEngine):
+    """Engine built on PyMuPDF's insert_pdf(), which copies pages in C"""
+
+    name = 'pymupdf'
+
+    def __init__(self):
+        import fitz  # Raises ImportError if PyMuPDF is not installed
+        self.fitz = fitz
+
+    def open(self, source, filename=None):
+        path, filename = _resolve_source(source, filename)
+        try:
+            if path is not None:
+                document = self.fitz.open(path, filetype='pdf')
+            else:
+                if hasattr(source, 'seek'):
+                    source.seek(0)
+                document = self.fitz.open(stream=source.read(), filetype='pdf')
+        except Exception as e:
+            raise PDFMergeError(f"Error processing PDF {filename}: {str(e)}")
+
+        is_encrypted = document.is_encrypted
+        if document.needs_pass and not document.authenticate(''):
+            document.close()
+            raise PDFMergeError(f"PDF is password protected: {filename}")
+        page_count = document.page_count
+        if page_count == 0:
+            document.close()
+            raise PDFMergeError(f"PDF has no pages: {filename}")
+
+        return OpenedPDF(document, filename, page_count, is_encrypted, path=path, handle=document, engine=self.name)
+
+    def merge(self, selections, progress_callback=None):
+        merged = self.fitz.open()
+        total_pages = 0
+        expected_pages = sum(len(selection.pages) for selection in selections)
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        try:
+            for i, selection in enumerate(selections):
+                pdf = selection.document
+                if debug:
+                    logger.debug(f"Processing selection {i+1}/{len(selections)}: {pdf.filename}")
+                try:
+                    # Pages (with links and annotations) are copied a run of pages at a time
+                    for first, last in selection.runs():
+                        merged.insert_pdf(pdf.document, from_page=first, to_page=last)
+                    if selection.rotation:
+                        # insert_pdf(rotate=...) sets an absolute rotation; selections rotate relatively
+                        for page_num in range(total_pages, total_pages + len(selection.pages)):
+                            page = merged[page_num]
+                            page.set_rotation((page.rotation + selection.rotation) % 360)
+                except Exception as e:
+                    logger.error(f"Error processing PDF {pdf.filename}: {str(e)}", exc_info=True)
+                    raise PDFMergeError(f"Error processing PDF {pdf.filename}: {str(e)}")
+
+                total_pages += len(selection.pages)
+                if progress_callback is not None:
+                    progress_callback(total_pages, expected_pages, file=i + 1, files=len(selections))
+        except Exception:
+            merged.close()
+            raise
+
+        return merged
+
+    def deduplicate(self, merged):
+        removed = set()
+        bytes_saved = 0
+
+        for _ in range(MAX_DEDUPLICATION_PASSES):
+            canonical = {}
+            duplicates = {}
+            for xref in range(1, merged.xref_length()):
+                if xref in removed or not merged.xref_is_stream(xref):
+                    continue
+                raw = merged.xref_stream_raw(xref)
+                digest = hashlib.sha256(merged.xref_object(xref, compressed=True).encode('utf-8') + b'\0' + raw).digest()
+                if digest in canonical:
+                    duplicates[xref] = canonical[digest]
+                    bytes_saved += len(raw)
+                else:
+                    canonical[digest] = xref
+
+            if not duplicates:
+                break
+
+            def remap(match):
+                if match.group(1) is None or int(match.group(1)) not in duplicates:
+                    return match.group(0)
+                return f"{duplicates[int(match.group(1))]} 0 R"
+
+            removed.update(duplicates)
+            for xref in range(1, merged.xref_length()):
+                if xref in removed:
+                    continue
+                source = merged.xref_object(xref, compressed=True)
+                remapped = REFERENCE_PATTERN.sub(remap, source)
+                if remapped != source:
+                    # Only the object dictionary is replaced; a stream's data is kept
+                    merged.update_object(xref, remapped)
+
+        return {'duplicate_streams': len(removed), 'bytes_saved': bytes_saved}
+
+    def write(self, merged, path):
+        try:
+            # garbage=1 drops the duplicates that deduplicate() left unreferenced
+            merged.save(path, garbage=1)
+        finally:
+            merged.close()
+
+class StreamingWriter:
+    """
+    Writes a merged PDF object by object, see StreamingEngine
+
+    Objects are numbered in the order they are written. Only their offsets,
+    the object numbers given to each input's objects and the digests of
+    written streams are kept; the page tree, catalog, xref table and trailer
+    are written by finish().
+    """
+
+    # Page entries not copied: the page tree and structure tree are not carried over,
+    # /B (article beads) would pull in other pages, and /Rotate is recomputed
+    SKIPPED_PAGE_KEYS = ('/Parent', '/StructParents', '/B', '/Rotate')
+
+    # Reserved object numbers
+    CATALOG = 1
+    PAGE_TREE = 2
+
+    def __init__(self, path, version, deduplicate=True):
+        self._file = open(path, 'wb')
+        self._position = 0
+        self._offsets = [None, None, None]  # By object number; 0 is the free list head
+        self._digests = {}  # Stream digest -> object number
+        self._kids = []
+        self.deduplicate = deduplicate
+        self.duplicate_streams = 0
+        self.bytes_saved = 0
+        self._emit(b"%s\n%%\xe2\xe3\xcf\xd3\n" % version.encode('ascii'))
+
+    def _emit(self, data):
+        self._position += self._file.write(data)
+
+    def allocate(self):
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def write_object(self, number, body, data=None):
+        """Write object ``number``; body is its serialized value, data the raw stream data if it is a stream"""
+        self._offsets[number] = self._position
+        self._emit(b"%d 0 obj\n" % number)
+        self._emit(body)
+        if data is not None:
+            self._emit(b"\nstream\n")
+            self._emit(data)
+            self._emit(b"\nendstream")
+        self._emit(b"\nendobj\n")
+
+    def add_page(self, source, page, rotation, number):
+        """Write a page of a source document as object ``number`` of the page tree"""
+        body = io.BytesIO()
+        body.write(b"<<")
+        for key, value in page.items():
+            if key in self.SKIPPED_PAGE_KEYS:
+                continue
+            NameObject(key).write_to_stream(body, None)
+            body.write(b" ")
+            self._serialize(source, value, body)
+            body.write(b"\n")
+        rotate = (int(page.get('/Rotate', 0)) + rotation) % 360
+        if rotate:
+            body.write(b"/Rotate %d\n" % rotate)
+        body.write(b"/Parent %d 0 R>>" % self.PAGE_TREE)
+        self.write_object(number, body.getvalue())
+        self._kids.append(number)
+
+    def reference(self, source, ref):
+        """Output object number of a reference into a source document, copying the object on first use"""
+        key = (ref.idnum, ref.generation)
+        numbers = source['numbers']
+        if key in numbers:
+            return numbers[key]
+        if key in source['pending']:
+            # A cycle leads back to a stream being serialized; give it its number now
+            numbers[key] = self.allocate()
+            return numbers[key]
+
+        value = ref.get_object()
+        if isinstance(value, DictionaryObject) and value.get('/Type') in ('/Page', '/Pages'):
+            # Links to pages stay only if the page is in the output
+            numbers[key] = source['pages'].get(ref.idnum)
+            return numbers[key]
+
+        body = io.BytesIO()
+        if not isinstance(value, StreamObject):
+            # Numbered before its children are copied, so references back to it resolve
+            number = numbers[key] = self.allocate()
+            self._serialize(source, value, body)
+            self.write_object(number, body.getvalue())
+            return number
+
+        # Streams are written after their children, so identical streams serialize identically
+        source['pending'].add(key)
+        self._serialize(source, value, body)
+        source['pending'].discard(key)
+        body = body.getvalue()
+        number = numbers.get(key)
+        if number is None and self.deduplicate:
+            digest = hashlib.sha256(body)
+            digest.update(b'\0')
+            digest.update(value._data)
+            digest = digest.digest()
+            number = self._digests.get(digest)
+            if number is not None:
+                numbers[key] = number
+                self.duplicate_streams += 1
+                self.bytes_saved += len(value._data)
+                return number
+            number = self._digests[digest] = self.allocate()
+        elif number is None:
+            number = self.allocate()
+        numbers[key] = number
+        self.write_object(number, body, value._data)
+        return number
+
+    def _serialize(self, source, value, out):
+        if isinstance(value, IndirectObject):
+            number = self.reference(source, value)
+            out.write(b"null" if number is None else b"%d 0 R" % number)
+        elif isinstance(value, DictionaryObject):
+            out.write(b"<<")
+            for key, item in value.items():
+                if key == '/Length' and isinstance(value, StreamObject):
+                    continue
+                NameObject(key).write_to_stream(out, None)
+                out.write(b" ")
+                self._serialize(source, item, out)
+                out.write(b"\n")
+            if isinstance(value, StreamObject):
+                out.write(b"/Length %d" % len(value._data))
+            out.write(b">>")
+        elif isinstance(value, ArrayObject):
+            out.write(b"[")
+            for i, item in enumerate(value):
+                if i:
+                    out.write(b" ")
+                self._serialize(source, item, out)
+            out.write(b"]")
+        elif value is None:
+            out.write(b"null")
+        else:
+            value.write_to_stream(out, None)
+
+    def finish(self):
+        """Write the page tree, catalog, xref table and trailer, and close the file"""
+        try:
+            kids = b" ".join(b"%d 0 R" % number for number in self._kids)
+            self.write_object(self.PAGE_TREE, b"<</Type /Pages /Count %d /Kids [%s]>>" % (len(self._kids), kids))
+            self.write_object(self.CATALOG, b"<</Type /Catalog /Pages %d 0 R>>" % self.PAGE_TREE)
+            xref_offset = self._position
+            self._emit(b"xref\n0 %d\n0000000000 65535 f \n" % len(self._offsets))
+            self._emit(b"".join(b"%010d 00000 n \n" % offset for offset in self._offsets[1:]))
+            self._emit(b"trailer\n<</Size %d /Root %d 0 R>>\nstartxref\n%d\n%%%%EOF\n"
+                       % (len(self._offsets), self.CATALOG, xref_offset))
+        finally:
+            self.close()
+
+    def close(self):
+        self._file.close()
+
+class StreamingEngine(PyPDF2Engine):
+    """
+    PyPDF2 parsing with a streaming writer
+
+    Where PdfWriter holds every copied page until the end, this engine writes
+    each object to the output as soon as it is copied, renumbering it on the
+    way. What stays in memory is a few integers per object and a digest per
+    stream, and parsed objects of an input are dropped after each of its
+    selections, so memory depends on the largest input rather than on the
+    total size of the merge. Identical streams are deduplicated as they are
+    written. Catalog-level features (outlines, forms) are not carried over,
+    as with the other engines.
+    """
+
+    name = 'stream'
+    streaming = True
+
+    def merge(self, selections, progress_callback=None):
+        raise NotImplementedError("The streaming engine writes while it merges, see merge_to_file()")
+
+    def merge_to_file(self, selections, path, progress_callback=None, deduplicate=True):
+        """
+        Copy the selected pages straight into a new PDF file at path
+
+        Returns:
+            StreamingWriter: Pass it to write() to complete the file
+        """
+        documents = {id(selection.document): selection.document for selection in selections}
+        version = max(pdf.document.pdf_header for pdf in documents.values())
+        writer = StreamingWriter(path, version, deduplicate)
+        try:
+            # Output pages are numbered up front, so links between copied pages can be kept
+            sources = {key: {'numbers': {}, 'pending': set(), 'pages': {}} for key in documents}
+            numbered = []
+            for selection in selections:
+                source = sources[id(selection.document)]
+                with selection.document.lock:
+                    numbers = [writer.allocate() for _ in selection.pages]
+                    for page_num, number in zip(selection.pages, numbers):
+                        source['pages'].setdefault(selection.document.document.pages[page_num].indirect_reference.idnum,
+                                                   number)
+                numbered.append(numbers)
+
+            expected_pages = sum(len(selection.pages) for selection in selections)
+            total_pages = 0
+            for i, (selection, numbers) in enumerate(zip(selections, numbered)):
+                pdf = selection.document
+                source = sources[id(pdf)]
+                with pdf.lock:
+                    try:
+                        for count, (page_num, number) in enumerate(zip(selection.pages, numbers), start=1):
+                            writer.add_page(source, pdf.document.pages[page_num], selection.rotation, number)
+                            if progress_callback is not None:
+                                progress_callback(total_pages + count, expected_pages, file=i + 1, files=len(selections))
+                    except Exception as e:
+                        logger.error(f"Error processing PDF {pdf.filename}: {str(e)}", exc_info=True)
+                        raise PDFMergeError(f"Error processing PDF {pdf.filename}: {str(e)}")
+                    finally:
+                        # Copied objects are on disk; let the reader parse them again if they are needed
+                        pdf.document.resolved_objects.clear()
+                total_pages += len(selection.pages)
+        except Exception:
+            writer.close()
+            raise
+        return writer
+
+    def deduplicate(self, merged):
+        # Streams were deduplicated as they were written
+        return {'duplicate_streams': merged.duplicate_streams, 'bytes_saved': merged.bytes_saved}
+
+    def write(self, merged, path):
+        merged.finish()
+
+MERGE_ENGINES = {
+    PyPDF2Engine.name: PyPDF2Engine,
+    PyMuPDFEngine.name: PyMuPDFEngine,
+    StreamingEngine.name: StreamingEngine
+}
+
+def get_engine(name=None):
+    """
+    Return a merge engine by name, falling back to PyPDF2
+
+    Args:
+        name (str, optional): 'pypdf2', 'pymupdf' or 'stream'; None selects PyPDF2
+
+    Returns:
+        MergeEngine: The requested engine, or the PyPDF2 engine if the name is
+        unknown or the backend cannot be loaded
+    """
+    if isinstance(name, MergeEngine):
+        return name
+    engine_class = MERGE_ENGINES.get(name or PyPDF2Engine.name)
+    if engine_class is None:
+        logger.warning(f"Unknown merge engine '{name}', using {PyPDF2Engine.name}")
+        return PyPDF2Engine()
+    try:
+        return engine_class()
+    except ImportError as e:
+        logger.warning(f"Merge engine '{name}' is unavailable ({str(e)}), using {PyPDF2Engine.name}")
+        return PyPDF2Engine()
+
+def open_pdf(source, filename=None, engine=None):
+    """
+    Open and parse a PDF once, returning an OpenedPDF handle
+
+    Args:
+        source: File path or binary file-like object (e.g. FileStorage)
+        filename: Name used in error messages (defaults to the source's name)
+        engine: Merge engine (or engine name) that will use the handle
+
+    Raises:
+        PDFMergeError: If the PDF cannot be parsed, cannot be decrypted or has no pages
+    """
+    return get_engine(engine).open(source, filename)
+
+def merge_pdfs(files, output_path, pdf_format='standard', timer=None, progress_callback=None, engine=None,
+               deduplicate=True, stats=None, pages=None):
+    """
+    Merge PDF files into a single PDF document
+    Returns: (output_path, total_pages)
+
+    Args:
+        files: List of file paths, FileStorage objects or OpenedPDF handles.
+            OpenedPDF handles opened by the same engine are reused as-is, so
+            inputs are not parsed again.
+        output_path: Path to save the merged PDF
+        pdf_format: Format to use for the merged PDF (not used - see merge_pipeline() optimization)
+        timer: Optional StageTimer that receives 'parse', 'merge' and 'write' timings
+        progress_callback: Optional callable(pages_merged, total_pages, stage=..., file=..., files=...,
+            bytes_written=...) called as pages are added (stage 'merge', with the
+            selection being merged as file i of n) and once the output is written
+            (stage 'write'); see utils.progress.ProgressReporter
+        engine: Merge engine or engine name, see get_engine()
+        deduplicate: Store streams shared by several inputs (fonts, logos, ...) only once
+        stats: Optional dict that receives duplicate_streams and bytes_saved by deduplication
+        pages: Optional page selection, a spec string or parse_page_spec() entries
+            whose file numbers refer to positions in files; all pages by default
+    """
+    timer = timer or StageTimer()
+    engine = get_engine(engine)
+    documents = []
+    opened_here = []  # Keep track of documents we opened ourselves
+    temp_path = None
+
+    try:
+        logger.debug(f"Starting PDF merge: {len(files)} files with {engine.name}")
+
+        # Parse any inputs that have not been opened by this engine yet
+        with timer.stage('parse'):
+            for i, f in enumerate(files):
+                if isinstance(f, OpenedPDF):
+                    if f.engine == engine.name:
+                        documents.append(f)
+                        continue
+                    f = f.path
+                filename = f if isinstance(f, str) else getattr(f, 'filename', None) or f"file_{i+1}"
+                opened = engine.open(f, filename)
+                opened_here.append(opened)
+                documents.append(opened)
+
+        if isinstance(pages, str):
+            pages = parse_page_spec(pages)
+        selections = resolve_page_selection(pages, documents)
+
+        # Create output directory if it doesn't exist
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+
+        # Create a temporary file for the output to prevent partial writes
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', dir=output_dir or None) as temp_file:
+            temp_path = temp_file.name
+
+        # Process each input PDF; a streaming engine writes the output as it goes
+        with timer.stage('merge'):
+            if engine.streaming:
+                merged = engine.merge_to_file(selections, temp_path, progress_callback, deduplicate=deduplicate)
+            else:
+                merged = engine.merge(selections, progress_callback)
+        if deduplicate:
+            with timer.stage('deduplicate'):
+                dedup_stats = engine.deduplicate(merged)
+            logger.debug(f"Removed {dedup_stats['duplicate_streams']} duplicate streams ({dedup_stats['bytes_saved']} bytes)")
+            if stats is not None:
+                stats.update(dedup_stats)
+        total_pages = sum(len(selection.pages) for selection in selections)
+
         # Write the merged PDF to the temporary file
         try:
             logger.debug(f"Writing merged PDF (temp: {temp_path})")
-            with open(temp_path, 'wb') as output_file:
-                merger.write(output_file)
-            
-            # If we got here, the write was successful - move to final location
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            os.rename(temp_path, output_path)
+            with timer.stage('write'):
+                engine.write(merged, temp_path)
+
+                # If we got here, the write was successful - move to final location
+                os.replace(temp_path, output_path)
             temp_path = None  # Prevent cleanup in finally block
-            
-            logger.debug(f"Successfully merged {len(file_objects)} PDFs with {total_pages} pages to {output_path}")
+            if progress_callback is not None:
+                progress_callback(total_pages, total_pages, stage='write', bytes_written=os.path.getsize(output_path))
+
+            logger.debug(f"Successfully merged {len(selections)} selections with {total_pages} pages to {output_path}")
             return output_path, total_pages
-            
+
         except Exception as e:
             logger.error(f"Error writing merged PDF: {str(e)}", exc_info=True)
             raise PDFMergeError(f"Error writing merged PDF: {str(e)}")
-            
+
     except PDFMergeError:
         # Re-raise PDFMergeError exceptions
         raise
@@ -138,7 +863,7 @@ def merge_pdfs(files, output_path, pdf_format='standard'):
         raise PDFMergeError(f'Error merging PDFs: {str(e)}')
     finally:
         # Clean up resources
-        
+
         # Remove temporary file if it exists
         if temp_path and os.path.exists(temp_path):
             try:
@@ -146,21 +871,264 @@ def merge_pdfs(files, output_path, pdf_format='standard'):
                 logger.debug(f"Removed temporary file {temp_path}")
             except Exception as e:
                 logger.warning(f"Failed to remove temporary file {temp_path}: {str(e)}")
-        
-        # Close file objects that we opened
-        for file_obj in opened_files:
-            try:
-                file_obj.close()
-                logger.debug(f"Closed file {getattr(file_obj, 'name', 'unknown')}")
-            except Exception as e:
-                logger.warning(f"Failed to close file: {str(e)}")
+
+        # Close documents that we opened
+        for opened in opened_here:
+            opened.close()
+
+def merge_pipeline(file_paths, output_path, pdf_format='standard', progress_callback=None, engine=None,
+                   optimization=None, pages=None):
+    """
+    Validate, merge and verify saved PDF files, parsing each input only once
+
+    Args:
+        file_paths: List of paths to the uploaded PDF files, in merge order
+        output_path: Path to save the merged PDF
+        pdf_format: Format requested for the merged PDF; callers turn it into ``optimization``
+        progress_callback: Optional progress callback, see merge_pdfs(); also called
+            with stage 'optimize' once the output is optimized
+        engine: Merge engine name, see get_engine()
+        optimization: Optional optimize_pdf() keyword arguments (save_options,
+            image_dpi, image_quality) applied to the merged output
+        pages: Optional page selection, see merge_pdfs(); file numbers refer to
+            positions in file_paths and entries for invalid files are skipped
+
+    Returns:
+        dict: output_path, total_pages, merged_files, invalid_files (paths),
+        bytes_deduplicated, size_before and size_after optimization in bytes and
+        per-stage timings in milliseconds
+
+    Raises:
+        PDFMergeError: If fewer than 2 inputs are valid or the merge fails.
+            The error carries the invalid input paths in ``invalid_files``.
+    """
+    timer = StageTimer()
+    engine = get_engine(engine)
+    documents = []
+    document_indexes = {}  # Position in file_paths -> position in documents
+    invalid_files = []
+    dedup_stats = {'duplicate_streams': 0, 'bytes_saved': 0}
+
+    try:
+        # Validation and parsing are the same step: the reader is kept for merging
+        with timer.stage('validate'):
+            for i, path in enumerate(file_paths):
+                try:
+                    documents.append(engine.open(path))
+                    document_indexes[i] = len(documents) - 1
+                except PDFMergeError as e:
+                    logger.warning(f"Invalid PDF content: {path} ({str(e)})")
+                    invalid_files.append(path)
+
+        if len(documents) < 2:
+            raise PDFMergeError('Not enough valid PDF files to merge', invalid_files=invalid_files)
+
+        if pages is not None:
+            pages = _select_valid_documents(pages, file_paths, document_indexes, invalid_files)
+
+        try:
+            output_path, total_pages = merge_pdfs(documents, output_path, pdf_format, timer=timer,
+                                                  progress_callback=progress_callback, engine=engine,
+                                                  stats=dedup_stats, pages=pages)
+        except PDFMergeError as e:
+            raise PDFMergeError(str(e), invalid_files=invalid_files)
+
+        sizes = {'size_before': os.path.getsize(output_path)}
+        sizes['size_after'] = sizes['size_before']
+        if optimization:
+            with timer.stage('optimize'):
+                try:
+                    sizes = optimize_pdf(output_path, **optimization)
+                    if progress_callback is not None:
+                        progress_callback(total_pages, total_pages, stage='optimize', bytes_written=sizes['size_after'])
+                except Exception as e:
+                    # The merged file is still usable, just not optimized
+                    logger.warning(f"Could not optimize {output_path}: {str(e)}")
+
+        with timer.stage('verify'):
+            if not has_pdf_structure(output_path):
+                raise PDFMergeError("Generated PDF is invalid", invalid_files=invalid_files)
+
+        return {
+            'output_path': output_path,
+            'total_pages': total_pages,
+            'merged_files': len(documents),
+            'engine': engine.name,
+            'invalid_files': invalid_files,
+            'size_before': sizes['size_before'],
+            'size_after': sizes['size_after'],
+            'bytes_deduplicated': dedup_stats['bytes_saved'],
+            'timings': timer.as_dict()
+        }
+    finally:
+        for document in documents:
+            document.close()
+
+def merge_batch(groups, output_dir, engine=None, optimization=None, threads=1, progress_callback=None):
+    """
+    Run many independent merges over one set of inputs, parsing each input once
+
+    Every distinct input is opened once and shared by all groups that use it,
+    so a cover page merged in front of hundreds of invoices is parsed a single
+    time. Groups are merged on ``threads`` threads: pages are copied out of a
+    shared input under its lock, the rest of each merge runs concurrently.
+    Engines that are not thread-safe (PyMuPDF) merge one group at a time.
+
+    Args:
+        groups: List of dicts with 'name' (output file name), 'files' (input
+            paths in merge order) and optionally 'pages' (a page selection,
+            see merge_pdfs(), whose file numbers refer to the group's files)
+        output_dir: Directory the merged PDFs are written to
+        engine: Merge engine name, see get_engine()
+        optimization: Optional optimize_pdf() keyword arguments applied to every output
+        threads: Groups merged at once
+        progress_callback: Optional progress callback, called as each group
+            finishes with the pages merged so far and the group count as file i of n
+
+    Returns:
+        dict: 'groups' with one result per group, in order (name, output_path,
+        total_pages, size_before, size_after, bytes_deduplicated and error,
+        which is None unless the group failed), 'invalid_files' (inputs that
+        are not usable PDFs), 'engine' and 'timings' of the shared validation
+        and of the merges
+    """
+    timer = StageTimer()
+    engine = get_engine(engine)
+    documents = {}  # Path -> OpenedPDF shared by the groups
+    invalid_files = {}  # Path -> reason
+    progress_lock = threading.Lock()
+    progress = {'groups': 0, 'pages': 0}
+
+    def run_group(group):
+        result = {'name': group['name'], 'output_path': None, 'total_pages': 0, 'size_before': 0,
+                  'size_after': 0, 'bytes_deduplicated': 0, 'error': None}
+        try:
+            unusable = [path for path in group['files'] if path in invalid_files]
+            if unusable:
+                raise PDFMergeError(f"Invalid PDF {os.path.basename(unusable[0])}: {invalid_files[unusable[0]]}")
+
+            output_path = os.path.join(output_dir, group['name'])
+            dedup_stats = {'bytes_saved': 0}
+            _, total_pages = merge_pdfs([documents[path] for path in group['files']], output_path, engine=engine,
+                                        stats=dedup_stats, pages=group.get('pages'))
+            sizes = {'size_before': os.path.getsize(output_path)}
+            sizes['size_after'] = sizes['size_before']
+            if optimization:
+                try:
+                    sizes = optimize_pdf(output_path, **optimization)
+                except Exception as e:
+                    logger.warning(f"Could not optimize {output_path}: {str(e)}")
+            if not has_pdf_structure(output_path):
+                raise PDFMergeError("Generated PDF is invalid")
+
+            result.update(output_path=output_path, total_pages=total_pages, size_before=sizes['size_before'],
+                          size_after=sizes['size_after'], bytes_deduplicated=dedup_stats['bytes_saved'])
+        except PDFMergeError as e:
+            logger.warning(f"Batch group {group['name']} failed: {str(e)}")
+            result['error'] = str(e)
+
+        if progress_callback is not None:
+            with progress_lock:
+                progress['groups'] += 1
+                progress['pages'] += result['total_pages']
+                progress_callback(progress['pages'], None, file=progress['groups'], files=len(groups))
+        return result
+
+    try:
+        with timer.stage('validate'):
+            for group in groups:
+                for path in group['files']:
+                    if path in documents or path in invalid_files:
+                        continue
+                    try:
+                        documents[path] = engine.open(path)
+                    except PDFMergeError as e:
+                        logger.warning(f"Invalid PDF content: {path} ({str(e)})")
+                        invalid_files[path] = str(e)
+
+        with timer.stage('merge'):
+            threads = max(1, min(threads, len(groups))) if engine.thread_safe else 1
+            if threads > 1:
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    results = list(executor.map(run_group, groups))
+            else:
+                results = [run_group(group) for group in groups]
+
+        return {
+            'groups': results,
+            'invalid_files': list(invalid_files),
+            'engine': engine.name,
+            'timings': timer.as_dict()
+        }
+    finally:
+        for document in documents.values():
+            document.close()
+
+def _select_valid_documents(pages, file_paths, document_indexes, invalid_files):
+    """Re-number page selection entries from file_paths to the valid documents, dropping invalid ones"""
+    try:
+        entries = parse_page_spec(pages) if isinstance(pages, str) else pages
+    except PDFMergeError as e:
+        raise PDFMergeError(str(e), invalid_files=invalid_files)
+
+    selected = []
+    for file_index, ranges, rotation in entries:
+        if file_index >= len(file_paths):
+            raise PDFMergeError(f"Page selection refers to file {file_index + 1}, but only {len(file_paths)} files were given",
+                                invalid_files=invalid_files)
+        if file_index in document_indexes:
+            selected.append((document_indexes[file_index], ranges, rotation))
+        else:
+            logger.warning(f"Skipping page selection for invalid file {file_paths[file_index]}")
+
+    if not selected:
+        raise PDFMergeError('No pages selected from valid PDF files', invalid_files=invalid_files)
+    return selected
+
+def has_pdf_structure(path):
+    """
+    Cheap structural check of a PDF file without parsing it.
+
+    Looks for the %PDF- header, a trailer (classic trailer dictionary or an
+    xref stream), a startxref offset that points at an xref section and the
+    %%EOF marker.
+    """
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            head = f.read(min(size, STRUCTURE_CHECK_WINDOW))
+            f.seek(max(0, size - STRUCTURE_CHECK_WINDOW))
+            tail = f.read()
+
+            if b'%PDF-' not in head[:1024] or b'%%EOF' not in tail:
+                return False
+
+            marker = tail.rfind(b'startxref')
+            if marker == -1:
+                return False
+            fields = tail[marker + len(b'startxref'):].split()
+            if not fields or not fields[0].isdigit():
+                return False
+            xref_offset = int(fields[0])
+            if xref_offset >= size:
+                return False
+
+            # The offset must land on a classic xref table or an xref stream object
+            f.seek(xref_offset)
+            section = f.read(64)
+            if section.startswith(b'xref'):
+                return b'trailer' in tail
+            return b' obj' in section
+    except OSError as e:
+        logger.error(f"Error checking PDF structure of {path}: {str(e)}")
+        return False
 
 def is_valid_pdf(file):
     """Validate if the uploaded file is a valid PDF"""
     try:
-        reader = PdfReader(file)
+        open_pdf(file).close()
         file.seek(0)  # Reset file pointer
         return True
     except Exception as e:
         logger.error(f"Error validating PDF {getattr(file, 'filename', 'unknown')}: {str(e)}")
-        return False
\ No newline at end of file
+        return False
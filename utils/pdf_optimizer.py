@@ -0,0 +1,136 @@
+import io
+import os
+import math
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Images are only resampled when they are this much larger than the target resolution
+DOWNSAMPLE_THRESHOLD = 1.5
+
+# fitz save options that can make a file smaller; pretty and the like only change its layout
+SHRINKING_OPTIONS = ('garbage', 'deflate', 'clean')
+
+def optimize_pdf(path, save_options=None, image_dpi=None, image_quality=75):
+    """
+    Rewrite a PDF in place with PyMuPDF to make it smaller
+
+    The rewrite only replaces the file if it is smaller, and nothing is
+    rewritten at all when the options could not shrink it (no garbage
+    collection, deflate, clean or image target), so the result is never
+    larger than the input.
+
+    Args:
+        path (str): PDF file to optimize
+        save_options (dict, optional): Options for fitz Document.save(): garbage
+            (1-4; 3 and up also merges duplicate objects and 4 duplicate streams),
+            deflate (compress uncompressed streams), clean (sanitize content
+            streams) and pretty
+        image_dpi (int, optional): Downsample images drawn above this resolution;
+            None keeps images as they are
+        image_quality (int, optional): JPEG quality of downsampled images
+
+    Returns:
+        dict: size_before and size_after in bytes, and images_downsampled
+    """
+    size_before = os.path.getsize(path)
+    save_options = save_options or {}
+    if not image_dpi and not any(save_options.get(option) for option in SHRINKING_OPTIONS):
+        return {'size_before': size_before, 'size_after': size_before, 'images_downsampled': 0}
+
+    import fitz
+
+    output_dir = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(suffix='.pdf', dir=output_dir or None)
+    os.close(fd)
+
+    try:
+        document = fitz.open(path)
+        try:
+            images_downsampled = downsample_images(document, image_dpi, image_quality) if image_dpi else 0
+            document.save(temp_path, **save_options)
+        finally:
+            document.close()
+        if os.path.getsize(temp_path) < size_before:
+            os.replace(temp_path, path)
+            temp_path = None
+        else:
+            logger.debug(f"Optimizing {path} would not make it smaller, keeping it as it is")
+            images_downsampled = 0
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    size_after = os.path.getsize(path)
+    logger.debug(f"Optimized {path}: {size_before} -> {size_after} bytes, {images_downsampled} images downsampled")
+    return {
+        'size_before': size_before,
+        'size_after': size_after,
+        'images_downsampled': images_downsampled
+    }
+
+def downsample_images(document, dpi, quality=75):
+    """
+    Re-encode images drawn above the target resolution as smaller JPEGs
+
+    An image shared by several pages is sized for the largest place it is
+    drawn, and it is only replaced when the new stream is smaller.
+
+    Args:
+        document: Open fitz Document, modified in place
+        dpi (int): Target resolution
+        quality (int, optional): JPEG quality
+
+    Returns:
+        int: Number of images replaced
+    """
+    import fitz
+    from PIL import Image
+
+    # Largest size (in points) each image is drawn at, and a page that draws it
+    drawn = {}
+    for page in document:
+        for xref, smask, width, height, bpc, *_ in page.get_images(full=True):
+            # Stencil masks and images with soft masks would lose transparency as JPEGs
+            if smask or bpc == 1:
+                continue
+            for rect in page.get_image_rects(xref):
+                page_number, max_width, max_height = drawn.get(xref, (page.number, 0, 0))
+                drawn[xref] = (page_number, max(max_width, rect.width), max(max_height, rect.height))
+
+    replaced = 0
+    for xref, (page_number, width_pt, height_pt) in drawn.items():
+        if width_pt <= 0 or height_pt <= 0:
+            continue
+
+        try:
+            pixmap = fitz.Pixmap(document, xref)
+            target_width = math.ceil(width_pt / 72 * dpi)
+            target_height = math.ceil(height_pt / 72 * dpi)
+            if pixmap.width <= target_width * DOWNSAMPLE_THRESHOLD and pixmap.height <= target_height * DOWNSAMPLE_THRESHOLD:
+                continue
+
+            if pixmap.alpha:
+                pixmap = fitz.Pixmap(pixmap, 0)
+            if pixmap.n not in (1, 3):
+                pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+
+            mode = 'L' if pixmap.n == 1 else 'RGB'
+            image = Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples)
+            scale = min(target_width / pixmap.width, target_height / pixmap.height)
+            size = (max(1, round(pixmap.width * scale)), max(1, round(pixmap.height * scale)))
+
+            buffer = io.BytesIO()
+            image.resize(size, Image.LANCZOS).save(buffer, format='JPEG', quality=quality, optimize=True)
+            data = buffer.getvalue()
+            if len(data) >= len(document.xref_stream_raw(xref)):
+                continue
+
+            # Replacing the object in place updates every page that shows the image
+            document[page_number].replace_image(xref, stream=data)
+            replaced += 1
+        except Exception as e:
+            logger.warning(f"Could not downsample image {xref}: {str(e)}")
+
+    return replaced
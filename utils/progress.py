@@ -0,0 +1,204 @@
+import json
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Stages after which an operation sends no more events
+TERMINAL_STAGES = ('done', 'failed')
+
+# Events buffered per subscriber; a slow client skips ahead instead of holding memory
+SUBSCRIBER_BUFFER = 64
+
+# Where published events go in this process: the broker in the web process,
+# the shared queue in pool workers, nowhere by default
+_sink = None
+
+
+def set_sink(sink):
+    """Send events published in this process to sink(operation_id, event)"""
+    global _sink
+    _sink = sink
+
+
+def attach_queue(events_queue):
+    """
+    Pool worker initializer: forward events published in the worker to the
+    web process through a multiprocessing queue, see ProgressBroker.listen()
+    """
+    def put(operation_id, event):
+        try:
+            events_queue.put_nowait((operation_id, event))
+        except queue.Full:
+            pass
+    set_sink(put)
+
+
+def publish(operation_id, event):
+    """Publish a progress event for an operation; dropped if this process has no sink"""
+    if _sink is not None:
+        try:
+            _sink(operation_id, event)
+        except Exception as e:
+            logger.warning(f"Could not publish progress of {operation_id}: {str(e)}")
+
+
+def format_event(data, event='progress'):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class ProgressReporter:
+    """
+    Progress callback for page loops that emits at most one event per interval
+
+    Engines and converters call it as callback(page, pages, stage=..., file=...,
+    files=..., bytes_written=...) for every page. Between events a call costs
+    one clock read, so the loops are not slowed down by reporting. Changes of
+    stage and the last page of a stage are always emitted.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last_update = 0.0
+        self.last_stage = None
+
+    def __call__(self, page, pages, stage='merge', file=None, files=None, bytes_written=None):
+        now = time.monotonic()
+        if stage == self.last_stage and (pages is None or page < pages) and now - self.last_update < self.interval:
+            return
+        self.last_update = now
+        self.last_stage = stage
+        self.emit({
+            'stage': stage,
+            'page': page,
+            'pages': pages,
+            'file': file,
+            'files': files,
+            'bytes_written': bytes_written
+        })
+
+    def emit(self, event):
+        raise NotImplementedError
+
+
+class PublishedProgress(ProgressReporter):
+    """
+    Reporter that publishes events under an operation id
+
+    It is picklable, so it can be passed to pool workers along with the work;
+    events reach the web process through the sink of whichever process runs it.
+    """
+
+    def __init__(self, operation_id, interval=0.25):
+        super().__init__(interval)
+        self.operation_id = operation_id
+
+    def emit(self, event):
+        publish(self.operation_id, event)
+
+
+class ProgressBroker:
+    """
+    Fans progress events out to Server-Sent Events subscribers
+
+    The latest event of each operation is kept for ``retention`` seconds, so
+    a client that subscribes late (or after a fast operation already ended)
+    still gets the current state straight away.
+    """
+
+    def __init__(self, retention=300):
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._latest = {}  # operation_id -> (published_at, event)
+        self._subscribers = {}  # operation_id -> [queue.Queue]
+
+    def publish(self, operation_id, event):
+        now = time.monotonic()
+        with self._lock:
+            self._latest[operation_id] = (now, event)
+            subscribers = list(self._subscribers.get(operation_id, ()))
+            # Drop the state of operations nobody asked about in time
+            expired = [key for key, (published_at, _) in self._latest.items() if now - published_at > self.retention]
+            for key in expired:
+                del self._latest[key]
+        for subscriber in subscribers:
+            _offer(subscriber, event)
+
+    def subscribe(self, operation_id):
+        """
+        Returns:
+            queue.Queue: Receives the operation's events, starting with its latest one
+        """
+        subscriber = queue.Queue(SUBSCRIBER_BUFFER)
+        with self._lock:
+            self._subscribers.setdefault(operation_id, []).append(subscriber)
+            latest = self._latest.get(operation_id)
+        if latest is not None:
+            _offer(subscriber, latest[1])
+        return subscriber
+
+    def unsubscribe(self, operation_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(operation_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(operation_id, None)
+
+    def stream(self, operation_id, timeout, keepalive=15):
+        """
+        Yield an operation's events as Server-Sent Events until it ends
+
+        Args:
+            operation_id (str): Operation to follow
+            timeout (float): Give up after this many seconds
+            keepalive (float): Send a comment line after this many idle seconds,
+                so proxies do not close the connection
+
+        Yields:
+            str: Encoded messages, see format_event()
+        """
+        subscriber = self.subscribe(operation_id)
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    event = subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(event)
+                if event['stage'] in TERMINAL_STAGES:
+                    return
+        finally:
+            self.unsubscribe(operation_id, subscriber)
+
+    def listen(self, events_queue):
+        """Publish events that pool workers put on a queue, see attach_queue(), from a daemon thread"""
+        def drain():
+            while True:
+                try:
+                    operation_id, event = events_queue.get()
+                    self.publish(operation_id, event)
+                except Exception as e:
+                    logger.warning(f"Dropped a progress event: {str(e)}")
+
+        thread = threading.Thread(target=drain, name='progress-listener', daemon=True)
+        thread.start()
+        return thread
+
+
+def _offer(subscriber, event):
+    """Queue an event for a subscriber, discarding its oldest event if it is full"""
+    while True:
+        try:
+            subscriber.put_nowait(event)
+            return
+        except queue.Full:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                pass
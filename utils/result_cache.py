@@ -0,0 +1,166 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class ResultCache:
+    """
+    Content-addressed cache of merge and conversion outputs on disk.
+
+    Entries are keyed by a hash of the operation, its options and the
+    contents of its inputs in order, so a repeated request can be answered
+    without parsing anything. Each entry is a directory holding the output
+    files and a manifest; the least recently used entries are evicted once
+    the cache grows past ``max_bytes``.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None  # Measured from disk by the first put() or stats(), not on construction
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(operation, input_hashes, options=None):
+        """
+        Build a cache key
+
+        Args:
+            operation (str): Operation name, e.g. 'merge' or 'convert:word'
+            input_hashes (list): Content hashes of the inputs, in order
+            options (dict, optional): Options that change the output
+
+        Returns:
+            str: Hex digest identifying the result
+        """
+        material = json.dumps({
+            'operation': operation,
+            'inputs': list(input_hashes),
+            'options': options or {}
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key):
+        """Directory of the entry for a key (which may not exist)"""
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """
+        Look up a cached result
+
+        Returns:
+            tuple: (list of output paths, metadata dict), or None on a miss
+        """
+        entry = self.entry_path(key)
+        try:
+            paths, meta = self._read_entry(entry)
+            # Touch the entry so LRU eviction sees it as recently used
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return paths, meta
+
+    @staticmethod
+    def _read_entry(entry):
+        with open(os.path.join(entry, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        return [os.path.join(entry, name) for name in manifest['files']], manifest.get('meta', {})
+
+    def put(self, key, paths, meta=None):
+        """
+        Store output files under a key
+
+        Files are hard-linked into the cache when possible, so storing an
+        output costs no copy. Returns the cached paths, in the given order.
+        """
+        entry = self.entry_path(key)
+        staging = os.path.join(self.root, f".tmp-{uuid.uuid4()}")
+        os.makedirs(staging)
+        try:
+            names = []
+            for path in paths:
+                name = os.path.basename(path)
+                target = os.path.join(staging, name)
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copy2(path, target)
+                names.append(name)
+            with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+                json.dump({'files': names, 'meta': meta or {}}, f)
+
+            # Publish atomically; if another request stored the same key first, keep theirs
+            try:
+                os.rename(staging, entry)
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+                return self._read_entry(entry)[0]
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        added = self._entry_size(entry)
+        with self._lock:
+            if self._size is not None:
+                self._size += added
+        self._evict()
+        return [os.path.join(entry, name) for name in names]
+
+    def _entry_size(self, entry):
+        try:
+            return sum(e.stat().st_size for e in os.scandir(entry) if e.is_file())
+        except OSError:
+            return 0
+
+    def _evict(self):
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+
+            entries = []
+            for e in os.scandir(self.root):
+                if e.is_dir() and not e.name.startswith('.'):
+                    entries.append((e.stat().st_mtime, self._entry_size(e.path), e.path))
+            size = sum(entry_size for _, entry_size, _ in entries)
+
+            # Oldest (least recently used) entries go first
+            for _, entry_size, path in sorted(entries):
+                if size <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                size -= entry_size
+                self.evictions += 1
+                logger.debug(f"Evicted cached result {os.path.basename(path)}")
+            self._size = size
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        if self._size is None:
+            self._evict()  # Measures the existing entries and enforces the size limit
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'bytes': self._size,
+                'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,204 @@
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Only names the app generates (uuid4 directories and files) are ever swept
+ENTRY_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(\.\w+)?')
+
+def remove_uploads(saved_files, merge_dir=None):
+    """
+    Remove saved uploads and, if given, their (now empty) merge directory
+
+    Args:
+        saved_files (list): Paths of the files to remove
+        merge_dir (str, optional): Directory to remove once it is empty
+    """
+    for f in saved_files:
+        try:
+            os.remove(f)
+        except Exception as e:
+            logger.warning(f"Error removing file {f}: {str(e)}")
+
+    # Remove the merge directory if it's empty
+    if merge_dir is None:
+        return
+    try:
+        os.rmdir(merge_dir)
+    except Exception as e:
+        logger.warning(f"Error removing directory {merge_dir}: {str(e)}")
+
+class StorageEntry:
+    """One upload directory or converted output, with its total size and last change"""
+
+    def __init__(self, path, size, files, mtime):
+        self.path = path
+        self.size = size
+        self.files = files
+        self.mtime = mtime
+
+def measure_entry(path):
+    """Return a StorageEntry for a file or directory tree, or None if it vanished meanwhile"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if not os.path.isdir(path):
+        return StorageEntry(path, stat.st_size, 1, stat.st_mtime)
+
+    size, files, mtime = 0, 0, stat.st_mtime
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                file_stat = os.stat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            size += file_stat.st_size
+            files += 1
+            mtime = max(mtime, file_stat.st_mtime)
+    return StorageEntry(path, size, files, mtime)
+
+class StorageManager:
+    """
+    Retention for request files: upload directories and converted outputs.
+
+    Each immediate child of a managed folder whose name the app generated is
+    an entry. A sweep deletes entries not changed for ``ttl`` seconds, then
+    evicts the oldest remaining entries while the total is above
+    ``max_bytes``. Entries younger than ``min_age`` are never evicted, so
+    work in progress survives a full disk. Sweeps run on a background
+    thread; requests never wait for them.
+    """
+
+    def __init__(self, folders, ttl, max_bytes, min_age=0):
+        self.folders = list(folders)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.bytes_stored = 0
+        self.entries = 0
+        self.files_expired = 0
+        self.files_evicted = 0
+        self.bytes_reclaimed = 0
+        self.sweeps = 0
+        self.last_sweep = None
+        self.last_sweep_ms = 0.0
+
+    def scan(self):
+        """Measure every entry in the managed folders"""
+        entries = []
+        for folder in self.folders:
+            try:
+                names = os.listdir(folder)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                if ENTRY_PATTERN.fullmatch(name):
+                    entry = measure_entry(os.path.join(folder, name))
+                    if entry is not None:
+                        entries.append(entry)
+        return entries
+
+    def sweep(self):
+        """Expire old entries and enforce the byte quota; returns stats()"""
+        with self._sweep_lock:
+            started = time.perf_counter()
+            now = time.time()
+            kept = []
+            expired_files = evicted_files = reclaimed = 0
+
+            for entry in self.scan():
+                if now - entry.mtime > self.ttl:
+                    if self._remove(entry):
+                        expired_files += entry.files
+                        reclaimed += entry.size
+                else:
+                    kept.append(entry)
+
+            # Oldest first, so the least recently written entries go first
+            kept.sort(key=lambda entry: entry.mtime)
+            total = sum(entry.size for entry in kept)
+            for entry in list(kept):
+                if total <= self.max_bytes:
+                    break
+                if now - entry.mtime < self.min_age:
+                    logger.warning(f"Storage quota exceeded ({total} bytes) but remaining entries are in use")
+                    break
+                if self._remove(entry):
+                    evicted_files += entry.files
+                    reclaimed += entry.size
+                    total -= entry.size
+                    kept.remove(entry)
+
+            with self._lock:
+                self.bytes_stored = total
+                self.entries = len(kept)
+                self.files_expired += expired_files
+                self.files_evicted += evicted_files
+                self.bytes_reclaimed += reclaimed
+                self.sweeps += 1
+                self.last_sweep = now
+                self.last_sweep_ms = round((time.perf_counter() - started) * 1000, 2)
+
+            if expired_files or evicted_files:
+                logger.info(f"Storage sweep removed {expired_files} expired and {evicted_files} evicted files "
+                            f"({reclaimed} bytes), {total} bytes stored")
+            return self.stats()
+
+    @staticmethod
+    def _remove(entry):
+        try:
+            if os.path.isdir(entry.path):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Error removing {entry.path}: {str(e)}")
+            return False
+
+    def start(self, interval):
+        """Sweep now and then every ``interval`` seconds on a daemon thread (once per manager)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='storage-sweeper', daemon=True)
+            self._thread.start()
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {str(e)}", exc_info=True)
+            if self._stop.wait(interval):
+                return
+
+    def stop(self):
+        """Stop the sweeper thread"""
+        self._stop.set()
+
+    def stats(self):
+        """Bytes stored, expiry and eviction counters, for monitoring"""
+        with self._lock:
+            return {
+                'bytes_stored': self.bytes_stored,
+                'max_bytes': self.max_bytes,
+                'entries': self.entries,
+                'files_expired': self.files_expired,
+                'files_evicted': self.files_evicted,
+                'bytes_reclaimed': self.bytes_reclaimed,
+                'sweeps': self.sweeps,
+                'last_sweep': self.last_sweep,
+                'last_sweep_ms': self.last_sweep_ms
+            }
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# With an in-process JVM, documents longer than this are split into chunks of this many pages,
+# extracted in parallel
+PAGES_PER_CHUNK = 25
+
+# Chunks extracted at once; also bounds how many chunks of tables are held before they are consumed
+EXTRACTION_THREADS = 4
+
+
+class TableExtractor:
+    """
+    Long-lived tabula-java table extraction service
+
+    tabula.read_pdf() launches a JVM for every call, which takes seconds
+    before extraction starts. With JPype installed, this service starts
+    tabula-java in a JVM inside the process once and reuses it for every
+    extraction, so a pool worker pays the startup for its first conversion
+    only. Without JPype (or without a usable JVM library) it falls back to
+    tabula-java subprocesses: a document is then extracted in one launch,
+    since chunks would each launch their own JVM, and a batch still shares
+    a single launch.
+
+    Tables come back as the same DataFrames tabula.read_pdf() returns.
+    """
+
+    def __init__(self, java_options=None, pages_per_chunk=PAGES_PER_CHUNK, threads=EXTRACTION_THREADS):
+        self.java_options = list(java_options or [])
+        self.pages_per_chunk = pages_per_chunk
+        self.threads = threads
+        self.backend = None
+        self._vm = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._jvm_startup_ms = None
+        self._extractions = 0
+        self._tables = 0
+        self._extract_ms = 0.0
+
+    def start(self):
+        """
+        Start the JVM, or choose subprocesses if it cannot run in-process
+
+        Called by the first extraction; call it ahead of time to take the
+        startup off the first request.
+
+        Returns:
+            str: Backend in use, 'jpype' or 'subprocess'
+        """
+        with self._lock:
+            if self.backend is not None:
+                return self.backend
+
+            started = time.perf_counter()
+            try:
+                self._vm = self._start_jvm()
+            except Exception as e:
+                logger.info(f"No in-process JVM for tabula ({str(e)}), extracting with subprocesses")
+                self.backend = 'subprocess'
+                if shutil.which('java') is None:
+                    logger.warning("`java` was not found; table extraction will fail until Java is installed")
+                return self.backend
+
+            self.backend = 'jpype'
+            self._jvm_startup_ms = round((time.perf_counter() - started) * 1000, 2)
+            logger.info(f"Table extraction backend: jpype, JVM startup {self._jvm_startup_ms} ms")
+            return self.backend
+
+    def _start_jvm(self):
+        import jpype
+        import jpype.imports
+        from tabula.io import _jar_path
+
+        if not jpype.isJVMStarted():
+            jpype.addClassPath(_jar_path())
+            jpype.startJVM(*self.java_options, '-Djava.awt.headless=true', '-Dfile.encoding=UTF8',
+                           convertStrings=False)
+
+        from java.lang import StringBuilder
+        from technology.tabula import CommandLineApp
+        from org.apache.commons.cli import DefaultParser
+
+        return {
+            'StringBuilder': StringBuilder,
+            'CommandLineApp': CommandLineApp,
+            'options': CommandLineApp.buildOptions(),
+            'parser': DefaultParser(),
+            'args': jpype.JArray(jpype.JString)
+        }
+
+    def _options(self, pages, options):
+        from tabula.util import TabulaOption
+        return TabulaOption(pages=pages, format='JSON', multiple_tables=True, silent=True, **options)
+
+    def _run(self, path, pages, options):
+        """Run tabula-java on one PDF and return its raw JSON tables"""
+        tabula_options = self._options(pages, options)
+        if self.backend == 'jpype':
+            vm = self._vm
+            output = vm['StringBuilder']()
+            line = vm['parser'].parse(vm['options'], vm['args']([path] + tabula_options.build_option_list()))
+            vm['CommandLineApp'](output, line).extractTables(line)
+            raw = str(output.toString())
+        else:
+            from tabula.io import _run
+            raw = _run(list(self.java_options), tabula_options, path).decode('utf-8')
+        return json.loads(raw) if raw.strip() else []
+
+    def _extract(self, path, pages, options):
+        from tabula.io import _extract_from
+
+        started = time.perf_counter()
+        tables = _extract_from(self._run(path, pages, options))
+        self._record(started, len(tables))
+        return tables
+
+    def _record(self, started, table_count):
+        with self._stats_lock:
+            self._extractions += 1
+            self._tables += table_count
+            self._extract_ms += (time.perf_counter() - started) * 1000
+
+    def _page_chunks(self, path):
+        """Page specs to extract a document in; chunks only pay off with an in-process JVM"""
+        if self.backend != 'jpype':
+            return ['all']
+        try:
+            from PyPDF2 import PdfReader
+            with open(path, 'rb') as f:
+                page_count = len(PdfReader(f).pages)
+        except Exception:
+            return ['all']
+        return page_chunks(page_count, self.pages_per_chunk)
+
+    def iter_tables(self, path, lattice=False, stream=False, guess=True):
+        """
+        Extract the tables of a PDF, yielding them in page order
+
+        With the in-process JVM, documents longer than ``pages_per_chunk``
+        pages are extracted a chunk at a time on ``threads`` threads (the JVM
+        runs them in parallel), and at most that many chunks are held before
+        their tables are consumed. With subprocesses, the document is
+        extracted by a single launch.
+
+        Args:
+            path (str): PDF file
+            lattice (bool, optional): Use tabula's lattice mode (ruled tables)
+            stream (bool, optional): Use tabula's stream mode (whitespace separated tables)
+            guess (bool, optional): Let tabula detect table areas
+
+        Yields:
+            DataFrame: Next table
+        """
+        self.start()
+        options = {'lattice': lattice, 'stream': stream, 'guess': guess}
+        chunks = self._page_chunks(path)
+        if len(chunks) == 1:
+            yield from self._extract(path, chunks[0], options)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            pending = []
+            for chunk in chunks:
+                pending.append(executor.submit(self._extract, path, chunk, options))
+                if len(pending) >= self.threads:
+                    yield from pending.pop(0).result()
+            for future in pending:
+                yield from future.result()
+
+    def extract(self, path, **options):
+        """
+        Extract every table of a PDF, see iter_tables()
+
+        Returns:
+            list: DataFrames in page order
+        """
+        return list(self.iter_tables(path, **options))
+
+    def extract_batch(self, paths, lattice=False, stream=False, guess=True):
+        """
+        Extract the tables of several PDFs in one call
+
+        In-process, the files are extracted in parallel in the running JVM;
+        with subprocesses, tabula-java's --batch mode extracts them all in a
+        single launch.
+
+        Args:
+            paths (list): PDF files
+            lattice, stream, guess: See iter_tables()
+
+        Returns:
+            list: One list of DataFrames per path, in the order of paths
+        """
+        self.start()
+        options = {'lattice': lattice, 'stream': stream, 'guess': guess}
+        if self.backend == 'jpype':
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                return list(executor.map(lambda path: self._extract(path, 'all', options), paths))
+
+        from tabula.io import _extract_from, _run
+
+        started = time.perf_counter()
+        batch_dir = tempfile.mkdtemp(prefix='tables-')
+        try:
+            # --batch extracts every PDF in a directory, writing <name>.json next to each
+            for i, path in enumerate(paths):
+                link = os.path.join(batch_dir, f"{i}.pdf")
+                try:
+                    os.symlink(os.path.abspath(path), link)
+                except OSError:
+                    shutil.copyfile(path, link)
+            tabula_options = self._options('all', options)
+            tabula_options.batch = batch_dir
+            _run(list(self.java_options), tabula_options)
+
+            results = []
+            for i in range(len(paths)):
+                output_path = os.path.join(batch_dir, f"{i}.json")
+                with open(output_path, encoding='utf-8') as f:
+                    raw = f.read()
+                results.append(_extract_from(json.loads(raw)) if raw.strip() else [])
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+        self._record(started, sum(len(tables) for tables in results))
+        return results
+
+    def stats(self):
+        """JVM startup (in-process only; subprocesses pay it in each extraction) and extraction times"""
+        with self._stats_lock:
+            return {
+                'backend': self.backend,
+                'jvm_startup_ms': self._jvm_startup_ms,
+                'extractions': self._extractions,
+                'tables': self._tables,
+                'extract_ms': round(self._extract_ms, 2)
+            }
+
+
+def page_chunks(page_count, pages_per_chunk=PAGES_PER_CHUNK):
+    """
+    Split a document into page ranges for parallel extraction
+
+    Returns:
+        list: tabula page specs such as '1-25', or ['all'] if the document
+        fits in one chunk
+    """
+    if page_count <= pages_per_chunk:
+        return ['all']
+    return [f"{first}-{min(first + pages_per_chunk - 1, page_count)}"
+            for first in range(1, page_count + 1, pages_per_chunk)]
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_table_extractor():
+    """The process-wide TableExtractor, so every conversion in a worker reuses one JVM"""
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = TableExtractor()
+        return _extractor
@@ -0,0 +1,110 @@
+import io
+import csv
+import math
+import zipfile
+
+# Excel caps sheet names at 31 characters and rows at 1,048,576 per sheet
+EXCEL_MAX_ROWS = 1048576
+
+# Tables past this many get stacked on overflow sheets instead of a sheet each;
+# workbooks with thousands of sheets open slowly or not at all
+MAX_TABLE_SHEETS = 250
+
+
+def _cell(value):
+    """Excel-safe cell value: NaN (empty cells from tabula) becomes an empty cell"""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _rows(table):
+    """Header row followed by the data rows of a DataFrame, generated one at a time"""
+    yield [str(column) for column in table.columns]
+    for row in table.itertuples(index=False, name=None):
+        yield [_cell(value) for value in row]
+
+
+def write_xlsx(tables, output_path, progress_callback=None, max_sheets=MAX_TABLE_SHEETS):
+    """
+    Write tables to an xlsx workbook as they arrive, one sheet per table
+
+    The workbook is written with openpyxl's write-only mode, which streams
+    rows to disk, so memory holds only the table being written no matter how
+    many tables there are. Tables after the first ``max_sheets`` are stacked
+    on overflow sheets, each under a caption row naming the table.
+
+    Args:
+        tables (iterable): DataFrames, e.g. TableExtractor.iter_tables()
+        output_path (str): Path of the xlsx file
+        progress_callback (callable, optional): Called with stage 'write' per table
+        max_sheets (int, optional): Tables that get a sheet of their own
+
+    Returns:
+        int: Number of tables written
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    overflow = None
+    overflow_rows = 0
+    count = 0
+
+    for count, table in enumerate(tables, start=1):
+        if count <= max_sheets:
+            sheet = workbook.create_sheet(title=f"Table {count}")
+            for row in _rows(table):
+                sheet.append(row)
+        else:
+            # A table that would cross the row limit starts a new overflow sheet
+            if overflow is None or overflow_rows + len(table) + 3 > EXCEL_MAX_ROWS:
+                overflow = workbook.create_sheet(title=f"Tables {count}-")
+                overflow_rows = 0
+            elif overflow_rows:
+                overflow.append([])
+                overflow_rows += 1
+            overflow.append([f"Table {count}"])
+            overflow_rows += 1
+            for row in _rows(table):
+                overflow.append(row)
+                overflow_rows += 1
+
+        if progress_callback is not None:
+            progress_callback(count, None, stage='write')
+
+    if count == 0:
+        # A workbook needs at least one sheet
+        workbook.create_sheet(title="No tables")
+    workbook.save(output_path)
+    return count
+
+
+def write_csv_zip(tables, output_path, progress_callback=None):
+    """
+    Write tables as they arrive to a ZIP archive with one CSV file per table
+
+    Every CSV is streamed into its archive member, so memory holds only the
+    table being written. Suited to results too large for a workbook.
+
+    Args:
+        tables (iterable): DataFrames, e.g. TableExtractor.iter_tables()
+        output_path (str): Path of the zip file
+        progress_callback (callable, optional): Called with stage 'write' per table
+
+    Returns:
+        int: Number of tables written
+    """
+    count = 0
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for count, table in enumerate(tables, start=1):
+            with archive.open(f"table_{count}.csv", 'w') as member:
+                text = io.TextIOWrapper(member, encoding='utf-8', newline='')
+                writer = csv.writer(text)
+                for row in _rows(table):
+                    writer.writerow(row)
+                text.flush()
+                text.detach()
+
+            if progress_callback is not None:
+                progress_callback(count, None, stage='write')
+    return count
@@ -0,0 +1,148 @@
+import os
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+# How many failed renders are remembered, so clients polling for them get the error
+FAILURE_MEMO_SIZE = 1024
+
+
+def render_thumbnails(pdf_path, output_dir, dpi=36, max_pages=1, max_size=400):
+    """
+    Render the first pages of a PDF to PNG previews with PyMuPDF
+
+    Args:
+        pdf_path (str): PDF to preview
+        output_dir (str): Directory the PNG files are written to
+        dpi (int, optional): Render resolution
+        max_pages (int, optional): Number of pages rendered, from the first
+        max_size (int, optional): Longest side of a preview in pixels, which
+            lowers the resolution of oversized pages
+
+    Returns:
+        tuple: (list of PNG paths in page order, page count of the document)
+    """
+    import fitz
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    with fitz.open(pdf_path, filetype='pdf') as document:
+        if document.needs_pass:
+            raise ValueError("Encrypted PDFs cannot be previewed")
+        for page_num in range(min(max_pages, document.page_count)):
+            page = document.load_page(page_num)
+            zoom = min(dpi / 72, max_size / max(page.rect.width, page.rect.height, 1))
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            path = os.path.join(output_dir, f"page-{page_num + 1}.png")
+            pixmap.save(path)
+            paths.append(path)
+        return paths, document.page_count
+
+
+class Thumbnails:
+    """
+    Page previews of uploaded PDFs, rendered in the background and cached by content
+
+    Rendering runs on a worker pool of its own, so previews never wait for
+    or hold up merges and conversions, and submit() returns at once. The
+    previews are stored in a ResultCache keyed by the document's SHA-256 and
+    the render settings, which evicts the least recently used ones. A
+    document is rendered once however many clients ask for it at a time.
+    """
+
+    def __init__(self, pool, cache, dpi=36, max_pages=1, max_size=400):
+        self.pool = pool
+        self.cache = cache
+        self.options = {'dpi': dpi, 'max_pages': max_pages, 'max_size': max_size}
+        self._pending = {}  # Content hash -> Future of the render
+        self._failed = OrderedDict()  # Content hash -> error message
+        self._lock = threading.Lock()
+
+    def key(self, file_hash):
+        """Cache key of the previews of a document"""
+        return ResultCache.make_key('thumbnail', [file_hash], self.options)
+
+    def path(self, file_hash, filename):
+        """Path of a preview file (which may not exist)"""
+        return os.path.join(self.cache.entry_path(self.key(file_hash)), filename)
+
+    def status(self, file_hash):
+        """
+        Report on the previews of a document
+
+        Returns:
+            dict: 'status' is 'ready' (with 'pages', the page count of the
+            document, and 'files', the preview file names in page order),
+            'pending', 'failed' (with 'error') or 'missing'
+        """
+        with self._lock:
+            if file_hash in self._pending:
+                return {'status': 'pending'}
+            error = self._failed.get(file_hash)
+        if error is not None:
+            return {'status': 'failed', 'error': error}
+
+        cached = self.cache.get(self.key(file_hash))
+        if cached is None:
+            return {'status': 'missing'}
+        paths, meta = cached
+        return {'status': 'ready', 'pages': meta.get('pages'), 'files': [os.path.basename(path) for path in paths]}
+
+    def submit(self, file_hash, pdf_path, upload_dir):
+        """
+        Start rendering previews of a PDF unless they are cached or being rendered
+
+        The upload directory holding the PDF is deleted once it is no longer
+        needed, whatever the outcome.
+
+        Returns:
+            dict: The status of the previews, see status()
+
+        Raises:
+            PoolFullError: If the thumbnail pool is busy and its queue is full
+        """
+        status = self.status(file_hash)
+        if status['status'] in ('ready', 'pending'):
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            return status
+
+        with self._lock:
+            if file_hash in self._pending:
+                # Another request started the same render in the meantime
+                future = None
+            else:
+                self._failed.pop(file_hash, None)
+                try:
+                    future = self.pool.submit(render_thumbnails, pdf_path, os.path.join(upload_dir, 'thumbnails'),
+                                              **self.options)
+                except Exception:
+                    shutil.rmtree(upload_dir, ignore_errors=True)
+                    raise
+                self._pending[file_hash] = future
+        if future is None:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        else:
+            future.add_done_callback(lambda f: self._finished(file_hash, f, upload_dir))
+        return {'status': 'pending'}
+
+    def _finished(self, file_hash, future, upload_dir):
+        try:
+            _, (paths, page_count) = future.result()
+            # Cached before the render stops being pending, so status() never reports it missing
+            self.cache.put(self.key(file_hash), paths, {'pages': page_count})
+        except Exception as e:
+            logger.warning(f"Could not render previews of {file_hash}: {str(e)}")
+            with self._lock:
+                self._failed[file_hash] = str(e)
+                while len(self._failed) > FAILURE_MEMO_SIZE:
+                    self._failed.popitem(last=False)
+        finally:
+            # Removed before the render stops being pending, so the upload is gone once the status settles
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            with self._lock:
+                self._pending.pop(file_hash, None)
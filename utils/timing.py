@@ -0,0 +1,33 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Collects wall-clock durations for the named stages of an operation
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the enclosed block and add it to the named stage
+
+        Args:
+            name (str): Stage name, e.g. 'parse' or 'write'
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        """Add a duration (in seconds) to a stage, accumulating repeated stages"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self):
+        """Return stage durations in milliseconds, rounded for reporting"""
+        return {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
@@ -0,0 +1,216 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+# Buffer size of spool files, so parser chunks reach the disk in large writes
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Room for multipart boundaries, part headers and form fields on top of the file data
+MULTIPART_OVERHEAD = 1024 * 1024
+
+# The header has to appear within this many bytes, as PDF readers allow
+HEADER_WINDOW = 1024
+
+
+class UploadLimits:
+    """Upload limits of a request; None disables a limit"""
+
+    def __init__(self, max_files=None, max_file_size=None, max_total_size=None):
+        self.max_files = max_files
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+
+
+class UploadSpool:
+    """
+    Read/write file object that one multipart file part is streamed into
+
+    The data goes straight to its final path in the request's upload
+    directory and is hashed as it arrives. Once the first bytes show the
+    part does not start with the required header, the rest of the part is
+    discarded instead of written.
+    """
+
+    def __init__(self, request, path, required_header=None):
+        self.request = request
+        self.path = path
+        self.size = 0
+        self.required_header = required_header
+        self.rejected = False
+        self._head = b''
+        self._digest = hashlib.sha256()
+        self._file = open(path, 'w+b', buffering=UPLOAD_CHUNK_SIZE)
+
+    def write(self, data):
+        self.size += len(data)
+        self.request._account(self, len(data))
+        if self.rejected:
+            return len(data)
+
+        if self.required_header is not None and len(self._head) < HEADER_WINDOW:
+            self._head += bytes(data[:HEADER_WINDOW - len(self._head)])
+            if len(self._head) >= HEADER_WINDOW and not self.has_header:
+                self._reject()
+                return len(data)
+
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def has_header(self):
+        """Whether the data seen so far contains the required header"""
+        return self.required_header is None or self.required_header in self._head
+
+    @property
+    def is_valid(self):
+        """Whether the part was kept: not rejected and starting with the required header"""
+        return not self.rejected and self.has_header
+
+    @property
+    def sha256(self):
+        """SHA-256 hex digest of the data written so far"""
+        return self._digest.hexdigest()
+
+    def _reject(self):
+        logger.warning(f"Upload {os.path.basename(self.path)} does not start with {self.required_header!r}, discarding it")
+        self.rejected = True
+        self.discard()
+
+    def discard(self):
+        """Close and delete the spool file"""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def seek(self, offset, whence=0):
+        # A discarded spool reads as empty
+        return 0 if self._file.closed else self._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return b'' if self._file.closed else self._file.read(size)
+
+    def readline(self, size=-1):
+        return b'' if self._file.closed else self._file.readline(size)
+
+    def tell(self):
+        return self.size if self._file.closed else self._file.tell()
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+class SpoolingRequest(Request):
+    """
+    Request that streams file uploads to disk while the body is parsed
+
+    Each file part is written to ``upload_dir`` as it arrives, instead of
+    buffering the body or spooling it to an anonymous temporary file that is
+    copied again later. Size and count limits from upload_limits() are
+    enforced per chunk, so an oversized upload is rejected with a 413 as
+    soon as it crosses a limit.
+    """
+
+    #: Header every uploaded file must start with; None accepts anything
+    required_header = b'%PDF-'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_id = str(uuid.uuid4())
+        self.spools = []
+        self.uploaded_bytes = 0
+        self.upload_ms = 0.0
+        self._limits = None
+
+    @property
+    def spool_root(self):
+        """Directory that holds one upload directory per request"""
+        raise NotImplementedError
+
+    @property
+    def upload_dir(self):
+        """Directory this request's uploads are spooled into"""
+        return os.path.join(self.spool_root, self.upload_id)
+
+    def upload_limits(self):
+        """Limits for this request, see UploadLimits; no limits by default"""
+        return UploadLimits()
+
+    @property
+    def limits(self):
+        if self._limits is None:
+            self._limits = self.upload_limits()
+        return self._limits
+
+    @property
+    def max_content_length(self):
+        # Reject bodies that announce a size above the total limit before reading them
+        max_content_length = super().max_content_length
+        if self.limits.max_total_size is not None:
+            tier_limit = self.limits.max_total_size + MULTIPART_OVERHEAD
+            max_content_length = tier_limit if max_content_length is None else min(max_content_length, tier_limit)
+        return max_content_length
+
+    def _load_form_data(self):
+        started = time.perf_counter()
+        try:
+            super()._load_form_data()
+        finally:
+            self.upload_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limits = self.limits
+        if limits.max_files is not None and len(self.spools) >= limits.max_files:
+            self._abort(f"Too many files: at most {limits.max_files} per upload")
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        spool = UploadSpool(self, self._spool_path(filename), self.required_header)
+        self.spools.append(spool)
+        return spool
+
+    def _spool_path(self, filename):
+        safe_filename = secure_filename(filename or '') or 'upload'
+        path = os.path.join(self.upload_dir, safe_filename)
+        name, ext = os.path.splitext(safe_filename)
+        counter = 1
+        while any(spool.path == path for spool in self.spools):
+            counter += 1
+            path = os.path.join(self.upload_dir, f"{name}_{counter}{ext}")
+        return path
+
+    def _account(self, spool, size):
+        """Count bytes written to a spool against the limits"""
+        self.uploaded_bytes += size
+        limits = self.limits
+        if limits.max_file_size is not None and spool.size > limits.max_file_size:
+            self._abort(f"File too large: at most {limits.max_file_size // (1024 * 1024)}MB per file")
+        if limits.max_total_size is not None and self.uploaded_bytes > limits.max_total_size:
+            self._abort(f"Upload too large: at most {limits.max_total_size // (1024 * 1024)}MB in total")
+
+    def _abort(self, message):
+        logger.warning(f"Rejecting upload {self.upload_id}: {message}")
+        self.discard_uploads()
+        raise RequestEntityTooLarge(message)
+
+    def discard_uploads(self):
+        """Delete everything spooled for this request"""
+        for spool in self.spools:
+            spool.close()
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
@@ -0,0 +1,233 @@
+import math
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+class PoolFullError(Exception):
+    """Raised when the admission queue is full; carries a Retry-After hint in seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server is busy, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+def run_initializers(initializers):
+    """Worker initializer that runs several (fn, args) initializers in order"""
+    for fn, args in initializers:
+        fn(*args)
+
+def _timed_call(fn, args, kwargs):
+    """Run fn in a worker process and report when it started, so queue wait can be measured"""
+    started = time.time()
+    return started, fn(*args, **kwargs)
+
+class PoolSlot:
+    """A pool slot held for work that runs outside the pool, released exactly once"""
+
+    def __init__(self, pool, counted=True):
+        self._pool = pool
+        self._started = time.time()
+        self._released = False
+        self._counted = counted  # Whether it counts as a job in stats() and Retry-After hints
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            if self._counted:
+                self._pool._slot_done(self._started)
+            else:
+                self._pool._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+class WorkerPool:
+    """
+    Process pool for CPU and memory heavy work with a bounded admission queue.
+
+    At most ``max_workers`` jobs run at once and at most ``max_queued`` more
+    wait for a worker. Anything beyond that is rejected with PoolFullError
+    instead of piling up on the box.
+
+    ``initializer(*initargs)`` runs once in every worker process as it starts.
+    ``on_wait(seconds)``, if given, is called by run() in the calling thread
+    with the time each job spent queued for a worker.
+    """
+
+    def __init__(self, max_workers, max_queued, initializer=None, initargs=(), on_wait=None):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.initializer = initializer
+        self.initargs = initargs
+        self.on_wait = on_wait
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._measured = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._avg_run = 0.0
+
+    def _get_executor(self):
+        # Started lazily so importing the app (or the reloader) does not spawn workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer,
+                    initargs=self.initargs
+                )
+            return self._executor
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            retry_after = self.retry_after()
+            logger.warning(f"Worker pool full, rejecting job (retry after {retry_after}s)")
+            raise PoolFullError(retry_after)
+
+        with self._lock:
+            self._in_flight += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit fn(*args, **kwargs) to the pool
+
+        Returns:
+            Future: Resolves to a (started_at, result) tuple, see run()
+
+        Raises:
+            PoolFullError: If every worker is busy and the queue is full
+        """
+        self._admit()
+        submitted = time.time()
+        try:
+            try:
+                future = self._get_executor().submit(_timed_call, fn, args, kwargs)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool once
+                self._discard_executor()
+                future = self._get_executor().submit(_timed_call, fn, args, kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda f: self._job_done(f, submitted))
+        return future
+
+    def reserve(self):
+        """
+        Take a slot for work that must run in the calling thread, such as a
+        streamed response, so it still counts against the admission limit
+
+        Returns:
+            PoolSlot: Release it (or use it as a context manager) when the work ends
+
+        Raises:
+            PoolFullError: If every worker is busy and the queue is full
+        """
+        self._admit()
+        return PoolSlot(self)
+
+    def reserve_idle(self, limit):
+        """
+        Take up to ``limit`` slots of idle workers for a job that starts
+        processes of its own, so they count against ``max_workers`` too
+
+        One idle worker is always left for the job itself, and nothing is
+        taken while jobs are queued. The slots are not counted as jobs.
+
+        Returns:
+            list: PoolSlot objects, possibly none; release each when the job ends
+        """
+        slots = []
+        with self._lock:
+            while len(slots) < limit and self._in_flight + 1 < self.max_workers:
+                # Never blocks: fewer than max_workers slots of the semaphore are taken
+                self._slots.acquire(blocking=False)
+                self._in_flight += 1
+                slots.append(PoolSlot(self, counted=False))
+        return slots
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Run fn in the pool and wait for its result, re-raising any exception it raised"""
+        submitted = time.time()
+        started, result = self.submit(fn, *args, **kwargs).result(timeout=timeout)
+        if self.on_wait is not None:
+            self.on_wait(max(0.0, started - submitted))
+        return result
+
+    def _discard_executor(self):
+        logger.warning("Worker pool is broken, replacing it")
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _job_done(self, future, submitted):
+        finished = time.time()
+        with self._lock:
+            self._completed += 1
+            if not future.cancelled() and future.exception() is None:
+                started = future.result()[0]
+                self._measured += 1
+                wait = max(0.0, started - submitted)
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+                # Exponential moving average of run time, used for Retry-After hints
+                run = finished - started
+                self._avg_run = run if self._avg_run == 0.0 else 0.8 * self._avg_run + 0.2 * run
+        self._release()
+
+    def _slot_done(self, started):
+        with self._lock:
+            self._completed += 1
+            run = time.time() - started
+            self._avg_run = run if self._avg_run == 0.0 else 0.8 * self._avg_run + 0.2 * run
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def retry_after(self):
+        """Estimate in whole seconds how long until a queue slot frees up"""
+        with self._lock:
+            queued = max(0, self._in_flight - self.max_workers)
+            avg_run = self._avg_run
+        return max(1, math.ceil(avg_run * (queued + 1) / self.max_workers))
+
+    def stats(self):
+        """Queue depth and wait times, for sizing the pool"""
+        with self._lock:
+            queued = max(0, self._in_flight - self.max_workers)
+            return {
+                'workers': self.max_workers,
+                'max_queued': self.max_queued,
+                'running': self._in_flight - queued,
+                'queued': queued,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'avg_wait_ms': round(self._total_wait / self._measured * 1000, 2) if self._measured else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 2),
+                'avg_run_ms': round(self._avg_run * 1000, 2)
+            }
+
+    def shutdown(self):
+        """Stop the worker processes, waiting for running jobs"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
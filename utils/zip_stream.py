@@ -0,0 +1,70 @@
+import os
+import zipfile
+
+# Bytes of a member read and sent at a time, which bounds what is buffered
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkBuffer:
+    """
+    Write-only, non-seekable file object that collects what ZipFile writes
+    so it can be handed to the client chunk by chunk
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Return and forget everything written since the last drain"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files, compression=zipfile.ZIP_STORED):
+    """
+    Generate a ZIP archive on the fly
+
+    Each file is added and sent as soon as it is available, in chunks of
+    ZIP_CHUNK_SIZE bytes, so no more than about one chunk is buffered
+    however large the members are. ZIP_STORED is the default because JPEGs
+    and other already compressed data do not shrink any further.
+
+    Args:
+        files: Iterable of file paths, or (path, name in archive) tuples;
+            it may be a generator that is still producing files
+        compression (int, optional): zipfile compression method
+
+    Yields:
+        bytes: The next chunk of the archive
+    """
+    buffer = _ChunkBuffer()
+    # The buffer cannot seek, so ZipFile writes sizes in data descriptors after each member
+    with zipfile.ZipFile(buffer, 'w', compression=compression) as zf:
+        for entry in files:
+            path, arcname = entry if isinstance(entry, tuple) else (entry, os.path.basename(entry))
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = compression
+            with open(path, 'rb') as source, zf.open(zinfo, 'w') as member:
+                while True:
+                    data = source.read(ZIP_CHUNK_SIZE)
+                    if not data:
+                        break
+                    member.write(data)
+                    chunk = buffer.drain()
+                    if chunk:
+                        yield chunk
+            yield buffer.drain()
+    yield buffer.drain()